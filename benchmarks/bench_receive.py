@@ -0,0 +1,106 @@
+"""Benchmark: per-datagram DatagramProtocol receive vs. batch draining with recvfrom_into
+vs. a receive thread handing decoded batches to the loop.
+
+Bursts of datagrams (valid HDL frames mixed with junk) are sent over localhost
+to a NetworkInterface in each receive mode, and the time until all valid
+telegrams are delivered is measured together with the number of loop wakeups
+(socket readiness events, or hand-offs from the receive thread).
+
+Run from the repository root:
+
+    python benchmarks/bench_receive.py
+"""
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "buspro"))
+
+from pybuspro.telegram import SceneControlData, ReadStatusOfChannelsResponseData  # noqa: E402
+from pybuspro.transport.network_interface import NetworkInterface  # noqa: E402
+from pybuspro.transport.udp_client import RECEIVE_MODE_PROTOCOL, RECEIVE_MODE_BATCH, RECEIVE_MODE_THREAD  # noqa: E402
+
+
+def build_frames():
+    builder = NetworkInterface(("127.0.0.1", 9), ("127.0.0.1", 0), None)
+    scene = SceneControlData((1, 2))
+    scene._area_number = 1
+    scene._scene_number = 2
+    channels = ReadStatusOfChannelsResponseData((1, 3))
+    channels.payload = [12] + list(range(12))
+    return [bytes(builder._build_send_buffer(scene)), bytes(builder._build_send_buffer(channels))]
+
+
+async def run(mode, frames, junk, bursts, burst_size):
+    loop = asyncio.get_running_loop()
+    received = 0
+    done = None
+    expected = 0
+
+    def telegram_received(telegram):
+        nonlocal received
+        received += 1
+        if received >= expected and done and not done.done():
+            done.set_result(None)
+
+    net = NetworkInterface(("127.0.0.1", 9), ("127.0.0.1", 0), telegram_received, loop, receive_mode=mode)
+    await net.start()
+    transport = net._client._transport
+    address = transport.get_extra_info("sockname")
+    sock = transport.get_extra_info("socket")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+
+    # 统计事件循环为这个socket被唤醒了多少次
+    wakeups = 0
+    selector = loop._selector
+    original_select = selector.select
+
+    def counting_select(timeout=None):
+        nonlocal wakeups
+        events = original_select(timeout)
+        wakeups += sum(1 for key, _ in events if key.fileobj == sock.fileno() or key.fileobj is sock)
+        return events
+    selector.select = counting_select
+
+    if mode == RECEIVE_MODE_THREAD:
+        # 接收线程不经过selector, 统计交给事件循环的批次数
+        deliver = net._handle_received_telegrams
+
+        def counting_deliver(telegrams):
+            nonlocal wakeups
+            wakeups += 1
+            deliver(telegrams)
+        transport._deliver = counting_deliver
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    burst = [frames[i % len(frames)] if i % (junk + 1) == 0 else b"\x00" * 60 for i in range(burst_size)]
+    valid_per_burst = sum(1 for data in burst if data in frames)
+
+    started = time.perf_counter()
+    for _ in range(bursts):
+        expected += valid_per_burst
+        done = loop.create_future()
+        for data in burst:
+            sender.sendto(data, address)
+        await asyncio.wait_for(done, 5)
+    elapsed = time.perf_counter() - started
+
+    selector.select = original_select
+    sender.close()
+    await net.stop()
+    return elapsed, received, bursts * burst_size, wakeups
+
+
+def main(bursts=200, burst_size=100, junk=1):
+    frames = build_frames()
+    print(f"{bursts} bursts of {burst_size} datagrams, {junk} junk datagram(s) per valid frame")
+    print(f"{'mode':>9} {'total (ms)':>11} {'us/datagram':>12} {'telegrams':>10} {'wakeups':>8}")
+    for mode in (RECEIVE_MODE_PROTOCOL, RECEIVE_MODE_BATCH, RECEIVE_MODE_THREAD):
+        elapsed, received, sent, wakeups = asyncio.run(run(mode, frames, junk, bursts, burst_size))
+        print(f"{mode:>9} {elapsed * 1e3:>11.1f} {elapsed / sent * 1e6:>12.2f} {received:>10} {wakeups:>8}")
+
+
+if __name__ == "__main__":
+    main()
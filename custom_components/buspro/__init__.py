@@ -19,6 +19,9 @@ from .pybuspro.buspro import Buspro
 from .pybuspro.devices.scene import Scene
 from .pybuspro.devices.generic import Generic
 from .pybuspro.devices.universal_switch import UniversalSwitch
+from .pybuspro.helpers.device_pool import DevicePool
+from .pybuspro.enums import OperateCode, OnOff
+from .pybuspro.sidecar import SidecarConfig, SidecarClient, SidecarDevice, start_sidecar_process
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,6 +29,37 @@ DOMAIN = "buspro"
 DATA_BUSPRO = "buspro"
 
 DEFAULT_CONF_NAME = ""
+DEFAULT_CONF_RELIABLE_SEND = False
+DEFAULT_CONF_RETRY_COUNT = 3
+DEFAULT_CONF_TX_BYTES_PER_SECOND = 700
+# 0表示不限制每个模块同时等待应答的请求数
+DEFAULT_CONF_SEND_WINDOW = 0
+DEFAULT_CONF_DEVICE_POOL_SIZE = 64
+DEFAULT_CONF_CONNECT_GATEWAY = False
+DEFAULT_CONF_BPF_FILTER = False
+DEFAULT_CONF_RECEIVE_MODE = "protocol"
+DEFAULT_CONF_STATE_UPDATER = False
+DEFAULT_CONF_UNIVERSAL_SWITCH_BULK_READ = False
+DEFAULT_CONF_SIDECAR = False
+DEFAULT_CONF_SIDECAR_PORT = 6500
+# 等待sidecar进程创建状态表的时间(秒)
+SIDECAR_START_TIMEOUT = 30
+
+CONF_RELIABLE_SEND = "reliable_send"
+CONF_RETRY_COUNT = "retry_count"
+CONF_TX_BYTES_PER_SECOND = "tx_bytes_per_second"
+CONF_TX_TELEGRAMS_PER_SECOND = "tx_telegrams_per_second"
+CONF_SEND_WINDOW = "send_window"
+CONF_DEVICE_POOL_SIZE = "device_pool_size"
+CONF_CONNECT_GATEWAY = "connect_gateway"
+CONF_BPF_FILTER = "bpf_filter"
+CONF_BPF_SUBNETS = "bpf_subnets"
+CONF_RECEIVE_MODE = "receive_mode"
+CONF_STATE_UPDATER = "state_updater"
+CONF_UNIVERSAL_SWITCH_BULK_READ = "universal_switch_bulk_read"
+# 在单独的进程中运行pybuspro, 端口是sidecar接收命令的本机端口, 下一个端口接收状态变化通知
+CONF_SIDECAR = "sidecar"
+CONF_SIDECAR_PORT = "sidecar_port"
 
 SERVICE_BUSPRO_SEND_MESSAGE = "send_message"
 SERVICE_BUSPRO_ACTIVATE_SCENE = "activate_scene"
@@ -66,7 +100,21 @@ CONFIG_SCHEMA = vol.Schema({
     DOMAIN: vol.Schema({
         vol.Required(CONF_HOST): cv.string,
         vol.Required(CONF_PORT): cv.port,
-        vol.Optional(CONF_NAME, default=DEFAULT_CONF_NAME): cv.string
+        vol.Optional(CONF_NAME, default=DEFAULT_CONF_NAME): cv.string,
+        vol.Optional(CONF_RELIABLE_SEND, default=DEFAULT_CONF_RELIABLE_SEND): cv.boolean,
+        vol.Optional(CONF_RETRY_COUNT, default=DEFAULT_CONF_RETRY_COUNT): cv.positive_int,
+        vol.Optional(CONF_TX_BYTES_PER_SECOND, default=DEFAULT_CONF_TX_BYTES_PER_SECOND): cv.positive_int,
+        vol.Optional(CONF_TX_TELEGRAMS_PER_SECOND): cv.positive_int,
+        vol.Optional(CONF_SEND_WINDOW, default=DEFAULT_CONF_SEND_WINDOW): cv.positive_int,
+        vol.Optional(CONF_DEVICE_POOL_SIZE, default=DEFAULT_CONF_DEVICE_POOL_SIZE): cv.positive_int,
+        vol.Optional(CONF_CONNECT_GATEWAY, default=DEFAULT_CONF_CONNECT_GATEWAY): cv.boolean,
+        vol.Optional(CONF_BPF_FILTER, default=DEFAULT_CONF_BPF_FILTER): cv.boolean,
+        vol.Optional(CONF_BPF_SUBNETS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_RECEIVE_MODE, default=DEFAULT_CONF_RECEIVE_MODE): vol.In(["protocol", "batch", "thread"]),
+        vol.Optional(CONF_STATE_UPDATER, default=DEFAULT_CONF_STATE_UPDATER): cv.boolean,
+        vol.Optional(CONF_UNIVERSAL_SWITCH_BULK_READ, default=DEFAULT_CONF_UNIVERSAL_SWITCH_BULK_READ): cv.boolean,
+        vol.Optional(CONF_SIDECAR, default=DEFAULT_CONF_SIDECAR): cv.boolean,
+        vol.Optional(CONF_SIDECAR_PORT, default=DEFAULT_CONF_SIDECAR_PORT): cv.port,
     })
 }, extra=vol.ALLOW_EXTRA)
 
@@ -83,7 +131,22 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     return await _init_buspro(hass, config_entry.data)
 
 async def _init_buspro(hass:HomeAssistant, config: dict) -> bool:
-    buspro_module = BusproModule(hass, config[CONF_HOST], config[CONF_PORT])
+    buspro_module = BusproModule(hass, config[CONF_HOST], config[CONF_PORT],
+                                 reliable_send=config.get(CONF_RELIABLE_SEND, DEFAULT_CONF_RELIABLE_SEND),
+                                 retry_count=config.get(CONF_RETRY_COUNT, DEFAULT_CONF_RETRY_COUNT),
+                                 tx_bytes_per_second=config.get(CONF_TX_BYTES_PER_SECOND, DEFAULT_CONF_TX_BYTES_PER_SECOND),
+                                 tx_telegrams_per_second=config.get(CONF_TX_TELEGRAMS_PER_SECOND),
+                                 send_window=config.get(CONF_SEND_WINDOW, DEFAULT_CONF_SEND_WINDOW),
+                                 device_pool_size=config.get(CONF_DEVICE_POOL_SIZE, DEFAULT_CONF_DEVICE_POOL_SIZE),
+                                 connect_gateway=config.get(CONF_CONNECT_GATEWAY, DEFAULT_CONF_CONNECT_GATEWAY),
+                                 bpf_filter=config.get(CONF_BPF_FILTER, DEFAULT_CONF_BPF_FILTER),
+                                 bpf_subnets=config.get(CONF_BPF_SUBNETS),
+                                 receive_mode=config.get(CONF_RECEIVE_MODE, DEFAULT_CONF_RECEIVE_MODE),
+                                 state_updater=config.get(CONF_STATE_UPDATER, DEFAULT_CONF_STATE_UPDATER),
+                                 universal_switch_bulk_read=config.get(CONF_UNIVERSAL_SWITCH_BULK_READ,
+                                                                       DEFAULT_CONF_UNIVERSAL_SWITCH_BULK_READ),
+                                 sidecar=config.get(CONF_SIDECAR, DEFAULT_CONF_SIDECAR),
+                                 sidecar_port=config.get(CONF_SIDECAR_PORT, DEFAULT_CONF_SIDECAR_PORT))
     hass.data[DATA_BUSPRO] = buspro_module
     _LOGGER.info("Inited the buspro module and try to start service ...")
     await buspro_module.start()
@@ -95,31 +158,85 @@ async def _init_buspro(hass:HomeAssistant, config: dict) -> bool:
 class BusproModule:
     """Representation of Buspro Object."""
 
-    def __init__(self, hass:HomeAssistant, host:str, port:int):
+    def __init__(self, hass:HomeAssistant, host:str, port:int, reliable_send:bool=False, retry_count:int=3,
+                 tx_bytes_per_second:int=700, tx_telegrams_per_second:int=None, send_window:int=0,
+                 device_pool_size:int=64, connect_gateway:bool=False, bpf_filter:bool=False,
+                 bpf_subnets:typing.List[str]=None, receive_mode:str="protocol", state_updater:bool=False,
+                 universal_switch_bulk_read:bool=False, sidecar:bool=False, sidecar_port:int=6500):
         """Initialize of Buspro module."""
         self.hass:HomeAssistant = hass
         self.gateway_address:typing.Tuple[str,int] = (host, port)
         self.local_address:typing.Tuple[str,int] = ('', port)
 
         self.connected:bool = False
-        # Initialize of Buspro object.
-        self.hdl:Buspro = Buspro(self.gateway_address, self.local_address, self.hass.loop)
+        buspro_options = dict(reliable_send=reliable_send, retry_count=retry_count,
+                              tx_bytes_per_second=tx_bytes_per_second, tx_telegrams_per_second=tx_telegrams_per_second,
+                              send_window=send_window, connect_gateway=connect_gateway,
+                              bpf_filter=bpf_filter, bpf_subnets=bpf_subnets, receive_mode=receive_mode,
+                              universal_switch_bulk_read=universal_switch_bulk_read)
+        # 定时轮询状态过期的设备, 纠正丢失的状态报文
+        self._state_updater:bool = state_updater
+        self.hdl:Buspro = None
+        self.sidecar_client:SidecarClient = None
+        self._sidecar_config:SidecarConfig = None
+        self._sidecar_process = None
+        if sidecar:
+            # 收发、解码和轮询都在sidecar进程中, 设备通过sidecar_device创建
+            command_address = ("127.0.0.1", sidecar_port)
+            notify_address = ("127.0.0.1", sidecar_port + 1)
+            table_name = f"buspro_{sidecar_port}"
+            self._sidecar_config = SidecarConfig(self.gateway_address, self.local_address, table_name,
+                                                 notify_address, command_address, buspro_options=buspro_options,
+                                                 state_updater=state_updater)
+            self.sidecar_client = SidecarClient(table_name, notify_address, command_address, self.hass.loop)
+        else:
+            # Initialize of Buspro object.
+            self.hdl = Buspro(self.gateway_address, self.local_address, self.hass.loop, **buspro_options)
+        # 服务调用复用的设备实例, 被淘汰的设备会注销报文处理
+        self._device_pool = DevicePool(device_pool_size)
+
+    @property
+    def sidecar(self) -> bool:
+        return self.sidecar_client is not None
+
+    def sidecar_device(self, kind:str, device_address, channel:int=0, options:dict=None) -> SidecarDevice:
+        """Create a proxy of the device running in the sidecar."""
+        return SidecarDevice(self.sidecar_client, kind, device_address, channel, options)
 
     async def start(self):
         """Start Buspro object. Connect to tunneling device."""
-        await self.hdl.start(state_updater=False)
+        if self.sidecar:
+            self._sidecar_process = await self.hass.async_add_executor_job(start_sidecar_process, self._sidecar_config)
+            try:
+                await self.sidecar_client.start(timeout=SIDECAR_START_TIMEOUT)
+            except (OSError, ValueError):
+                # sidecar没有在规定时间内创建状态表
+                self._sidecar_process.terminate()
+                raise
+        else:
+            await self.hdl.start(state_updater=self._state_updater)
         self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self.stop)
         self.connected = True
 
     async def stop(self, event):
         """Stop Buspro object. Disconnect from tunneling device."""
-        await self.hdl.stop()
+        self._device_pool.close()
+        if self.sidecar:
+            await self.sidecar_client.stop()
+            # sidecar收到SIGTERM后停止并删除状态表
+            self._sidecar_process.terminate()
+            await self.hass.async_add_executor_job(self._sidecar_process.join)
+        else:
+            await self.hdl.stop()
         self.connected = False
 
     async def service_activate_scene(self, call):
         _LOGGER.debug(f"Activate scene service called with data {call.data}")
         attr_address = call.data.get(SERVICE_BUSPRO_ATTR_ADDRESS)
         attr_scene_address = call.data.get(SERVICE_BUSPRO_ATTR_SCENE_ADDRESS)
+        if self.sidecar:
+            self.sidecar_client.send_telegram(attr_address, OperateCode.SceneControl.value, attr_scene_address)
+            return
         scene = Scene(self.hdl, attr_address, attr_scene_address)
         await scene.run()
 
@@ -128,6 +245,9 @@ class BusproModule:
         attr_address = call.data.get(SERVICE_BUSPRO_ATTR_ADDRESS)
         attr_payload = call.data.get(SERVICE_BUSPRO_ATTR_PAYLOAD)
         attr_operate_code = call.data.get(SERVICE_BUSPRO_ATTR_OPERATE_CODE)
+        if self.sidecar:
+            self.sidecar_client.send_telegram(attr_address, attr_operate_code, attr_payload)
+            return
         generic = Generic(self.hdl, attr_address, attr_payload, attr_operate_code)
         await generic.run()
 
@@ -135,9 +255,18 @@ class BusproModule:
         _LOGGER.debug(f"Universal switch service called with data {call.data}")
         attr_address = call.data.get(SERVICE_BUSPRO_ATTR_ADDRESS)
         attr_switch_number = call.data.get(SERVICE_BUSPRO_ATTR_SWITCH_NUMBER)
-        universal_switch = UniversalSwitch(self.hdl, attr_address, attr_switch_number)
-
         status = call.data.get(SERVICE_BUSPRO_ATTR_STATUS)
+        if self.sidecar:
+            # 跟UniversalSwitch.set_on/set_off发送的报文一样
+            switch_status = OnOff.ON if status == 1 else OnOff.OFF
+            self.sidecar_client.send_telegram(attr_address, OperateCode.UniversalSwitchControl.value,
+                                              [attr_switch_number, switch_status.value])
+            return
+        # 开关会注册报文处理, 同一个开关复用一个实例; 服务调用的开关不读取也不轮询状态
+        key = ("universal_switch", tuple(attr_address), attr_switch_number)
+        universal_switch = self._device_pool.get(
+            key, lambda: UniversalSwitch(self.hdl, attr_address, attr_switch_number, poll=False))
+
         if status == 1:
             await universal_switch.set_on()
         else:
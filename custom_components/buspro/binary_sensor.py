@@ -31,6 +31,23 @@ CONF_UNIVERSAL_SWITCH = 'universal_switch'
 CONF_SINGLE_CHANNEL = 'single_channel'
 CONF_DRY_CONTACT = 'dry_contact'
 
+# 按编号登记的传感器类型 -> sidecar中的设备类型
+SIDECAR_NUMBERED_KINDS = {
+    CONF_UNIVERSAL_SWITCH: "sensor_universal_switch",
+    CONF_SINGLE_CHANNEL: "sensor_channel",
+    CONF_DRY_CONTACT: "sensor_dry_contact",
+}
+
+# 传感器类型 -> 设备上对应的属性名, 按编号保存的状态是"属性名.编号"
+SENSOR_FIELDS = {
+    CONF_MOTION: ("_motion_sensor", "_sonic"),
+    CONF_DRY_CONTACT_1: ("_dry_contact_1_status",),
+    CONF_DRY_CONTACT_2: ("_dry_contact_2_status",),
+    CONF_UNIVERSAL_SWITCH: ("_universal_switch_status",),
+    CONF_SINGLE_CHANNEL: ("_channel_status",),
+    CONF_DRY_CONTACT: ("_switch_status",),
+}
+
 SENSOR_TYPES = {
     CONF_MOTION,
     CONF_DRY_CONTACT_1,
@@ -55,7 +72,7 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
 
 async def async_setup_platform(hass, config, async_add_entites, discovery_info=None):
     """Set up Buspro binary sensor devices."""
-    sync_add_entites([BusproBinarySensor(hass, device_config) for device_config in config[CONF_DEVICES]])
+    async_add_entites([BusproBinarySensor(hass, device_config) for device_config in config[CONF_DEVICES]])
 
 class BusproBinarySensor(BinarySensorEntity):
     """Representation of a Buspro switch."""
@@ -69,20 +86,41 @@ class BusproBinarySensor(BinarySensorEntity):
 
         _addrs = self._address.split('.')
         device_address = (int(_addrs[0]), int(_addrs[1]))
-        universal_switch_number = int(_addrs[2]) if self._sensor_type == CONF_UNIVERSAL_SWITCH else None
-        channel_number = int(_addrs[2]) if self._sensor_type == CONF_SINGLE_CHANNEL else None
-        switch_number = int(_addrs[2]) if self._sensor_type == CONF_DRY_CONTACT else None
+        self._number:int = int(_addrs[2]) if len(_addrs) > 2 else None
         _LOGGER.debug(f"Creating sensor for {self._name} ...")   
-        self._device:Sensor = Sensor(self._hass.data[DATA_BUSPRO].hdl, device_address, universal_switch_number, channel_number, None, switch_number)
+        module = self._hass.data[DATA_BUSPRO]
+        # sidecar中按编号的传感器是单独的设备类型, 状态是is_on
+        self._sidecar_numbered:bool = module.sidecar and self._sensor_type in SIDECAR_NUMBERED_KINDS
+        if module.sidecar:
+            kind = SIDECAR_NUMBERED_KINDS.get(self._sensor_type, "sensor")
+            self._device = module.sidecar_device(kind, device_address, self._number if self._sidecar_numbered else 0)
+        else:
+            # 同一地址的实体共用一个设备, 只登记自己需要的数据
+            self._device:Sensor = Sensor.shared(module.hdl, device_address)
+            if self._sensor_type == CONF_UNIVERSAL_SWITCH:
+                self._device.bind_universal_switch(self._number)
+            elif self._sensor_type == CONF_SINGLE_CHANNEL:
+                self._device.bind_channel(self._number)
+            elif self._sensor_type == CONF_DRY_CONTACT:
+                self._device.bind_dry_contact(self._number)
+            else:
+                self._device.bind_sensor()
+        fields = SENSOR_FIELDS[self._sensor_type]
+        if self._sensor_type in (CONF_UNIVERSAL_SWITCH, CONF_SINGLE_CHANNEL, CONF_DRY_CONTACT):
+            fields = tuple(f"{field}.{self._number}" for field in fields)
+        self._fields = frozenset(fields)
 
         self.async_register_callbacks()
 
     @callback
     def async_register_callbacks(self):
         """Register callbacks to update hass after device was changed."""
-        async def after_update_callback(device):
+        async def after_update_callback(device, changed_fields=None):
             """Call after device was updated."""
-            await self.async_write_ha_state()
+            # 同一个设备上其它实体的数据变化时不需要更新
+            if changed_fields and self._fields.isdisjoint(changed_fields):
+                return
+            self.async_write_ha_state()
 
         self._device.register_device_updated_cb(after_update_callback)
 
@@ -118,17 +156,19 @@ class BusproBinarySensor(BinarySensorEntity):
     @property
     def is_on(self):
         """Return true if the binary sensor is on."""
-        if self._sensor_type == CONF_MOTION:
+        if self._sidecar_numbered:
+            return self._device.is_on
+        elif self._sensor_type == CONF_MOTION:
             return self._device.movement
         elif self._sensor_type == CONF_DRY_CONTACT_1:
             return self._device.dry_contact_1_is_on
         elif self._sensor_type == CONF_DRY_CONTACT_2:
             return self._device.dry_contact_2_is_on
         elif self._sensor_type == CONF_UNIVERSAL_SWITCH:
-            return self._device.universal_switch_is_on
+            return self._device.is_universal_switch_on(self._number)
         elif self._sensor_type == CONF_SINGLE_CHANNEL:
-            return self._device.single_channel_is_on
+            return self._device.is_channel_on(self._number)
         elif self._sensor_type == CONF_DRY_CONTACT:
-            return self._device.switch_status
+            return self._device.is_dry_contact_on(self._number)
         else:
             return None
@@ -55,10 +55,14 @@ class BusproClimate(ClimateEntity):
         self._type = device_config['type']
 
         device_address, number = parse_device_address(key)
-        if self._type==AIRCONDITION:
-            self._device:AirCondition = AirCondition(self._hass.data[DATA_BUSPRO].hdl, device_address, number)
+        module = self._hass.data[DATA_BUSPRO]
+        if module.sidecar and self._type in (AIRCONDITION, FLOORHEATING):
+            kind = "air_condition" if self._type == AIRCONDITION else "floor_heating"
+            self._device = module.sidecar_device(kind, device_address, number)
+        elif self._type==AIRCONDITION:
+            self._device:AirCondition = AirCondition(module.hdl, device_address, number)
         elif self._type==FLOORHEATING:
-            self._device:FloorHeating = FloorHeating(self._hass.data[DATA_BUSPRO].hdl, device_address, number)
+            self._device:FloorHeating = FloorHeating(module.hdl, device_address, number)
         else:
             _LOGGER.error(f"Not supported the climate device type: {self._type}.")
 
@@ -67,7 +71,7 @@ class BusproClimate(ClimateEntity):
     @callback
     def async_register_callbacks(self):
         """Register callbacks to update hass after device was changed."""
-        async def after_update_callback(device):
+        async def after_update_callback(device, changed_fields=None):
             """Call after device was updated."""
             await self.async_update_ha_state()
 
@@ -110,10 +114,12 @@ class BusproClimate(ClimateEntity):
     @property
     def temperature_unit(self):
         """Return the unit of measurement."""
-        if self._device.unit_of_measurement:
-            return TEMPERATURE_TYPE_TRANSLATE[self._device.unit_of_measurement.value]
+        # 还没有收到状态时为None
+        unit = self._device.unit_of_measurement
+        if unit is not None:
+            return TEMPERATURE_TYPE_TRANSLATE[unit.value]
         else:
-            _LOGGER.error(f"Not supported the temperature type: {self._device._temperature_type}, return Celsius default.")
+            _LOGGER.debug(f"Unknown temperature type of {self._name}, return Celsius default.")
             return UnitOfTemperature.CELSIUS
 
     @property
@@ -146,7 +152,8 @@ class BusproClimate(ClimateEntity):
         """Return the current preset mode, e.g., home, away, temp.
         """
         if self._type == FLOORHEATING:
-            return self._device.preset_mode.name
+            mode = self._device.preset_mode
+            return mode.name if mode is not None else None
 
     @property
     def preset_modes(self) -> Optional[List[str]]:
@@ -193,10 +200,11 @@ class BusproClimate(ClimateEntity):
     def hvac_mode(self) -> Optional[str]:
         """Return current operation ie. heat, cool, idle."""
         if self._device.is_on:
-            if self._device.mode:
-                return MODE_TRANSLATE[self._device.mode.value]
+            mode = self._device.mode
+            if mode is not None:
+                return MODE_TRANSLATE[mode.value]
             else:
-                _LOGGER.error(f"Not supported the hvac mode: {self._device._mode}, return Auto default.")
+                _LOGGER.debug(f"Unknown hvac mode of {self._name}, return Auto default.")
                 return HVACMode.AUTO
         else:
             return HVACMode.OFF
@@ -231,10 +239,11 @@ class BusproClimate(ClimateEntity):
         Requires ClimateEntityFeature.FAN_MODE.
         """
         if self._type == AIRCONDITION:
-            if self._device.fan_mode:
-                return FAN_MODE_TRANSLATE[self._device.fan_mode.value]
+            fan_mode = self._device.fan_mode
+            if fan_mode is not None:
+                return FAN_MODE_TRANSLATE[fan_mode.value]
             else:
-                _LOGGER.error(f"Unrecognized fan mode: {self._device._fan}")
+                _LOGGER.debug(f"Unknown fan mode of {self._name}")
 
     @property
     def fan_modes(self) -> list[str] | None:
@@ -55,18 +55,22 @@ class BusproLight(LightEntity):
         self._device_id = key
 
         # 创建light设备
-        buspro = hass.data[DATA_BUSPRO].hdl
+        module = hass.data[DATA_BUSPRO]
         device_address, channel_num = parse_device_address(key)
         device_running_time = int(device_config["running_time"])
         dimmable = bool(device_config["dimmable"])
-        self._device:Light = Light(buspro, device_address, channel_num, dimmable, device_running_time)
+        if module.sidecar:
+            self._device = module.sidecar_device("light", device_address, channel_num,
+                                                 {"is_dimmable": dimmable, "running_time": device_running_time})
+        else:
+            self._device:Light = Light(module.hdl, device_address, channel_num, dimmable, device_running_time)
 
         self.async_register_callbacks()
 
     @callback
     def async_register_callbacks(self):
         """Register callbacks to update hass after device was changed."""
-        async def after_update_callback(device):
+        async def after_update_callback(device, changed_fields=None):
             """Call after device was updated."""
             await self.async_update_ha_state()
 
@@ -90,6 +94,9 @@ class BusproLight(LightEntity):
     @property
     def brightness(self):
         """Return the brightness of the light."""
+        # sidecar中的设备在收到第一次状态之前没有值
+        if self._device.current_brightness is None:
+            return None
         brightness = self._device.current_brightness / 100 * 255
         return brightness
 
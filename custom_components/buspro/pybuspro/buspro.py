@@ -2,13 +2,27 @@
 
 import asyncio
 import logging
+import random
+import weakref
 
 from .enums import *
 from .transport.network_interface import NetworkInterface
+from .transport.tx_scheduler import DEFAULT_TELEGRAMS_PER_SECOND, DEFAULT_BYTES_PER_SECOND
+from .transport.udp_client import RECEIVE_MODE_PROTOCOL
+from .helpers.send_window import SendWindows
 
 
 logger = logging.getLogger("buspro.log")
 
+# 请求等待应答的默认超时时间(秒)
+REQUEST_TIMEOUT = 2
+READ_TIMEOUT = 2
+# 可靠发送: 第一次等待应答的时间(秒), 之后每次重发加倍, 并加上最多这个比例的随机抖动
+RETRY_TIMEOUT = 0.5
+RETRY_JITTER = 0.25
+# 每个目标模块最多同时有几个请求在等待应答, None表示不限制(没有应答的请求不会挡住之后的命令)
+DEFAULT_SEND_WINDOW = None
+
 class StateUpdater:
     def __init__(self, buspro, sleep=10):
         self.buspro = buspro
@@ -19,17 +33,30 @@ class StateUpdater:
     async def start(self):
         self.run_task = self.buspro.loop.create_task(self.run())
 
+    def stop(self):
+        if self.run_task:
+            self.run_task.cancel()
+            self.run_task = None
+
     async def run(self):
         await asyncio.sleep(0)
         logger.info("Starting StateUpdater with {} seconds interval".format(self.sleep))
 
+        # 设备创建后会自己读取一次状态, 第一次轮询等一个间隔
+        await asyncio.sleep(self.sleep)
         while True:
-            await asyncio.sleep(self.sleep)
-            await self.buspro.sync()
+            # sync把轮询分散在这个间隔内, 已经用掉的时间不用再等, 每个间隔只轮询一次
+            started = self.buspro.loop.time()
+            await self.buspro.sync(self.sleep)
+            await asyncio.sleep(max(0, self.sleep - (self.buspro.loop.time() - started)))
 
 
 class Buspro:
-    def __init__(self, gateway_address, local_address, loop_=None):
+    def __init__(self, gateway_address, local_address, loop_=None, device_updated_window=0,
+                 reliable_send=False, retry_count=3, retry_timeout=RETRY_TIMEOUT,
+                 tx_telegrams_per_second=DEFAULT_TELEGRAMS_PER_SECOND, tx_bytes_per_second=DEFAULT_BYTES_PER_SECOND,
+                 send_window=DEFAULT_SEND_WINDOW, connect_gateway=False, bpf_filter=False, bpf_subnets=None,
+                 receive_mode=RECEIVE_MODE_PROTOCOL, universal_switch_bulk_read=False):
         self.loop = loop_ or asyncio.get_event_loop()
         self._gateway_address = gateway_address
         self._local_address = local_address
@@ -38,7 +65,36 @@ class Buspro:
         self._started = False
         self._net = None
         self._all_received_telegram_callback = None
-        self._device_received_telegram_callbacks = []        
+        # 设备地址 -> 操作码(None表示所有操作码) -> {(callback, postfix): (callback, postfix)}
+        self._device_received_telegram_callbacks = {}
+        # 设备更新通知合并: 同一轮事件循环(或device_updated_window秒)内每个设备只通知一次
+        self._device_updated_window = device_updated_window
+        self._pending_device_updates = {}
+        self._device_updates_handle = None
+        # 等待应答的请求: (目标地址, 应答操作码, KEY_FIELDS的值) -> [future, ...]
+        self._pending_requests = {}
+        # 可靠发送: 控制命令没有收到应答时按指数退避重发, 最多重发retry_count次
+        self._reliable_send = reliable_send
+        self._retry_count = retry_count
+        self._retry_timeout = retry_timeout
+        # 发往总线的速度限制, None表示不限制
+        self._tx_telegrams_per_second = tx_telegrams_per_second
+        self._tx_bytes_per_second = tx_bytes_per_second
+        # 发往同一模块的请求按顺序发送, 收到应答(或超时)后才发送下一个; 不同模块之间并行. 0或None表示不限制
+        self._send_windows = SendWindows(send_window, self.loop) if send_window else None
+        # UDP socket是否connect到网关
+        self._connect_gateway = connect_gateway
+        # Linux上用BPF过滤器在内核里丢掉不是HDL报文的数据, bpf_subnets限制来源网段
+        self._bpf_filter = bpf_filter
+        self._bpf_subnets = bpf_subnets
+        # 接收方式: "protocol"每个报文回调一次, "batch"每次唤醒整批读取, "thread"在单独的线程中接收和解码
+        self._receive_mode = receive_mode
+        # 用一个(没有文档的)空payload报文读取模块上所有通用开关的状态, 模块不回答时逐个读取
+        self._universal_switch_bulk_read = universal_switch_bulk_read
+        # 需要定时轮询状态的设备, 设备被删除后自动移除
+        self._poll_devices = weakref.WeakSet()
+        # 同一模块上的设备共享的对象(如UniversalSwitchGroup), 没有设备使用后自动移除
+        self._shared_objects = weakref.WeakValueDictionary()
 
     def __del__(self):
         if self._started:
@@ -50,7 +106,12 @@ class Buspro:
 
     # noinspection PyUnusedLocal
     async def start(self, state_updater=False):  # , daemon_mode=False):
-        self._net = NetworkInterface(self._gateway_address, self._local_address, self._handle_received_telegram, self.loop)
+        self._net = NetworkInterface(self._gateway_address, self._local_address, self._handle_received_telegram, self.loop,
+                                     telegrams_per_second=self._tx_telegrams_per_second,
+                                     bytes_per_second=self._tx_bytes_per_second,
+                                     connect_gateway=self._connect_gateway,
+                                     bpf_filter=self._bpf_filter, bpf_subnets=self._bpf_subnets,
+                                     receive_mode=self._receive_mode)
         await self._net.start()
 
         if state_updater:
@@ -64,54 +125,235 @@ class Buspro:
         self._started = True
 
     async def stop(self):
+        if self._state_updater:
+            self._state_updater.stop()
+            self._state_updater = None
         if self._net:
             await self._net.stop()
             self._net = None
+        if self._device_updates_handle:
+            self._device_updates_handle.cancel()
+            self._device_updates_handle = None
+        self._pending_device_updates = {}
+        for futures in self._pending_requests.values():
+            for future in futures:
+                future.cancel()
+        self._pending_requests = {}
+        if self._send_windows:
+            self._send_windows.cancel()
         self._started = False
     
-    async def send_telegram(self, telegram):
+    async def send_telegram(self, telegram, priority=SendPriority.Normal):
         if self._net:
-            await self._net.send_telegram(telegram)
+            await self._net.send_telegram(telegram, priority)
         else:
             logger.error("Send telegram failed as buspro not connected!")
 
+    def request(self, telegram, timeout=REQUEST_TIMEOUT, coalesce=False, priority=SendPriority.Normal):
+        """ 发送请求, 返回等待应答报文的future, 超时时结果为None
+
+        应答按 (目标地址, 应答操作码 = 请求操作码 + 1, KEY_FIELDS的值) 匹配;
+        coalesce为True时, 已经有相同的请求在等待应答就不再发送, 直接返回那个future;
+        超时从报文真正发送出去(排队结束)后开始计算
+        """
+        response_code = telegram.operate_code.response if telegram.operate_code else None
+        if response_code is None:
+            raise ValueError(f"No response operate code for {telegram.operate_code}")
+
+        key = (tuple(telegram.target_address), response_code, telegram.match_key)
+        futures = self._pending_requests.get(key)
+        if coalesce and futures:
+            logger.debug("Request %s to %s already pending", telegram.operate_code, telegram.target_address)
+            return futures[0]
+
+        future = self.loop.create_future()
+        self._pending_requests.setdefault(key, []).append(future)
+        asyncio.ensure_future(self._send_request(telegram, key, future, timeout, priority), loop=self.loop)
+        return future
+
+    def read_telegram(self, telegram, timeout=READ_TIMEOUT, priority=SendPriority.Background):
+        """ 发送读取请求, 同一目标的相同读取请求在等待应答期间只发送一次 """
+        return self.request(telegram, timeout, coalesce=True, priority=priority)
+
+    async def send_reliable(self, telegram, retry_count=None, priority=SendPriority.Normal):
+        """ 发送报文并等待应答, 超时后按指数退避(加随机抖动)重发
+
+        返回 (应答报文, 重发次数), 重发次数用完仍没有应答时应答报文为None
+        """
+        retry_count = self._retry_count if retry_count is None else retry_count
+        for attempt in range(retry_count + 1):
+            timeout = self._retry_timeout * (2 ** attempt) * (1 + random.uniform(0, RETRY_JITTER))
+            response = await self.request(telegram, timeout, priority=priority)
+            if response is not None:
+                return response, attempt
+            if self._net is None:
+                break
+            logger.debug("No response for %s to %s in %.2fs", telegram.operate_code, telegram.target_address, timeout)
+        return None, attempt
+
+    async def _send_request(self, telegram, key, future, timeout, priority):
+        if self._net is None:
+            logger.error("Send telegram failed as buspro not connected!")
+            self._request_timeout(key, future)
+            return
+        if self._send_windows:
+            # 窗口名额在应答到达或超时后释放
+            target = key[0]
+            await self._send_windows.acquire(target)
+            future.add_done_callback(lambda _: self._send_windows.release(target))
+            if future.done() or self._net is None:
+                self._request_timeout(key, future)
+                return
+        try:
+            await self._net.send_telegram(telegram, priority)
+        except Exception as exp:
+            logger.error("Send request telegram failed: %s", exp)
+            self._request_timeout(key, future)
+            return
+        if not future.done():
+            timeout_handle = self.loop.call_later(timeout, self._request_timeout, key, future)
+            future.add_done_callback(lambda _: timeout_handle.cancel())
+
+    def _request_timeout(self, key, future):
+        futures = self._pending_requests.get(key)
+        if futures and future in futures:
+            futures.remove(future)
+            if not futures:
+                del self._pending_requests[key]
+        if not future.done():
+            future.set_result(None)
+
+    def _resolve_requests(self, telegram):
+        key = (telegram.source_address, telegram.operate_code, telegram.match_key)
+        futures = self._pending_requests.pop(key, None)
+        if futures:
+            for future in futures:
+                if not future.done():
+                    future.set_result(telegram)
+
     def _handle_received_telegram(self, telegram):
         telegram_control = telegram.toControl()
 
         if self._all_received_telegram_callback:
             self._all_received_telegram_callback(telegram_control)
 
-        for telegram_received_cb in self._device_received_telegram_callbacks:
-            device_address = telegram_received_cb['device_address']
+        operate_code = telegram_control.operate_code
+        if operate_code is OperateCode.TIME_IF_FROM_LOGIC_OR_SECURITY:
+            return
+
+        # 只发送给目标地址或源地址上注册的设备
+        target_address = telegram_control.target_address
+        source_address = telegram_control.source_address
+        self._dispatch_telegram(target_address, operate_code, telegram_control)
+        if source_address != target_address:
+            self._dispatch_telegram(source_address, operate_code, telegram_control)
+
+        if self._pending_requests:
+            self._resolve_requests(telegram_control)
+
+    def _dispatch_telegram(self, device_address, operate_code, telegram):
+        callbacks = self._device_received_telegram_callbacks.get(device_address)
+        if not callbacks:
+            return
+
+        entries = list(callbacks.get(None, {}).values())
+        if operate_code is not None and operate_code in callbacks:
+            entries.extend(callbacks[operate_code].values())
 
-            # Sender callback kun for oppgitt kanal
-            if device_address == telegram_control.target_address or device_address == telegram_control.source_address:               
-                if telegram_control.operate_code is not OperateCode.TIME_IF_FROM_LOGIC_OR_SECURITY:
-                    logger.debug(f"Send to device {device_address}")
-                    postfix = telegram_received_cb['postfix']
-                    telegram_received_cb['callback'](telegram_control, postfix)
+        for telegram_received_cb, postfix in entries:
+            logger.debug("Send to device %s", device_address)
+            telegram_received_cb(telegram, postfix)
+
+    def notify_device_updated(self, device, changed_fields=None):
+        pending_fields = self._pending_device_updates.setdefault(device, set())
+        if changed_fields:
+            pending_fields.update(changed_fields)
+        if self._device_updates_handle is None:
+            if self._device_updated_window > 0:
+                self._device_updates_handle = self.loop.call_later(self._device_updated_window, self._flush_device_updates)
+            else:
+                self._device_updates_handle = self.loop.call_soon(self._flush_device_updates)
+
+    def _flush_device_updates(self):
+        self._device_updates_handle = None
+        pending_devices, self._pending_device_updates = self._pending_device_updates, {}
+        for device, changed_fields in pending_devices.items():
+            asyncio.ensure_future(device._device_updated(frozenset(changed_fields)), loop=self.loop)
 
     def register_telegram_received_all_messages_cb(self, telegram_received_cb):
         self._all_received_telegram_callback = telegram_received_cb
 
-    def register_telegram_received_device_cb(self, telegram_received_cb, device_address, postfix=None):
-        self._device_received_telegram_callbacks.append({
-            'callback': telegram_received_cb,
-            'device_address': device_address,
-            'postfix': postfix})
+    def register_telegram_received_device_cb(self, telegram_received_cb, device_address, postfix=None, operate_code=None):
+        """ operate_code不为None时, 只接收这个操作码的报文 """
+        callbacks = self._device_received_telegram_callbacks.setdefault(tuple(device_address), {})
+        callbacks.setdefault(operate_code, {})[(telegram_received_cb, postfix)] = (telegram_received_cb, postfix)
+
+    def unregister_telegram_received_device_cb(self, telegram_received_cb, device_address, postfix=None, operate_code=None):
+        device_address = tuple(device_address)
+        callbacks = self._device_received_telegram_callbacks.get(device_address)
+        if not callbacks or operate_code not in callbacks:
+            return
+
+        entries = callbacks[operate_code]
+        entries.pop((telegram_received_cb, postfix), None)
+        if not entries:
+            del callbacks[operate_code]
+            if not callbacks:
+                del self._device_received_telegram_callbacks[device_address]
+
+    def get_shared_object(self, key, factory):
+        """ 返回key对应的共享对象, 没有时用factory()创建 """
+        shared_object = self._shared_objects.get(key)
+        if shared_object is None:
+            shared_object = factory()
+            self._shared_objects[key] = shared_object
+        return shared_object
+
+    def register_poll_device(self, device):
+        self._poll_devices.add(device)
+
+    def unregister_poll_device(self, device):
+        self._poll_devices.discard(device)
+
+    async def sync(self, interval=0):
+        """ 轮询状态过期的设备, 轮询平均分散在interval秒内
 
-    def unregister_telegram_received_device_cb(self, telegram_received_cb, device_address, postfix=None):
-        self._device_received_telegram_callbacks.remove({
-            'callback': telegram_received_cb,
-            'device_address': device_address,
-            'postfix': postfix})
+        最近收到过应答或广播的设备不会轮询; 每次轮询前再检查一次,
+        这样同一模块上的其它设备的应答(如ReadStatusOfChannels)也会让它跳过
+        """
+        now = self.loop.time()
+        stale_devices = [device for device in self._poll_devices if device.is_stale(now)]
+        if not stale_devices:
+            return
 
-    @staticmethod
-    async def sync():
-        # await self.callback("LOG: Sync() triggered from StateUpdater")
-        # print("LOG: Sync() triggered from StateUpdater")
-        raise NotImplementedError
+        logger.debug("Sync %s stale devices in %s seconds", len(stale_devices), interval)
+        gap = interval / len(stale_devices)
+        for index, device in enumerate(stale_devices):
+            if index and gap:
+                await asyncio.sleep(gap)
+            if not self._started:
+                return
+            if device.is_stale(self.loop.time()):
+                asyncio.ensure_future(device.poll(), loop=self.loop)
 
     @property
     def connected(self):
         return self._started
+
+    @property
+    def reliable_send(self):
+        return self._reliable_send
+
+    @property
+    def universal_switch_bulk_read(self):
+        return self._universal_switch_bulk_read
+
+    @property
+    def tx_statistics(self):
+        """ 发送队列的深度和排队等待时间 """
+        return self._net.scheduler.statistics() if self._net else None
+
+    @property
+    def send_window_statistics(self):
+        """ 发送窗口的占用和排队的请求数, 没有启用发送窗口时为None """
+        return self._send_windows.statistics() if self._send_windows else None
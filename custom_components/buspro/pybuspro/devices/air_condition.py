@@ -1,13 +1,13 @@
 import asyncio
 import logging
-from ..telegram import Telegram, ControlAirConditionResponseData, ReadAirConditionStatusData, ReadAirConditionStatusResponseData, ControlDLPStatusData, ControlDLPStatusResponseData
+from ..telegram import Telegram, ControlAirConditionData, ControlAirConditionResponseData, ReadAirConditionStatusData, ReadAirConditionStatusResponseData, ControlDLPStatusData, ControlDLPStatusResponseData
 from .device import Device
-from ..helpers import copy_class_attrs
-from ..enums import AirConditionMode, FanMode, OnOffStatus, TemperatureType, DLPOperateCode
+from ..enums import AirConditionMode, FanMode, OnOffStatus, TemperatureType, DLPOperateCode, OperateCode
 
 logger = logging.getLogger(__name__)
 
 class AirCondition(Device):
+    POLL_MAX_AGE = 120
     def __init__(self, buspro, device_address, ac_number):
         super().__init__(buspro, device_address)
         self.ac_number = ac_number
@@ -20,54 +20,151 @@ class AirCondition(Device):
         self._status = 0 # 0-OFF, 1-ON
         self._mode = 3 # 0-COOL, 1-Heat, 2-FAN, 3-Auto, 4-Dry
         self._fan = 0 # 0-Auto, 1-High, 2-Medium, 3-Low
+        self._set_temperature = None
+        # async_apply: 同一轮事件循环中的修改合并后用一个ControlAirConditionData发送
+        self._pending_changes = {}
+        self._apply_future = None
 
-        self.register_telegram_received_cb(self._telegram_received_cb)
+        self.register_telegram_handlers({
+            OperateCode.ReadAirConditionStatusResponse: self._air_condition_status_received,
+            OperateCode.ControlAirConditionResponse: self._air_condition_status_received,
+            OperateCode.ControlDLPStatusResponse: self._dlp_status_received,
+        })
         self.call_read_air_condition_status(run_from_init=True)
 
-    def _telegram_received_cb(self, telegram, postfix=None):
-        if isinstance(telegram, ReadAirConditionStatusResponseData):
-            if telegram._ac_number == self.ac_number:
-                logger.debug(f"Air Condition Device received: {telegram}")
-                copy_class_attrs(telegram, self)
-                self.call_device_updated()
-        elif isinstance(telegram, ControlAirConditionResponseData):
-            if telegram._ac_number == self.ac_number:
-                logger.debug(f"Air Condition Device received: {telegram}")
-                copy_class_attrs(telegram, self)
-                self.call_device_updated()
-        elif isinstance(telegram, ControlDLPStatusResponseData):
-            if telegram._number == self.ac_number:
-                logger.debug(f"Air Condition Device received: {telegram}")
-                self._update(telegram._dlp_operate_code, telegram._data)
-                self.call_device_updated()
-        # else:
-        #     logger.debug(f"Not supported message for operate type {telegram}")
+    def _air_condition_status_received(self, telegram, postfix=None):
+        if telegram._ac_number == self.ac_number:
+            logger.debug("Air Condition Device received: %s", telegram)
+            changed = self._copy_fields(telegram)
+            self.call_device_updated(changed)
+
+    def _dlp_status_received(self, telegram, postfix=None):
+        if telegram._number == self.ac_number:
+            logger.debug("Air Condition Device received: %s", telegram)
+            changed = self._update(telegram._dlp_operate_code, telegram._data)
+            self.call_device_updated(changed)
     
+    # DLP操作码 -> 属性名
+    _DLP_FIELDS = {
+        DLPOperateCode.ar_status: "_status",
+        DLPOperateCode.ar_fan_speed: "_fan",
+        DLPOperateCode.ar_mode: "_mode",
+        DLPOperateCode.ar_temperature_auto: "_auto_temperature",
+        DLPOperateCode.ar_temperature_cool: "_cool_temperature",
+        DLPOperateCode.ar_temperature_dry: "_dry_temperature",
+        DLPOperateCode.ar_temperature_heat: "_heat_temperature",
+    }
+
     def _update(self, op_code, data):
-        operate = DLPOperateCode.value_of(op_code)
-        if operate == DLPOperateCode.ar_status:
-            self._status = data
-        elif operate == DLPOperateCode.ar_fan_speed:
-            self._fan = data
-        elif operate == DLPOperateCode.ar_mode:
-            self._mode = data
-        elif operate == DLPOperateCode.ar_temperature_auto:
-            self._auto_temperature = data
-        elif operate == DLPOperateCode.ar_temperature_cool:
-            self._cool_temperature = data
-        elif operate == DLPOperateCode.ar_temperature_dry:
-            self._dry_temperature = data
-        elif operate == DLPOperateCode.ar_temperature_heat:
-            self._heat_temperature = data
-        else:
+        field = self._DLP_FIELDS.get(DLPOperateCode.value_of(op_code))
+        if field is None:
             logger.debug(f"Not supported DLP operate type {op_code}")
+            return set()
+        return self._update_fields({field: data})
 
-    async def async_control_dlp(self, operate, data):
+    async def async_control_dlp(self, operate, data, wait_response=False):
+        """ wait_response为True时等待并返回空调的应答报文, 超时返回None """
         control = ControlDLPStatusData(self._device_address)
         control._dlp_operate_code = operate.value
         control._data = data
         control._number = self.ac_number
-        await self._buspro.send_telegram(control)
+        return await self._send_command(control, wait_response)
+
+    # 模式 -> (温度属性, 设置温度的DLP操作码), Fan模式没有温度
+    _MODE_TEMPERATURES = {
+        AirConditionMode.Cool: ("_cool_temperature", DLPOperateCode.ar_temperature_cool),
+        AirConditionMode.Heat: ("_heat_temperature", DLPOperateCode.ar_temperature_heat),
+        AirConditionMode.Auto: ("_auto_temperature", DLPOperateCode.ar_temperature_auto),
+        AirConditionMode.Dry: ("_dry_temperature", DLPOperateCode.ar_temperature_dry),
+    }
+
+    async def async_apply(self, status:OnOffStatus=None, mode:AirConditionMode=None, fan_mode:FanMode=None, temperature=None):
+        """ 把开关、模式、风速、目标温度的修改合并到一个ControlAirConditionData报文中发送
+
+        同一轮事件循环中多次调用的修改会合并为一个报文; 返回空调的ControlAirConditionResponse, 超时为None.
+        temperature是修改后的模式下的目标温度
+        """
+        changes = self._pending_changes
+        if status is not None:
+            changes["_status"] = status.value
+        if mode is not None:
+            changes["_mode"] = mode.value
+        if fan_mode is not None:
+            changes["_fan"] = fan_mode.value
+        if temperature is not None:
+            changes["temperature"] = temperature
+
+        if self._apply_future is None:
+            self._apply_future = self._buspro.loop.create_future()
+            self._buspro.loop.call_soon(lambda: asyncio.ensure_future(self._flush_changes(), loop=self._buspro.loop))
+        return await asyncio.shield(self._apply_future)
+
+    async def _flush_changes(self):
+        future, self._apply_future = self._apply_future, None
+        changes, self._pending_changes = self._pending_changes, {}
+        try:
+            response = await self._apply_changes(changes)
+        except Exception as exp:
+            future.set_exception(exp)
+            return
+        future.set_result(response)
+
+    # ControlAirConditionData中来自空调状态的字段(_ac_number和有默认值的字段除外), 都知道时才能用它发送
+    _CONTROL_FIELDS = tuple(field.name for field in ControlAirConditionData.SCHEMA
+                            if field.name != "_ac_number" and field.default is None)
+
+    @property
+    def _state_known(self):
+        return all(getattr(self, name) is not None for name in self._CONTROL_FIELDS)
+
+    async def _apply_changes(self, changes):
+        # ControlAirConditionData需要完整的状态, 不知道时先读取一次
+        if not self._state_known:
+            await self._read_status()
+        if not self._state_known:
+            logger.warning(f"Unknown state of air condition {self._device_address}-{self.ac_number}, apply changes by DLP")
+            return await self._apply_changes_by_dlp(changes)
+
+        control = ControlAirConditionData(self._device_address)
+        # 没有修改的字段用当前状态填充, _bit_7等设备上没有的字段用报文的默认值
+        values = {name: getattr(self, name) for name in control.field_names if name in vars(self)}
+        temperature = changes.pop("temperature", None)
+        values.update(changes)
+        mode = AirConditionMode.value_of(values["_mode"])
+        if mode in self._MODE_TEMPERATURES:
+            temperature_field = self._MODE_TEMPERATURES[mode][0]
+            if temperature is not None:
+                values[temperature_field] = temperature
+            values["_set_temperature"] = values[temperature_field]
+        elif temperature is not None:
+            logger.error(f"The air condition mode {mode} is not support for set target temperature!")
+
+        for name, value in values.items():
+            setattr(control, name, value)
+        control._ac_number = self.ac_number
+        return await self._send_command(control, wait_response=True)
+
+    async def _apply_changes_by_dlp(self, changes):
+        status = changes.get("_status")
+        if status == OnOffStatus.OFF.value:
+            return await self.async_control_dlp(DLPOperateCode.ar_status, status, wait_response=True)
+
+        response = None
+        if status is not None:
+            # 等空调确认打开后再设置其它的值
+            response = await self.async_control_dlp(DLPOperateCode.ar_status, status, wait_response=True)
+        if "_mode" in changes:
+            response = await self.async_control_dlp(DLPOperateCode.ar_mode, changes["_mode"], wait_response=True)
+        if "_fan" in changes:
+            response = await self.async_control_dlp(DLPOperateCode.ar_fan_speed, changes["_fan"], wait_response=True)
+        if "temperature" in changes:
+            mode = AirConditionMode.value_of(changes.get("_mode", self._mode))
+            if mode in self._MODE_TEMPERATURES:
+                operate = self._MODE_TEMPERATURES[mode][1]
+                response = await self.async_control_dlp(operate, changes["temperature"], wait_response=True)
+            else:
+                logger.error(f"The air condition mode {mode} is not support for set target temperature!")
+        return response
 
     def call_read_air_condition_status(self, run_from_init=False):      
         asyncio.ensure_future(self._read_air_condition_status(run_from_init), loop=self._buspro.loop)
@@ -75,10 +172,12 @@ class AirCondition(Device):
     async def _read_air_condition_status(self, run_from_init=False):
         if run_from_init:
             await asyncio.sleep(5)
+        await self._read_status()
 
+    async def _read_status(self):
         control = ReadAirConditionStatusData(self._device_address)
         control._ac_number = self.ac_number
-        await self._buspro.send_telegram(control)
+        await self._buspro.read_telegram(control)
 
     @property
     def is_on(self):
@@ -114,34 +213,18 @@ class AirCondition(Device):
             return self._auto_temperature # 从测试看这几个模式下的温度是一样的，所以随便取一个
 
     async def async_turn_on(self):
-        await self.async_control_dlp(DLPOperateCode.ar_status, OnOffStatus.ON.value)
+        await self.async_apply(status=OnOffStatus.ON)
     
     async def async_turn_off(self):
-        await self.async_control_dlp(DLPOperateCode.ar_status, OnOffStatus.OFF.value)
+        await self.async_apply(status=OnOffStatus.OFF)
     
     async def async_set_mode(self, mode:AirConditionMode):
         logger.debug(f"Try to set AC mode: {mode}")
-        if not self.is_on:
-            await self.async_control_dlp(DLPOperateCode.ar_status, OnOffStatus.ON.value)
-            await asyncio.sleep(2)
-        await self.async_control_dlp(DLPOperateCode.ar_mode, mode.value)
+        # 打开和设置模式在同一个报文中, 不需要等待
+        await self.async_apply(status=OnOffStatus.ON, mode=mode)
     
     async def async_set_target_temperature(self, temperature):        
-        if self.mode == AirConditionMode.Cool:
-            operate = DLPOperateCode.ar_temperature_cool
-        elif self.mode == AirConditionMode.Heat:
-            operate = DLPOperateCode.ar_temperature_heat
-        elif self.mode == AirConditionMode.Auto:
-            operate = DLPOperateCode.ar_temperature_auto
-        elif self.mode == AirConditionMode.Dry:
-            operate = DLPOperateCode.ar_temperature_dry
-        else: # 还有一个fan模式
-            logger.error(f"The air condition mode {self.mode} is not support for set target temperature!")
-            return
-     
-        await self.async_control_dlp(operate, temperature)
+        await self.async_apply(temperature=temperature)
     
     async def async_set_fan_mode(self, fan_mode:FanMode):
-        if not self.is_on:
-            await self.async_control_dlp(DLPOperateCode.ar_status, OnOffStatus.ON.value)
-        await self.async_control_dlp(DLPOperateCode.ar_fan_speed, fan_mode.value)
+        await self.async_apply(status=OnOffStatus.ON, fan_mode=fan_mode)
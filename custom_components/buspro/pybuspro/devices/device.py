@@ -1,22 +1,85 @@
-﻿import asyncio
+﻿import logging
+
+from ..helpers import update_attrs, copy_class_attrs
+from ..enums import SendPriority
+
+logger = logging.getLogger(__name__)
 
 
 class Device(object):
+    # 状态超过多少秒没有更新就需要轮询, None表示不轮询
+    POLL_MAX_AGE = None
+
     def __init__(self, buspro, device_address):
         self._device_address = device_address
         self._buspro = buspro
         self._device_updated_cbs = []
+        self._telegram_handlers = {}
+        self._deadbands = {}
+        # 可靠发送的统计: 重发次数和重发后仍没有应答(丢失)的命令数
+        self._send_retries = 0
+        self._send_losses = 0
+        # 最后一次收到状态报文(应答或广播)和最后一次轮询的时间(loop.time())
+        self._last_fresh = None
+        self._last_poll = None
+        if self.POLL_MAX_AGE:
+            self._buspro.register_poll_device(self)
     
     @property
     def is_connected(self):
         return self._buspro.connected
 
+    @property
+    def send_retries(self):
+        return self._send_retries
+
+    @property
+    def send_losses(self):
+        return self._send_losses
+
+    @property
+    def last_fresh(self):
+        return self._last_fresh
+
+    def is_stale(self, now):
+        """The state is older than POLL_MAX_AGE, and no poll was sent within POLL_MAX_AGE either."""
+        if not self.POLL_MAX_AGE:
+            return False
+        last = max(self._last_fresh or 0, self._last_poll or 0)
+        return not last or now - last >= self.POLL_MAX_AGE
+
+    def close(self):
+        """Unregister the telegram handlers and stop polling, the device receives nothing after closed."""
+        self.unregister_telegram_handlers()
+        self._buspro.unregister_poll_device(self)
+        self._device_updated_cbs = []
+
+    async def poll(self):
+        """Read the current state from the module, called by Buspro.sync when the state is stale."""
+        self._last_poll = self._buspro.loop.time()
+        await self._read_status()
+
+    async def _read_status(self):
+        pass
+
     def register_telegram_received_cb(self, telegram_received_cb, postfix=None):
         self._buspro.register_telegram_received_device_cb(telegram_received_cb, self._device_address, postfix)
 
     def unregister_telegram_received_cb(self, telegram_received_cb, postfix=None):
         self._buspro.unregister_telegram_received_device_cb(telegram_received_cb, self._device_address, postfix)
 
+    def register_telegram_handlers(self, handlers):
+        """Register handlers by operate code, only the telegrams with these operate codes are delivered."""
+        for operate_code, handler in handlers.items():
+            self._buspro.register_telegram_received_device_cb(handler, self._device_address, operate_code=operate_code)
+        self._telegram_handlers.update(handlers)
+
+    def unregister_telegram_handlers(self):
+        """Unregister all handlers registered by register_telegram_handlers."""
+        for operate_code, handler in self._telegram_handlers.items():
+            self._buspro.unregister_telegram_received_device_cb(handler, self._device_address, operate_code=operate_code)
+        self._telegram_handlers = {}
+
     def register_device_updated_cb(self, device_updated_cb):
         """Register device updated callback."""
         self._device_updated_cbs.append(device_updated_cb)
@@ -25,10 +88,54 @@ class Device(object):
         """Unregister device updated callback."""
         self._device_updated_cbs.remove(device_updated_cb)
 
-    def call_device_updated(self):
-        asyncio.ensure_future(self._device_updated(), loop=self._buspro.loop)
+    def set_deadband(self, field, delta):
+        """Ignore changes of the field (e.g. '_current_temperature', '_brightness') smaller than delta."""
+        if delta:
+            self._deadbands[field] = delta
+        else:
+            self._deadbands.pop(field, None)
+
+    def _update_fields(self, values, apply_deadband=True, fresh=True):
+        """Update the fields which really changed, return the names of changed fields.
+
+        fresh is False for optimistic updates which are not reported by the module.
+        """
+        if fresh:
+            self._last_fresh = self._buspro.loop.time()
+        return update_attrs(self, values, self._deadbands if apply_deadband else None)
+
+    def _copy_fields(self, telegram):
+        """Copy the telegram fields with the same name, return the names of changed fields."""
+        self._last_fresh = self._buspro.loop.time()
+        return copy_class_attrs(telegram, self, self._deadbands)
+
+    async def _send_command(self, telegram, wait_response=False):
+        """Send a control telegram, return the response telegram if it was waited for.
+
+        With reliable send enabled the telegram is retransmitted until the response arrives,
+        None is returned when all retries are used up.
+        """
+        if self._buspro.reliable_send:
+            response, retries = await self._buspro.send_reliable(telegram, priority=SendPriority.Interactive)
+            self._send_retries += retries
+            if response is None:
+                self._send_losses += 1
+                logger.warning("No response from %s for %s after %s retries", self._device_address, telegram.operate_code, retries)
+            return response
+        # 通过request发送, 同一模块的命令按顺序发送, 不会互相超车
+        response = self._buspro.request(telegram, priority=SendPriority.Interactive)
+        if wait_response:
+            return await response
+        return None
+
+    def call_device_updated(self, changed_fields=None):
+        # 没有字段变化时不通知; changed_fields为None表示不确定哪些字段变化了
+        if changed_fields is not None and not changed_fields:
+            return
+        # 由buspro合并后再通知, 短时间内多次更新只触发一次回调
+        self._buspro.notify_device_updated(self, changed_fields)
     
-    async def _device_updated(self):
+    async def _device_updated(self, changed_fields=frozenset()):
         for device_updated_cb in self._device_updated_cbs:
-            await device_updated_cb(self)
+            await device_updated_cb(self, changed_fields)
 
@@ -1,13 +1,55 @@
 import asyncio
 import logging
-from ..telegram import Telegram, ReadDLPStatusData, ReadDLPStatusResponseData, ControlDLPStatusData, ControlDLPStatusResponseData, ControlFloorHeatingResponseData
+import weakref
+from ..telegram import Telegram, ReadDLPStatusData, ReadDLPStatusResponseData, ControlDLPStatusData, ControlDLPStatusResponseData, ControlFloorHeatingData, ControlFloorHeatingResponseData, ReadFloorHeatingStatusData, ReadFloorHeatingStatusResponseData
 from .device import Device
-from ..enums import AirConditionMode, OnOffStatus, PresetMode, DLPOperateCode, TemperatureType
-from ..helpers import copy_class_attrs
+from ..enums import AirConditionMode, OnOffStatus, PresetMode, DLPOperateCode, TemperatureType, OperateCode
 
 logger = logging.getLogger(__name__)
 
+
+class FloorHeatingZones:
+    """ 同一地址上的所有FloorHeating
+
+    ReadFloorHeatingStatus的应答中没有地暖编号, 只有一个地暖时才能确定是它的状态;
+    有多个地暖时不注册这个应答, 每个地暖用DLP逐项读取。
+    """
+    def __init__(self, buspro, device_address):
+        self._buspro = buspro
+        self._device_address = device_address
+        self._zones = weakref.WeakSet()
+        self._registered = False
+
+    @property
+    def single(self):
+        return len(self._zones) == 1
+
+    def add(self, zone):
+        self._zones.add(zone)
+        self._update_registration()
+
+    def remove(self, zone):
+        self._zones.discard(zone)
+        self._update_registration()
+
+    def _update_registration(self):
+        if self.single == self._registered:
+            return
+        if self.single:
+            self._buspro.register_telegram_received_device_cb(
+                self._status_received, self._device_address, operate_code=OperateCode.ReadFloorHeatingStatusResponse)
+        else:
+            self._buspro.unregister_telegram_received_device_cb(
+                self._status_received, self._device_address, operate_code=OperateCode.ReadFloorHeatingStatusResponse)
+        self._registered = self.single
+
+    def _status_received(self, telegram, postfix=None):
+        for zone in list(self._zones):
+            zone._read_floor_heating_status_received(telegram)
+
+
 class FloorHeating(Device):
+    POLL_MAX_AGE = 300
     def __init__(self, buspro, device_address, number):
         super().__init__(buspro, device_address)
         self._number = number
@@ -19,60 +61,80 @@ class FloorHeating(Device):
         self._temperature_night = None
         self._temperature_away = None
 
-        self.register_telegram_received_cb(self._telegram_received_cb)
+        self.register_telegram_handlers({
+            OperateCode.ReadDLPStatusResponse: self._dlp_status_received,
+            OperateCode.ControlDLPStatusResponse: self._dlp_status_received,
+            OperateCode.ControlFloorHeatingResponse: self._floor_heating_status_received,
+        })
+        # ReadFloorHeatingStatus的应答由同一地址上的所有地暖共同处理
+        address = tuple(device_address)
+        self._zones = buspro.get_shared_object(("floor_heating", address), lambda: FloorHeatingZones(buspro, address))
+        self._zones.add(self)
         self.call_read_current_heating_status(run_from_init=True)
 
-    def _telegram_received_cb(self, telegram, postfix=None):
-        if isinstance(telegram, (ReadDLPStatusResponseData, ControlDLPStatusResponseData)):
-            logger.debug(f"Floor Heating Device received: {telegram}")
-            self._update(telegram._dlp_operate_code, telegram._data, telegram._number)
-            self.call_device_updated()
-        elif isinstance(telegram, ControlFloorHeatingResponseData):
-            if telegram._number == self._number:
-                logger.debug(f"Floor Heating Device received: {telegram}")
-                copy_class_attrs(telegram, self)
-                self.call_device_updated()
-        # ReadFloorHeatingStatusResponse 没有_number字段
-        # elif isinstance(telegram, ReadFloorHeatingStatusResponseData):
-        #     if telegram._number == self._number:
-        #         logger.debug(f"Floor Heating Device received: {telegram}")
-        #         copy_class_attrs(telegram, self)
-        # else:
-        #     logger.debug(f"Not supported message for operate type {telegram}")
+    def close(self):
+        self._zones.remove(self)
+        super().close()
+
+    def _dlp_status_received(self, telegram, postfix=None):
+        logger.debug("Floor Heating Device received: %s", telegram)
+        changed = self._update(telegram._dlp_operate_code, telegram._data, telegram._number)
+        self.call_device_updated(changed)
+
+    def _floor_heating_status_received(self, telegram, postfix=None):
+        if telegram._number == self._number:
+            logger.debug("Floor Heating Device received: %s", telegram)
+            changed = self._copy_fields(telegram)
+            self.call_device_updated(changed)
+
+    def _read_floor_heating_status_received(self, telegram, postfix=None):
+        # 应答中没有地暖编号, 只在这个地址上只有一个地暖时由FloorHeatingZones调用
+        logger.debug("Floor Heating Device received: %s", telegram)
+        changed = self._update_fields({
+            "_status": telegram._status,
+            "_mode": telegram._mode,
+            "_temperature": telegram._temperature,
+            "_temperature_normal": telegram._normal_temperature,
+            "_temperature_day": telegram._day_temperature,
+            "_temperature_night": telegram._night_temperature,
+            "_temperature_away": telegram._away_temperature,
+        })
+        self.call_device_updated(changed)
+
+    # DLP操作码 -> 属性名, lock暂不处理
+    _DLP_FIELDS = {
+        DLPOperateCode.status: "_status",
+        DLPOperateCode.mode: "_mode",
+        DLPOperateCode.lock: None,
+        DLPOperateCode.temperature_normal: "_temperature_normal",
+        DLPOperateCode.temperature_day: "_temperature_day",
+        DLPOperateCode.temperature_night: "_temperature_night",
+        DLPOperateCode.temperature_away: "_temperature_away",
+    }
 
     def _update(self, op_code, data, number):
-        if number == self._number:
-            operate = DLPOperateCode.value_of(op_code)
-            if operate == DLPOperateCode.status:
-                self._status = data
-            elif operate == DLPOperateCode.mode:
-                self._mode = data
-            elif operate == DLPOperateCode.lock:
-                pass
-            elif operate == DLPOperateCode.temperature_normal:
-                self._temperature_normal = data
-            elif operate == DLPOperateCode.temperature_day:
-                self._temperature_day = data
-            elif operate == DLPOperateCode.temperature_night:
-                self._temperature_night = data
-            elif operate == DLPOperateCode.temperature_away:
-                self._temperature_away = data
-            else:
-                logger.debug(f"Not supported DLP operate type {op_code}")
+        if number != self._number:
+            return set()
+        operate = DLPOperateCode.value_of(op_code)
+        if operate not in self._DLP_FIELDS:
+            logger.debug(f"Not supported DLP operate type {op_code}")
+            return set()
+        field = self._DLP_FIELDS[operate]
+        return self._update_fields({field: data}) if field else set()
 
     async def async_read_floor_heating(self, operate):
         control = ReadDLPStatusData(self._device_address)
         control._dlp_operate_code = operate.value
         control._data = self._number
         control._number = self._number
-        await self._buspro.send_telegram(control)
+        await self._buspro.read_telegram(control)
 
-    async def async_control_floor_heating(self, operate, data):
+    async def async_control_floor_heating(self, operate, data, wait_response=False):
         control = ControlDLPStatusData(self._device_address)
         control._dlp_operate_code = operate.value
         control._data = data
         control._number = self._number
-        await self._buspro.send_telegram(control)
+        return await self._send_command(control, wait_response)
 
     def call_read_current_heating_status(self, run_from_init=False):      
         asyncio.ensure_future(self._read_current_heating_status(run_from_init), loop=self._buspro.loop)
@@ -80,7 +142,18 @@ class FloorHeating(Device):
     async def _read_current_heating_status(self, run_from_init=False):
         if run_from_init:
             await asyncio.sleep(5)
+        await self._read_status()
 
+    async def _read_status(self):
+        # 地址上只有一个地暖时用一个报文读取全部状态, 没有应答时再逐项用DLP读取
+        if self._zones.single:
+            response = await self._buspro.read_telegram(ReadFloorHeatingStatusData(self._device_address))
+            if response is not None:
+                return
+            logger.debug(f"No floor heating status from {self._device_address}, read by DLP")
+        await self._read_status_by_dlp()
+
+    async def _read_status_by_dlp(self):
         await self.async_read_floor_heating(DLPOperateCode.status)
         await self.async_read_floor_heating(DLPOperateCode.mode)
         await self.async_read_floor_heating(DLPOperateCode.temperature_normal)
@@ -88,25 +161,66 @@ class FloorHeating(Device):
         await self.async_read_floor_heating(DLPOperateCode.temperature_night)
         await self.async_read_floor_heating(DLPOperateCode.temperature_away)
 
+    # 预设模式 -> (温度属性, 设置温度的DLP操作码), 其它模式使用Normal的温度
+    _PRESET_TEMPERATURES = {
+        PresetMode.Normal: ("_temperature_normal", DLPOperateCode.temperature_normal),
+        PresetMode.Day: ("_temperature_day", DLPOperateCode.temperature_day),
+        PresetMode.Night: ("_temperature_night", DLPOperateCode.temperature_night),
+        PresetMode.Away: ("_temperature_away", DLPOperateCode.temperature_away),
+    }
+
+    # ControlFloorHeatingData中需要知道当前值的字段(有默认值的保留字段除外)
+    _CONTROL_FIELDS = tuple(field.name for field in ControlFloorHeatingData.SCHEMA
+                            if field.name != "_number" and field.default is None)
+
+    @property
+    def _state_known(self):
+        return all(getattr(self, name) is not None for name in self._CONTROL_FIELDS)
+
+    async def async_apply(self, status:OnOffStatus=None, preset_mode:PresetMode=None, temperature=None):
+        """ 用一个ControlFloorHeatingData报文修改开关、预设模式和目标温度, 返回地暖的应答, 超时为None
+
+        temperature是修改后的预设模式下的目标温度
+        """
+        # ControlFloorHeatingData需要完整的状态, 不知道时先读取一次
+        if not self._state_known:
+            await self._read_status()
+        mode = preset_mode or self.preset_mode
+        temperature_field, temperature_operate = self._PRESET_TEMPERATURES.get(mode, self._PRESET_TEMPERATURES[PresetMode.Normal])
+        if not self._state_known:
+            logger.warning(f"Unknown state of floor heating {self._device_address}-{self._number}, apply changes by DLP")
+            response = None
+            if status is not None:
+                response = await self.async_control_floor_heating(DLPOperateCode.status, status.value, wait_response=True)
+            if preset_mode is not None:
+                response = await self.async_control_floor_heating(DLPOperateCode.mode, preset_mode.value, wait_response=True)
+            if temperature is not None:
+                response = await self.async_control_floor_heating(temperature_operate, temperature, wait_response=True)
+            return response
+
+        control = ControlFloorHeatingData(self._device_address)
+        for name in control.field_names:
+            if name in vars(self):
+                setattr(control, name, getattr(self, name))
+        if status is not None:
+            control._status = status.value
+        if preset_mode is not None:
+            control._mode = preset_mode.value
+        if temperature is not None:
+            setattr(control, temperature_field, temperature)
+        return await self._send_command(control, wait_response=True)
+
     async def async_turn_off(self):
-        await self.async_control_floor_heating(DLPOperateCode.status, OnOffStatus.OFF.value)
+        await self.async_apply(status=OnOffStatus.OFF)
 
     async def async_turn_on(self):
-        await self.async_control_floor_heating(DLPOperateCode.status, OnOffStatus.ON.value)
+        await self.async_apply(status=OnOffStatus.ON)
     
     async def async_set_preset_mode(self, mode:PresetMode):
-        await self.async_control_floor_heating(DLPOperateCode.mode, mode.value)
+        await self.async_apply(preset_mode=mode)
     
     async def async_set_target_temperature(self, temperature):
-        operate = DLPOperateCode.temperature_normal
-        if self.preset_mode == PresetMode.Day:
-            operate = DLPOperateCode.temperature_day
-        elif self.preset_mode == PresetMode.Away:
-            operate = DLPOperateCode.temperature_away
-        elif self.preset_mode == PresetMode.Night:
-             operate = DLPOperateCode.temperature_night
-      
-        await self.async_control_floor_heating(operate, temperature)
+        await self.async_apply(temperature=temperature)
     
     async def async_set_mode(self, mode:AirConditionMode):
         await self.async_turn_on()  # 直接打开地暖
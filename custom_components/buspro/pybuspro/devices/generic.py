@@ -1,5 +1,6 @@
 import asyncio
 from .device import Device
+from ..enums import SendPriority
 from ..telegram import Telegram
 
 
@@ -13,4 +14,4 @@ class Generic(Device):
         control = Telegram(self._device_address)
         control.operate_code = self._operate_code
         control.payload = self._payload
-        await self._buspro.send_telegram(control)
+        await self._buspro.send_telegram(control, SendPriority.Interactive)
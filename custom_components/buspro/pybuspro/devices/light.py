@@ -3,11 +3,12 @@
 import asyncio
 from ..telegram import Telegram, SingleChannelControlData, SingleChannelControlResponseData, ReadStatusOfChannelsData, ReadStatusOfChannelsResponseData, SceneControlResponseData
 from .device import Device
-from ..enums import SuccessOrFailure
+from ..enums import SuccessOrFailure, OperateCode
 
 logger = logging.getLogger(__name__)
 
 class Light(Device):
+    POLL_MAX_AGE = 300
     def __init__(self, buspro, device_address, channel_number, is_dimmable=False, running_time=0):
         super().__init__(buspro, device_address)
         self._channel = channel_number
@@ -20,27 +21,30 @@ class Light(Device):
         else:
             self._running_time_mins, self._running_time_secs = 0, 0
 
-        self.register_telegram_received_cb(self._telegram_received_cb)
+        self.register_telegram_handlers({
+            OperateCode.SingleChannelControlResponse: self._single_channel_control_response_received,
+            OperateCode.ReadStatusOfChannelsResponse: self._read_status_of_channels_response_received,
+            OperateCode.SceneControlResponse: self._scene_control_response_received,
+        })
         self.call_read_current_status_of_channels(run_from_init=True)
 
-    def _telegram_received_cb(self, telegram:Telegram, postfix=None):
-        if isinstance(telegram, SingleChannelControlResponseData):
-            if self._channel == telegram._channel_number:  # and telegram._success == SuccessOrFailure.Success.value:
-                logger.debug(f"Light Device received: {telegram}")
-                self._brightness = telegram._channel_status
-                self._set_previous_brightness(self._brightness)
-                self.call_device_updated()
-        elif isinstance(telegram, ReadStatusOfChannelsResponseData):
-            if self._channel <= telegram._channel_count:
-                logger.debug(f"Light Device received: {telegram}")
-                self._brightness = telegram.get_status(self._channel)
-                self._set_previous_brightness(self._brightness)
-                self.call_device_updated()
-        elif isinstance(telegram, SceneControlResponseData):
-            logger.debug(f"Light Device received: {telegram}")
-            self.call_read_current_status_of_channels()
-        # else:
-        #     logger.debug(f"Light device discard the telegram: {telegram}")
+    def _single_channel_control_response_received(self, telegram:SingleChannelControlResponseData, postfix=None):
+        if self._channel == telegram._channel_number:  # and telegram._success == SuccessOrFailure.Success.value:
+            logger.debug("Light Device received: %s", telegram)
+            changed = self._update_fields({"_brightness": telegram._channel_status})
+            self._set_previous_brightness(self._brightness)
+            self.call_device_updated(changed)
+
+    def _read_status_of_channels_response_received(self, telegram:ReadStatusOfChannelsResponseData, postfix=None):
+        if self._channel <= telegram._channel_count:
+            logger.debug("Light Device received: %s", telegram)
+            changed = self._update_fields({"_brightness": telegram.get_status(self._channel)})
+            self._set_previous_brightness(self._brightness)
+            self.call_device_updated(changed)
+
+    def _scene_control_response_received(self, telegram:SceneControlResponseData, postfix=None):
+        logger.debug("Light Device received: %s", telegram)
+        self.call_read_current_status_of_channels()
     
     def call_read_current_status_of_channels(self, run_from_init=False):     
         asyncio.ensure_future(self._read_current_state_of_channels(run_from_init), loop=self._buspro.loop)
@@ -48,8 +52,12 @@ class Light(Device):
     async def _read_current_state_of_channels(self, run_from_init):
         if run_from_init:
             await asyncio.sleep(3)
+        await self._read_status()
+
+    async def _read_status(self):
+        # 同一模块上所有通道的读取请求合并为一个, 应答会分发给每个通道
         control = ReadStatusOfChannelsData(self._device_address)
-        await self._buspro.send_telegram(control)
+        await self._buspro.read_telegram(control)
 
     async def set_on(self):
         await self._set(100)
@@ -80,15 +88,22 @@ class Light(Device):
         return True if self._brightness else False
 
     async def _set(self, intensity):
-        self._brightness = intensity
+        # 先乐观地更新状态, 模块的应答相同时不会再触发更新
+        previous = self._brightness
+        changed = self._update_fields({"_brightness": intensity}, apply_deadband=False, fresh=False)
         self._set_previous_brightness(self._brightness)
+        self.call_device_updated(changed)
 
         control = SingleChannelControlData(self._device_address)
         control._channel_number = self._channel
         control._channel_status = intensity
         control._running_time_minutes = self._running_time_mins
         control._running_time_seconds = self._running_time_secs
-        await self._buspro.send_telegram(control)
+        response = await self._send_command(control)
+        if response is None and self._buspro.reliable_send:
+            # 命令丢失, 恢复到之前的状态
+            changed = self._update_fields({"_brightness": previous}, apply_deadband=False, fresh=False)
+            self.call_device_updated(changed)
         
     def _set_previous_brightness(self, brightness):
         if self.supports_brightness and brightness > 0:
@@ -1,5 +1,6 @@
 import asyncio
 from .device import Device
+from ..enums import SendPriority
 from ..telegram import SceneControlData
 
 
@@ -12,4 +13,4 @@ class Scene(Device):
         control = SceneControlData(self._device_address)
         control._area_number = self._area_number
         control._scene_number = self._scene_number
-        await self._buspro.send_telegram(control)
+        await self._buspro.send_telegram(control, SendPriority.Interactive)
@@ -2,13 +2,22 @@ import asyncio
 import logging
 from ..telegram import *
 from .device import Device
-from ..helpers import copy_class_attrs
+from ..enums import SuccessOrFailure, OperateCode
 
 logger = logging.getLogger("buspro.devices.sensor")
 
 class Sensor(Device):
-    def __init__(self, buspro, device_address, universal_switch_number=None, channel_number=None, device=None, switch_number=None):
+    """ 一个物理传感器(地址), 可以同时被多个实体使用
+
+    通过bind_*登记需要的数据, 只订阅和读取登记过的报文; 编号相关的状态(通用开关、通道、干接点)
+    按编号保存, 变化的字段名是"字段名.编号"。
+    """
+    POLL_MAX_AGE = 120
+    def __init__(self, buspro, device_address, universal_switch_number=None, channel_number=None, device=None, switch_number=None,
+                 bind=True):
+        """ bind为False时不登记任何数据, 由使用者调用bind_* """
         super().__init__(buspro, device_address)
+        # 构造时指定的编号, universal_switch_is_on等属性使用这些编号
         self._universal_switch_number = universal_switch_number
         self._channel_number = channel_number
         self._device = device
@@ -20,79 +29,185 @@ class Sensor(Device):
         self._sonic = None
         self._dry_contact_1_status = None
         self._dry_contact_2_status = None
-        self._universal_switch_status = OnOffStatus.OFF
-        self._channel_status = 0
-        self._switch_status = 0
-
-        self.register_telegram_received_cb(self._telegram_received_cb)
-        self.call_read_current_status_of_sensor(run_from_init=True)
-
-    def _telegram_received_cb(self, telegram, postfix=None):
-        if isinstance(telegram, ReadSensorStatusResponseData):
-            copy_class_attrs(telegram, self)
-            if telegram._success == SuccessOrFailure.Success:
-                self._brightness = telegram._brightness_high + telegram._brightness_low
-                self.call_device_updated()
-        elif isinstance(telegram, ReadSensorsInOneStatusResponseData):
-            copy_class_attrs(telegram, self)
-            self.call_device_updated()
-        elif isinstance(telegram, BroadcastSensorStatusResponseData):
-            copy_class_attrs(telegram, self)
-            self.call_device_updated()
-        elif isinstance(telegram, BroadcastSensorStatusAutoResponseData):
-            copy_class_attrs(telegram, self)
-            self._current_temperature = telegram._current_temperature if self._device == "12in1" else telegram._current_temperature - 20
-            self._brightness = telegram._brightness_high + telegram._brightness_low
-            self.call_device_updated()
-        elif isinstance(telegram, ReadFloorHeatingStatusResponseData):
-            self._current_temperature = telegram._current_temperature
-            self.call_device_updated()
-        elif isinstance(telegram, BroadcastTemperatureResponseData):
-            self._current_temperature = telegram._current_temperature
-            self.call_device_updated()
-        elif isinstance(telegram, ReadStatusOfUniversalSwitchResponseData):
-            if self._universal_switch_number == telegram._switch_number:
-                self._universal_switch_status = telegram._switch_status
-                self.call_device_updated()
-        elif isinstance(telegram, BroadcastStatusOfUniversalSwitchData):
-            if self._universal_switch_number and self._universal_switch_number <= telegram._switch_count:
-                self._universal_switch_status = telegram.get_switch_status(self._universal_switch_number)
-                self.call_device_updated()
-        elif isinstance(telegram, UniversalSwitchControlResponseData):
-            if self._universal_switch_number == telegram._switch_number:
-                self._universal_switch_status = telegram._switch_status
-                self.call_device_updated()
-        elif isinstance(telegram, ReadStatusOfChannelsResponseData):
-            if self._channel_number and self._channel_number <= telegram._channel_count:
-                self._channel_status = telegram.get_status(self._channel_number)
-                self.call_device_updated()
-        elif isinstance(telegram, SingleChannelControlResponseData):
-            if self._channel_number == telegram._channel_number:
-                self._channel_status = telegram._channel_status
-                self.call_device_updated()
-        elif isinstance(telegram, ReadDryContactStatusResponseData):
-            if self._switch_number == telegram._switch_number:
-                self._switch_status = telegram._switch_status
-                self.call_device_updated()
+        # 编号 -> 状态
+        self._universal_switch_statuses = {}
+        self._channel_statuses = {}
+        self._switch_statuses = {}
+        self._sensor_bound = False
+        self._read_task = None
+
+        if not bind:
+            return
+        if universal_switch_number:
+            self.bind_universal_switch(universal_switch_number)
+        elif channel_number:
+            self.bind_channel(channel_number)
+        elif switch_number:
+            self.bind_dry_contact(switch_number)
         else:
-            logger.debug(f"Sensor device discard the telegram: {telegram}")
+            self.bind_sensor()
+
+    @classmethod
+    def shared(cls, buspro, device_address):
+        """ 同一地址的实体共用一个Sensor, 回调、启动读取和轮询只有一份
+
+        返回的Sensor还没有登记任何数据, 使用者按需要调用bind_*(和set_device)
+        """
+        address = tuple(device_address)
+        return buspro.get_shared_object(("sensor", address), lambda: cls(buspro, address, bind=False))
+
+    def set_device(self, device):
+        """ 设备类型("dlp", "12in1", "sensors_in_one"), 决定读取的报文和温度的修正 """
+        if device is None or device == self._device:
+            return
+        if self._device is not None:
+            logger.warning(f"Sensor {self._device_address} is configured as both {self._device} and {device}, use {device}")
+        self._device = device
+
+    def bind_sensor(self):
+        """ 温度、亮度、移动和干接点1/2 """
+        if not self._sensor_bound:
+            self._sensor_bound = True
+            self.register_telegram_handlers({
+                OperateCode.ReadSensorStatusResponse: self._sensor_status_received,
+                OperateCode.ReadSensorsInOneStatusResponse: self._sensor_broadcast_received,
+                OperateCode.BroadcastSensorStatusResponse: self._sensor_broadcast_received,
+                OperateCode.BroadcastSensorStatusAutoResponse: self._sensor_auto_broadcast_received,
+                OperateCode.ReadFloorHeatingStatusResponse: self._floor_heating_status_received,
+                OperateCode.BroadcastTemperatureResponse: self._temperature_broadcast_received,
+            })
+            self._call_read_after_bind()
+
+    def bind_universal_switch(self, number):
+        if number not in self._universal_switch_statuses:
+            self._universal_switch_statuses[number] = 0
+            self.register_telegram_handlers({
+                OperateCode.ReadStatusOfUniversalSwitchResponse: self._universal_switch_read_received,
+                OperateCode.UniversalSwitchControlResponse: self._universal_switch_status_received,
+                OperateCode.BroadcastStatusOfUniversalSwitch: self._universal_switch_broadcast_received,
+            })
+            self._call_read_after_bind()
+
+    def bind_channel(self, number):
+        if number not in self._channel_statuses:
+            self._channel_statuses[number] = 0
+            self.register_telegram_handlers({
+                OperateCode.ReadStatusOfChannelsResponse: self._channels_status_received,
+                OperateCode.SingleChannelControlResponse: self._single_channel_status_received,
+            })
+            self._call_read_after_bind()
+
+    def bind_dry_contact(self, number):
+        if number not in self._switch_statuses:
+            self._switch_statuses[number] = 0
+            self.register_telegram_handlers({
+                OperateCode.ReadDryContactStatusResponse: self._dry_contact_status_received,
+            })
+            self._call_read_after_bind()
+
+    def _call_read_after_bind(self):
+        # 启动读取还没发出时, 之后登记的数据一起读取
+        if self._read_task is None or self._read_task.done():
+            self._read_task = self.call_read_current_status_of_sensor(run_from_init=True)
+
+    def _update_numbered(self, field, statuses, number, value):
+        """ 更新按编号保存的状态, 返回变化的字段名("字段名.编号") """
+        if number not in statuses:
+            return set()
+        self._last_fresh = self._buspro.loop.time()
+        if statuses[number] == value:
+            return set()
+        statuses[number] = value
+        return {f"{field}.{number}"}
+
+    def _sensor_status_received(self, telegram, postfix=None):
+        changed = self._copy_fields(telegram)
+        # _success是报文中的原始字节
+        if telegram._success == SuccessOrFailure.Success.value[0]:
+            changed |= self._update_fields({"_brightness": telegram._brightness_high + telegram._brightness_low})
+        self.call_device_updated(changed)
+
+    def _sensor_broadcast_received(self, telegram, postfix=None):
+        changed = self._copy_fields(telegram)
+        self.call_device_updated(changed)
+
+    def _sensor_auto_broadcast_received(self, telegram, postfix=None):
+        # 温度需要修正, 不能直接复制原始值, 否则每次都会被当作变化
+        changed = self._update_fields({
+            "_current_temperature": telegram._current_temperature if self._device == "12in1" else telegram._current_temperature - 20,
+            "_brightness": telegram._brightness_high + telegram._brightness_low,
+            "_motion_sensor": telegram._motion_sensor,
+            "_sonic": telegram._sonic,
+            "_dry_contact_1_status": telegram._dry_contact_1_status,
+            "_dry_contact_2_status": telegram._dry_contact_2_status,
+        })
+        self.call_device_updated(changed)
+
+    def _floor_heating_status_received(self, telegram, postfix=None):
+        changed = self._update_fields({"_current_temperature": telegram._temperature})
+        self.call_device_updated(changed)
+
+    def _temperature_broadcast_received(self, telegram, postfix=None):
+        changed = self._update_fields({"_current_temperature": telegram._current_temperature})
+        self.call_device_updated(changed)
+
+    def _universal_switch_status_received(self, telegram, postfix=None):
+        changed = self._update_numbered("_universal_switch_status", self._universal_switch_statuses, telegram._switch_number, telegram._switch_status)
+        self.call_device_updated(changed)
+
+    def _universal_switch_read_received(self, telegram, postfix=None):
+        # 应答可能是单个开关的状态, 也可能是模块上所有开关的状态
+        changed = set()
+        for number, status in telegram.get_switch_statuses(self._buspro.universal_switch_bulk_read).items():
+            changed |= self._update_numbered("_universal_switch_status", self._universal_switch_statuses, number, status)
+        self.call_device_updated(changed)
+
+    def _universal_switch_broadcast_received(self, telegram, postfix=None):
+        changed = set()
+        for number in self._universal_switch_statuses:
+            if number <= telegram._switch_count:
+                changed |= self._update_numbered("_universal_switch_status", self._universal_switch_statuses, number, telegram.get_switch_status(number))
+        self.call_device_updated(changed)
+
+    def _channels_status_received(self, telegram, postfix=None):
+        changed = set()
+        for number in self._channel_statuses:
+            if number <= telegram._channel_count:
+                changed |= self._update_numbered("_channel_status", self._channel_statuses, number, telegram.get_status(number))
+        self.call_device_updated(changed)
+
+    def _single_channel_status_received(self, telegram, postfix=None):
+        changed = self._update_numbered("_channel_status", self._channel_statuses, telegram._channel_number, telegram._channel_status)
+        self.call_device_updated(changed)
+
+    def _dry_contact_status_received(self, telegram, postfix=None):
+        changed = self._update_numbered("_switch_status", self._switch_statuses, telegram._switch_number, telegram._switch_status)
+        self.call_device_updated(changed)
+
+    async def _read_status(self):
+        await self.read_sensor_status()
 
     async def read_sensor_status(self):
-        if self._universal_switch_number:
+        # 每种登记过的数据各读取一次, 同一设备上相同的读取请求会被合并
+        controls = []
+        if self._sensor_bound:
+            if self._device and self._device == "dlp":
+                controls.append(ReadFloorHeatingStatusData(self._device_address))
+            elif self._device and self._device == "sensors_in_one":
+                controls.append(ReadSensorsInOneStatusData(self._device_address))
+            else:
+                controls.append(ReadSensorStatusData(self._device_address))
+        for number in self._universal_switch_statuses:
             control = ReadStatusOfUniversalSwitchData(self._device_address)
-            control._switch_number = self._universal_switch_number            
-        elif self._channel_number:
-            control = ReadStatusOfChannelsData(self._device_address)
-        elif self._device and self._device == "dlp":
-            control = ReadFloorHeatingStatusData(self._device_address)
-        elif self._device and self._device == "dry_contact":
+            control._switch_number = number
+            controls.append(control)
+        if self._channel_statuses:
+            controls.append(ReadStatusOfChannelsData(self._device_address))
+        for number in self._switch_statuses:
             control = ReadDryContactStatusData(self._device_address)
-            control._switch_number = self._switch_number
-        elif self._device and self._device == "sensors_in_one":
-            control = ReadSensorsInOneStatusData(self._device_address)
-        else:
-            control = ReadSensorStatusData(self._device_address)
-        await self._buspro.send_telegram(control)
+            control._switch_number = number
+            controls.append(control)
+        await asyncio.gather(*(self._buspro.read_telegram(control) for control in controls))
 
     @property
     def temperature(self):
@@ -123,20 +238,29 @@ class Sensor(Device):
 
     @property
     def universal_switch_is_on(self):
-        return True if self._universal_switch_status == 1 else False
+        return self.is_universal_switch_on(self._universal_switch_number)
 
     @property
     def single_channel_is_on(self):
-        return True if self._channel_status else False
+        return self.is_channel_on(self._channel_number)
 
     @property
     def switch_status(self):
-        return True if self._switch_status==1 else False
+        return self.is_dry_contact_on(self._switch_number)
+
+    def is_universal_switch_on(self, number):
+        return True if self._universal_switch_statuses.get(number) == 1 else False
+
+    def is_channel_on(self, number):
+        return True if self._channel_statuses.get(number) else False
+
+    def is_dry_contact_on(self, number):
+        return True if self._switch_statuses.get(number) == 1 else False
 
     def call_read_current_status_of_sensor(self, run_from_init=False):
-        asyncio.ensure_future(self._read_current_status_of_sensor(run_from_init), loop=self._buspro.loop)
+        return asyncio.ensure_future(self._read_current_status_of_sensor(run_from_init), loop=self._buspro.loop)
     
-    async def _read_current_status_of_sensor(self, run_form_init):
+    async def _read_current_status_of_sensor(self, run_from_init):
         if run_from_init:
             await asyncio.sleep(5)
         await self.read_sensor_status()
@@ -1,28 +1,161 @@
 import asyncio
 import logging
+import weakref
 
 from ..telegram import Telegram, UniversalSwitchControlData, UniversalSwitchControlResponseData, ReadStatusOfUniversalSwitchData, ReadStatusOfUniversalSwitchResponseData
 from .device import Device
-from ..enums import OnOff, SwitchStatusOnOff
+from ..buspro import READ_TIMEOUT
+from ..enums import OnOff, SwitchStatusOnOff, OperateCode, SendPriority
 
 logger = logging.getLogger(__name__)
 
+
+class UniversalSwitchGroup:
+    """ 同一模块上的所有UniversalSwitch共享一组报文处理和状态读取
+
+    每种报文只注册一次, 按开关编号分发; 广播报文和批量读取的应答一次更新所有开关。
+    批量读取的报文没有文档, 只在Buspro的universal_switch_bulk_read打开时使用。
+    """
+    def __init__(self, buspro, device_address):
+        self._buspro = buspro
+        self._device_address = device_address
+        # 开关编号 -> 这个编号上的UniversalSwitch
+        self._switches = {}
+        self._read_task = None
+        # 模块是否回答批量读取: None表示还不知道; 第一次没有回答后只逐个读取
+        self._bulk_supported = None
+        self._bulk_future = None
+        self._handlers = {
+            OperateCode.UniversalSwitchControlResponse: self._switch_status_received,
+            OperateCode.ReadStatusOfUniversalSwitchResponse: self._switches_status_received,
+            OperateCode.BroadcastStatusOfUniversalSwitch: self._switches_broadcast_received,
+        }
+        self._registered = False
+
+    def add(self, switch):
+        self._switches.setdefault(switch.switch_number, weakref.WeakSet()).add(switch)
+        if not self._registered:
+            for operate_code, handler in self._handlers.items():
+                self._buspro.register_telegram_received_device_cb(handler, self._device_address, operate_code=operate_code)
+            self._registered = True
+
+    def remove(self, switch):
+        switches = self._switches.get(switch.switch_number)
+        if switches is not None:
+            switches.discard(switch)
+            if not switches:
+                del self._switches[switch.switch_number]
+        if not self._switches and self._registered:
+            for operate_code, handler in self._handlers.items():
+                self._buspro.unregister_telegram_received_device_cb(handler, self._device_address, operate_code=operate_code)
+            self._registered = False
+
+    def _update_switches(self, statuses):
+        for switch_number, status in statuses.items():
+            for switch in list(self._switches.get(switch_number, ())):
+                switch._set_switch_status(status)
+
+    def _switch_status_received(self, telegram, postfix=None):
+        logger.debug("Universal Switch Device received: %s", telegram)
+        self._update_switches({telegram._switch_number: telegram._switch_status})
+
+    def _switches_status_received(self, telegram, postfix=None):
+        logger.debug("Universal Switch Device received: %s", telegram)
+        bulk_read = self._buspro.universal_switch_bulk_read
+        self._update_switches(telegram.get_switch_statuses(bulk_read))
+        if telegram.is_bulk(bulk_read) and self._bulk_future and not self._bulk_future.done():
+            self._bulk_future.set_result(telegram)
+
+    def _switches_broadcast_received(self, telegram, postfix=None):
+        logger.debug("Universal Switch Device received broadcast: %s", telegram)
+        self._update_switches({
+            switch_number: telegram.get_switch_status(switch_number)
+            for switch_number in self._switches
+            if switch_number <= telegram._switch_count
+        })
+
+    def call_read_status(self, delay=0):
+        # 多个开关同时请求读取时只读取一次
+        if self._read_task is None or self._read_task.done():
+            self._read_task = asyncio.ensure_future(self.read_status(delay), loop=self._buspro.loop)
+        return self._read_task
+
+    async def read_status(self, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+        started = self._buspro.loop.time()
+
+        if self._buspro.universal_switch_bulk_read and self._bulk_supported is not False:
+            # 先用一个报文读取模块上所有开关的状态
+            if await self._read_bulk():
+                self._bulk_supported = True
+            elif self._bulk_supported is None:
+                logger.info("Module %s does not answer the bulk universal switch read, read switches one by one", self._device_address)
+                self._bulk_supported = False
+
+        # 读取没有更新的开关, 不轮询的开关(如服务调用使用的)不读取
+        # 所有读取同时交给调度器, 发送速度由调度器控制, 同时等待应答的数量由发送窗口限制
+        controls = []
+        for switch_number, switches in list(self._switches.items()):
+            if any(switch.polled and (switch.last_fresh is None or switch.last_fresh < started) for switch in switches):
+                control = ReadStatusOfUniversalSwitchData(self._device_address)
+                control._switch_number = switch_number
+                controls.append(control)
+        await asyncio.gather(*(self._buspro.read_telegram(control) for control in controls))
+
+    async def _read_bulk(self):
+        """ 批量读取, 模块在READ_TIMEOUT内回答时返回True
+
+        批量应答的格式不能按开关编号匹配请求, 所以不经过Buspro.request, 也不占用发送窗口
+        """
+        self._bulk_future = self._buspro.loop.create_future()
+        control = ReadStatusOfUniversalSwitchData(self._device_address)
+        control.payload = []
+        try:
+            await self._buspro.send_telegram(control, SendPriority.Background)
+            await asyncio.wait_for(self._bulk_future, READ_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._bulk_future = None
+
+
 class UniversalSwitch(Device):
-    def __init__(self, buspro, device_address, switch_number):
+    POLL_MAX_AGE = 300
+    def __init__(self, buspro, device_address, switch_number, poll=True):
+        """ poll为False时不读取也不轮询状态, 只接收模块的应答和广播 """
         super().__init__(buspro, device_address)
 
         self._switch_number = switch_number
         self._switch_status:OnOff = OnOff.OFF
+        self._polled = poll
+        if not poll:
+            buspro.unregister_poll_device(self)
+
+        # 同一模块上的开关共享报文处理和状态读取
+        address = tuple(device_address)
+        self._group = buspro.get_shared_object(("universal_switch", address), lambda: UniversalSwitchGroup(buspro, address))
+        self._group.add(self)
+        if poll:
+            self.call_read_current_status_of_universal_switch(run_from_init=True)
 
-        self.register_telegram_received_cb(self._telegram_received_cb)
-        self.call_read_current_status_of_universal_switch(run_from_init=True)
+    def close(self):
+        self._group.remove(self)
+        super().close()
 
-    def _telegram_received_cb(self, telegram, postfix=None):
-        if isinstance(telegram, (UniversalSwitchControlResponseData, ReadStatusOfUniversalSwitchResponseData)):
-            if self._switch_number == telegram._switch_number:
-                logger.debug(f"Universal Switch Device received: {telegram}")
-                self._switch_status = OnOff.value_of(telegram._switch_status)
-                self.call_device_updated()
+    @property
+    def switch_number(self):
+        return self._switch_number
+
+    @property
+    def polled(self):
+        return self._polled
+
+    def _set_switch_status(self, status):
+        # 模块返回的状态不一定是0/255, 非0都当作打开
+        changed = self._update_fields({"_switch_status": OnOff.ON if status else OnOff.OFF})
+        self.call_device_updated(changed)
 
     async def set_on(self):
         await self._set(OnOff.ON)
@@ -38,21 +171,24 @@ class UniversalSwitch(Device):
         return False if self._switch_status == OnOff.OFF else True
 
     async def _set(self, switch_status):
-        self._switch_status = switch_status
+        # 先乐观地更新状态, 模块的应答相同时不会再触发更新
+        previous = self._switch_status
+        changed = self._update_fields({"_switch_status": switch_status}, fresh=False)
+        self.call_device_updated(changed)
 
         control = UniversalSwitchControlData(self._device_address)
         control._switch_number = self._switch_number
         control._switch_status = self._switch_status.value
 
-        await self._buspro.send_telegram(control)
+        response = await self._send_command(control)
+        if response is None and self._buspro.reliable_send:
+            # 命令丢失, 恢复到之前的状态
+            changed = self._update_fields({"_switch_status": previous}, fresh=False)
+            self.call_device_updated(changed)
 
     def call_read_current_status_of_universal_switch(self, run_from_init=False):
-        asyncio.ensure_future(self._read_current_state_of_universal_switch(run_from_init), loop=self._buspro.loop)
-    
-    async def _read_current_state_of_universal_switch(self, run_from_init):
-        if run_from_init:
-            await asyncio.sleep(1)
+        # 启动时同一模块上的所有开关只读取一次
+        self._group.call_read_status(1 if run_from_init else 0)
 
-        control = ReadStatusOfUniversalSwitchData(self._device_address)
-        control._switch_number = self._switch_number
-        await self._buspro.send_telegram(control)
+    async def _read_status(self):
+        await self._group.call_read_status()
@@ -1,14 +1,40 @@
-from enum import Enum
-
-class BaseEnum(Enum):
+from enum import Enum, EnumMeta
+
+class BaseEnumMeta(EnumMeta):
+    # 创建枚举类时建立 值->成员 的索引，避免每次value_of都遍历所有成员
+    def __new__(metacls, cls, bases, classdict, **kwds):
+        enum_class = super().__new__(metacls, cls, bases, classdict, **kwds)
+        value_index = {}
+        word_index = {}
+        for member in enum_class._member_map_.values():
+            value = member._value_
+            value_index.setdefault(value, member)
+            # 报文头中的2字节字段(设备类型、操作码)直接用整数查找，不需要先切出bytes
+            if isinstance(value, bytes) and len(value) == 2:
+                word_index.setdefault(value[0] << 8 | value[1], member)
+        enum_class._value_index_ = value_index
+        enum_class._word_index_ = word_index
+        return enum_class
+
+class BaseEnum(Enum, metaclass=BaseEnumMeta):
     # 得到枚举值， 如果没有返回None
     @classmethod
     def value_of(cls, value):
-        # for enum_item in cls:
-        for member in cls._member_map_.values():
-            if member._value_ == value:
-                return member
-        return None
+        try:
+            return cls._value_index_.get(value)
+        except TypeError:
+            return None
+
+    # 根据2字节的整数值(高位在前)得到枚举值， 如果没有返回None
+    @classmethod
+    def value_of_word(cls, word):
+        return cls._word_index_.get(word)
+
+class SendPriority(BaseEnum):
+    # 发送优先级, 值越小越先发送
+    Interactive = 0     # HA的控制命令
+    Normal = 1
+    Background = 2      # 轮询、启动时的状态读取
 
 class SuccessOrFailure(BaseEnum):
     Success = b'\xF8'
@@ -116,6 +142,7 @@ class OperateCode(BaseEnum):
 
     ReadFloorHeatingStatus = b'\x19\x44'
     ReadFloorHeatingStatusResponse = b'\x19\x45'
+    ControlFloorHeating = b'\x1C\x5C'
     ControlFloorHeatingResponse = b'\x1C\x5D'
 
     ReadDryContactStatus = b'\x15\xCE'
@@ -472,4 +499,16 @@ class OperateCode(BaseEnum):
     
     //		SingleChannelControl = 0x0031
     //	}
-    '''
\ No newline at end of file
+    '''
+    @property
+    def is_response(self):
+        return self.name.endswith("Response") or self.name.startswith("RESPONSE_")
+
+    # 应答的操作码 = 请求的操作码 + 1, 没有对应的应答时返回None
+    # 只有请求才有应答: 应答或广播的操作码加1是另一个请求(如SingleChannelControlResponse + 1 = ReadStatusOfChannels)
+    @property
+    def response(self):
+        if len(self._value_) != 2 or self.is_response:
+            return None
+        response = OperateCode.value_of_word((self._value_[0] << 8 | self._value_[1]) + 1)
+        return response if response is not None and response.is_response else None
@@ -1,16 +1,33 @@
 import typing
 
-def copy_class_attrs(source, target):
-    source_dict = vars(source)    
+def update_attrs(target, values:dict, deadbands:dict=None):
+    # 只更新真正变化的属性, 返回变化了的属性名
+    # deadbands: 属性名 -> 最小变化量, 变化小于这个值时忽略(用于温度、亮度等有抖动的值)
     target_dict = vars(target)
-    
-    source_attrs = [k for k in source_dict.keys() if k.startswith("_") and k!='_payload']
-    target_attrs = [k for k in target_dict.keys() if k.startswith("_") and k!='_payload']
+    changed = set()
 
-    for target_attr in target_attrs:
-        if target_attr in source_attrs:
-            if source_dict[target_attr] is not None:
-                target_dict[target_attr] = source_dict[target_attr]
+    for name, value in values.items():
+        old_value = target_dict.get(name)
+        if value == old_value:
+            continue
+        deadband = deadbands.get(name) if deadbands else None
+        if deadband and old_value is not None and value is not None and abs(value - old_value) < deadband:
+            continue
+        target_dict[name] = value
+        changed.add(name)
+    return changed
+
+def copy_class_attrs(source, target, deadbands:dict=None):
+    # source是telegram, 按其SCHEMA中的字段复制到target同名的属性, 返回变化了的属性名
+    target_dict = vars(target)
+    values = {}
+
+    for name in source.field_names:
+        if name in target_dict:
+            value = getattr(source, name)
+            if value is not None:
+                values[name] = value
+    return update_attrs(target, values, deadbands)
 
 def parse_device_address(device_config:str):
     addrs = [int(k) for k in device_config.split('.')]
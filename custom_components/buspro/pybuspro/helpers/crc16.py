@@ -0,0 +1,47 @@
+''' Buspro报文使用的CRC16 (CCITT/XModem: poly=0x1021, init=0x0000, 不反转) '''
+
+CRC16_POLY = 0x1021
+CRC16_INIT = 0x0000
+
+
+def _build_table(poly=CRC16_POLY):
+    table = []
+    for byte in range(256):
+        reg = byte << 8
+        for _ in range(8):
+            reg = ((reg << 1) ^ poly) if reg & 0x8000 else (reg << 1)
+        table.append(reg & 0xFFFF)
+    return tuple(table)
+
+# 启动时预先计算好256项的查找表，之后每个字节只需查一次表
+CRC16_TABLE = _build_table()
+
+
+def crc16(data, crc=CRC16_INIT):
+    """计算data的CRC16。
+
+    crc为之前已计算部分的结果，可用于分段（增量）计算：
+    crc16(b + c) == crc16(c, crc16(b))
+    """
+    table = CRC16_TABLE
+    for octet in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ octet]
+    return crc
+
+
+class CRC16:
+    """增量计算CRC16，可以从一个已有的中间状态继续计算。"""
+    __slots__ = ("value",)
+
+    def __init__(self, data=b"", crc=CRC16_INIT):
+        self.value = crc16(data, crc)
+
+    def update(self, data):
+        self.value = crc16(data, self.value)
+        return self
+
+    def digest(self):
+        return self.value.to_bytes(2, "big")
+
+    def copy(self):
+        return CRC16(crc=self.value)
@@ -0,0 +1,41 @@
+''' 服务调用使用的设备实例池: 按key复用设备, 超过容量时关闭最久没有使用的设备
+
+只有注册了报文处理的设备(如UniversalSwitch)需要放在池中, 否则每次调用都会多注册一份;
+Scene、Generic等只发送报文的设备每次创建即可。池中的设备应该不轮询状态, 否则空闲的设备也会一直读取总线。
+'''
+
+from collections import OrderedDict
+
+DEFAULT_DEVICE_POOL_SIZE = 64
+
+
+class DevicePool:
+    """ key -> 设备, 按最近使用的顺序淘汰, 被淘汰的设备会调用close()注销报文处理和轮询 """
+
+    def __init__(self, maxsize=DEFAULT_DEVICE_POOL_SIZE):
+        self._maxsize = maxsize
+        self._devices = OrderedDict()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, key):
+        return key in self._devices
+
+    def get(self, key, factory):
+        """ 返回key对应的设备, 没有时用factory()创建 """
+        device = self._devices.get(key)
+        if device is not None:
+            self._devices.move_to_end(key)
+            return device
+
+        device = self._devices[key] = factory()
+        while len(self._devices) > self._maxsize:
+            _, evicted = self._devices.popitem(last=False)
+            evicted.close()
+        return device
+
+    def close(self):
+        devices, self._devices = self._devices, OrderedDict()
+        for device in devices.values():
+            device.close()
@@ -0,0 +1,89 @@
+''' 按目标地址的发送窗口: 每个目标最多同时有window个请求在等待应答, 超出的按先进先出排队 '''
+
+import asyncio
+from collections import deque
+
+
+class SendWindow:
+    """ 先进先出的信号量, 释放时总是唤醒最早等待的请求 """
+    __slots__ = ("size", "in_flight", "_waiters")
+
+    def __init__(self, size):
+        self.size = size
+        self.in_flight = 0
+        self._waiters = deque()
+
+    @property
+    def idle(self):
+        return self.in_flight == 0 and not self._waiters
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self, loop):
+        if self.in_flight < self.size and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            # 被唤醒时release已经把名额转给了这个请求
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def cancel(self):
+        for waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+
+
+class SendWindows:
+    """ 目标地址 -> SendWindow, 空闲的窗口会被删除, 不同目标之间互不影响 """
+
+    def __init__(self, size, loop):
+        self._size = size
+        self._loop = loop
+        self._windows = {}
+
+    async def acquire(self, target):
+        window = self._windows.get(target)
+        if window is None:
+            window = self._windows[target] = SendWindow(self._size)
+        await window.acquire(self._loop)
+
+    def release(self, target):
+        window = self._windows.get(target)
+        if window is None:
+            return
+        window.release()
+        if window.idle:
+            del self._windows[target]
+
+    def statistics(self):
+        """ 所有窗口占用的名额和排队的请求数, 以及每个目标地址的 (占用, 排队) """
+        by_target = {target: (window.in_flight, window.waiting) for target, window in self._windows.items()}
+        return {
+            "size": self._size,
+            "in_flight": sum(in_flight for in_flight, _ in by_target.values()),
+            "waiting": sum(waiting for _, waiting in by_target.values()),
+            "by_target": by_target,
+        }
+
+    def cancel(self):
+        for window in self._windows.values():
+            window.cancel()
+        self._windows = {}
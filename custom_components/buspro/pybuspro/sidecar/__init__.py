@@ -0,0 +1,4 @@
+from .state_table import StateTable
+from .server import Sidecar, SidecarConfig, run_sidecar, start_sidecar_process
+from .client import SidecarClient, SidecarDevice
+from .simulator import GatewaySimulator
@@ -0,0 +1,218 @@
+''' 读取sidecar状态表的一端(HA进程): 只读共享内存, 收到变化通知后回调, 命令通过UDP发给sidecar
+
+key是(类型名, 子网, 设备, 通道), 如("light", 1, 74, 1)
+'''
+
+import asyncio
+import json
+import logging
+
+from .kinds import KIND_IDS, KINDS, kind_of, to_int
+from .server import NOTIFY_SLOT
+from .state_table import StateTable
+
+logger = logging.getLogger(__name__)
+
+# 等待sidecar进程创建状态表时, 两次尝试打开的间隔(秒)
+ATTACH_INTERVAL = 0.1
+# 通知的槽位正在写入时, 隔多久(秒)再读, 最多再读几次
+STALE_RETRY_INTERVAL = 0.05
+STALE_RETRIES = 100
+
+
+class _NotifyProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self._client = client
+
+    def datagram_received(self, data, address):
+        self._client.handle_notification(data)
+
+    def error_received(self, exc):
+        logger.warning(f'Error received: {exc}')
+
+
+class SidecarClient:
+    def __init__(self, table_name, notify_address, command_address, loop=None):
+        self._table_name = table_name
+        self._notify_address = tuple(notify_address)
+        self._command_address = tuple(command_address)
+        self._loop = loop or asyncio.get_event_loop()
+        self._table = None
+        self._notify_transport = None
+        self._command_transport = None
+        # key -> [callback(key, state), ...]
+        self._callbacks = {}
+
+    async def start(self, timeout=0):
+        """ 先开始接收通知再打开状态表
+
+        timeout是等待sidecar创建状态表的最长时间(秒), 刚启动sidecar进程时使用
+        """
+        (self._notify_transport, _) = await self._loop.create_datagram_endpoint(
+            lambda: _NotifyProtocol(self), local_addr=self._notify_address)
+        (self._command_transport, _) = await self._loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=self._command_address)
+        deadline = self._loop.time() + timeout
+        while True:
+            try:
+                self._table = StateTable.attach(self._table_name)
+                return
+            except (FileNotFoundError, ValueError):
+                # 还没有创建, 或者已经创建但还没有写入表头
+                if self._loop.time() >= deadline:
+                    await self.stop()
+                    raise
+            await asyncio.sleep(ATTACH_INTERVAL)
+
+    async def stop(self):
+        for transport in (self._notify_transport, self._command_transport):
+            if transport:
+                transport.close()
+        self._notify_transport = self._command_transport = None
+        if self._table:
+            self._table.close()
+            self._table = None
+
+    @property
+    def connected(self):
+        return self._table is not None
+
+    @staticmethod
+    def _table_key(key):
+        kind, subnet, device, channel = key
+        return KIND_IDS[kind], subnet, device, channel
+
+    def register_callback(self, key, callback):
+        self._callbacks.setdefault(self._table_key(key), []).append(callback)
+
+    def unregister_callback(self, key, callback):
+        callbacks = self._callbacks.get(self._table_key(key))
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    @staticmethod
+    def _state_of(entry):
+        key, values, updated = entry
+        kind = kind_of(key[0])
+        if kind is None:
+            return None
+        state = {field: kind.decode(field, value) for field, value in zip(kind.fields, values)}
+        state["kind"] = kind.name
+        state["updated"] = updated
+        return state
+
+    def get_state(self, key):
+        """ 返回 {属性: 值, "kind": 类型, "updated": 更新时间}, 没有这个设备时返回None """
+        if self._table is None:
+            return None
+        entry = self._table.read(self._table_key(key))
+        return None if entry is None else self._state_of(entry)
+
+    def is_stale(self, key):
+        """ 设备的槽位正在写入, 状态是之前的快照 """
+        if self._table is None:
+            return False
+        slot = self._table.find(self._table_key(key))
+        return slot is not None and self._table.is_stale(slot)
+
+    def handle_notification(self, data):
+        if self._table is None:
+            return
+        for (slot,) in NOTIFY_SLOT.iter_unpack(data[: len(data) - len(data) % NOTIFY_SLOT.size]):
+            if slot < self._table.capacity:
+                self._read_notified_slot(slot, STALE_RETRIES)
+
+    def _read_notified_slot(self, slot, retries):
+        if self._table is None:
+            return
+        entry = self._table.read_slot(slot)
+        if self._table.is_stale(slot) and retries > 0:
+            # 不在事件循环中等待写入完成, 过一会儿再读
+            self._loop.call_later(STALE_RETRY_INTERVAL, self._read_notified_slot, slot, retries - 1)
+        if entry is None:
+            return
+        callbacks = self._callbacks.get(entry[0])
+        if not callbacks:
+            return
+        # 过期时也回调, 让设备更新可用状态
+        state = self._state_of(entry)
+        key = (state["kind"], *entry[0][1:])
+        for callback in list(callbacks):
+            callback(key, state)
+
+    def _send(self, message):
+        if self._command_transport is None:
+            logger.warning("Could not send command. The sidecar client is not started.")
+            return
+        self._command_transport.sendto(json.dumps(message).encode())
+
+    def send_command(self, key, command, *args):
+        self._send({"key": list(key), "command": command, "args": [to_int(arg) for arg in args]})
+
+    def add_device(self, kind, device_address, channel=0, options=None):
+        """ 让sidecar创建设备, 已经有的设备会重新通知一次状态 """
+        self._send({"add": {"kind": kind, "address": list(device_address), "channel": channel or 0,
+                            "options": dict(options or {})}})
+
+    def send_telegram(self, device_address, operate_code, payload):
+        """ 通过sidecar发送任意报文, operate_code是2字节的列表 """
+        self._send({"send": {"address": list(device_address), "operate_code": list(operate_code),
+                             "payload": list(payload)}})
+
+
+class SidecarDevice:
+    """ sidecar中一个设备的代理, 属性和命令跟pybuspro中的设备同名, HA的平台可以直接替换使用
+
+    状态从状态表读取, 命令发给sidecar执行; 更新回调跟Device一样是 callback(device, changed_fields)
+    """
+
+    def __init__(self, client, kind, device_address, channel=0, options=None):
+        self._client = client
+        self._kind = KINDS[kind]
+        self._key = (kind, device_address[0], device_address[1], channel or 0)
+        self._state = client.get_state(self._key) or {}
+        self._device_updated_cbs = []
+        client.register_callback(self._key, self._state_changed)
+        client.add_device(kind, device_address, channel, options)
+
+    def __getattr__(self, name):
+        # 只有找不到普通属性时才会调用
+        kind = self.__dict__.get("_kind")
+        if kind is not None:
+            if name in kind.fields:
+                return self._state.get(name)
+            if name in kind.commands:
+                async def _command(*args):
+                    self._client.send_command(self._key, name, *args)
+                return _command
+        raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def is_connected(self):
+        # 状态表中的槽位一直在写入时, 状态只是之前的快照, 设备不可用
+        return self._client.connected and not self._client.is_stale(self._key)
+
+    def _state_changed(self, key, state):
+        self._state = state
+        if self._device_updated_cbs:
+            asyncio.ensure_future(self._device_updated())
+
+    async def _device_updated(self):
+        # 状态表中不区分哪些属性变化了
+        for device_updated_cb in list(self._device_updated_cbs):
+            await device_updated_cb(self, None)
+
+    def register_device_updated_cb(self, device_updated_cb):
+        self._device_updated_cbs.append(device_updated_cb)
+
+    def unregister_device_updated_cb(self, device_updated_cb):
+        if device_updated_cb in self._device_updated_cbs:
+            self._device_updated_cbs.remove(device_updated_cb)
+
+    def close(self):
+        self._client.unregister_callback(self._key, self._state_changed)
+        self._device_updated_cbs.clear()
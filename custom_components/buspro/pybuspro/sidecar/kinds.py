@@ -0,0 +1,165 @@
+''' sidecar支持的设备类型: 怎样创建设备, 状态表中保存哪些属性, 允许哪些命令
+
+sidecar和读取状态表的进程使用同一份定义, 状态表中只保存类型编号和整数值。
+'''
+
+from ..enums import BaseEnum, AirConditionMode, FanMode, PresetMode, TemperatureType
+from ..devices import Light, UniversalSwitch, Sensor, AirCondition, FloorHeating
+
+
+class DeviceKind:
+    def __init__(self, name, factory, fields, commands, decoders=None, read=None, shared=False):
+        self.name = name
+        # factory(buspro, device_address, channel, options) -> 设备
+        self.factory = factory
+        # 状态表中依次保存的设备属性
+        self.fields = fields
+        # 命令(设备的方法名) -> 每个参数的转换函数, 所有设备都可以用poll读取当前状态
+        self.commands = {"poll": (), **commands}
+        # 属性 -> 把状态表中的整数转换回设备属性的函数, 没有的属性直接使用整数
+        self.decoders = decoders or {}
+        # read(device, channel) -> 按fields顺序的值, 默认读取设备的同名属性
+        self._read = read
+        # factory返回同一地址共用的设备(Sensor.shared), 再次添加时重新调用factory更新选项(如传感器的设备类型)
+        self.shared = shared
+
+    def read(self, device, channel):
+        if self._read:
+            return self._read(device, channel)
+        return [getattr(device, field) for field in self.fields]
+
+    def decode(self, field, value):
+        decoder = self.decoders.get(field)
+        return value if value is None or decoder is None else decoder(value)
+
+
+def _sensor(buspro, device_address, channel, options):
+    # 同一地址的传感器共用一个设备; 按编号的二进制传感器使用sensor_*类型
+    sensor = Sensor.shared(buspro, device_address)
+    sensor.set_device(options.get("device"))
+    sensor.bind_sensor()
+    return sensor
+
+
+def _numbered_sensor(bind):
+    """ 按编号登记的二进制传感器(通用开关、通道、干接点), channel是编号 """
+    def _factory(buspro, device_address, channel, options):
+        sensor = Sensor.shared(buspro, device_address)
+        getattr(sensor, bind)(channel)
+        return sensor
+    return _factory
+
+
+_ON_OFF = {"is_on": bool}
+_SENSOR_COMMANDS = {"read_sensor_status": ()}
+
+
+DEVICE_KINDS = (
+    DeviceKind(
+        "light",
+        lambda buspro, device_address, channel, options: Light(buspro, device_address, channel, **options),
+        ("current_brightness", "is_on", "supports_brightness", "previous_brightness"),
+        {"set_on": (), "set_off": (), "set_brightness": (int,)},
+        {"is_on": bool, "supports_brightness": bool},
+    ),
+    DeviceKind(
+        "universal_switch",
+        lambda buspro, device_address, channel, options: UniversalSwitch(buspro, device_address, channel),
+        ("is_on",),
+        {"set_on": (), "set_off": ()},
+        _ON_OFF,
+    ),
+    DeviceKind(
+        "sensor",
+        _sensor,
+        ("temperature", "brightness", "movement", "dry_contact_1_is_on", "dry_contact_2_is_on"),
+        _SENSOR_COMMANDS,
+        {"movement": bool, "dry_contact_1_is_on": bool, "dry_contact_2_is_on": bool},
+        shared=True,
+    ),
+    DeviceKind(
+        "sensor_universal_switch",
+        _numbered_sensor("bind_universal_switch"),
+        ("is_on",),
+        _SENSOR_COMMANDS,
+        _ON_OFF,
+        lambda device, number: [device.is_universal_switch_on(number)],
+        shared=True,
+    ),
+    DeviceKind(
+        "sensor_channel",
+        _numbered_sensor("bind_channel"),
+        ("is_on",),
+        _SENSOR_COMMANDS,
+        _ON_OFF,
+        lambda device, number: [device.is_channel_on(number)],
+        shared=True,
+    ),
+    DeviceKind(
+        "sensor_dry_contact",
+        _numbered_sensor("bind_dry_contact"),
+        ("is_on",),
+        _SENSOR_COMMANDS,
+        _ON_OFF,
+        lambda device, number: [device.is_dry_contact_on(number)],
+        shared=True,
+    ),
+    DeviceKind(
+        "air_condition",
+        lambda buspro, device_address, channel, options: AirCondition(buspro, device_address, channel),
+        ("is_on", "mode", "fan_mode", "target_temperature", "current_temperature", "unit_of_measurement"),
+        {
+            "async_turn_on": (),
+            "async_turn_off": (),
+            "async_set_mode": (AirConditionMode.value_of,),
+            "async_set_fan_mode": (FanMode.value_of,),
+            "async_set_target_temperature": (int,),
+        },
+        {
+            "is_on": bool,
+            "mode": AirConditionMode.value_of,
+            "fan_mode": FanMode.value_of,
+            "unit_of_measurement": TemperatureType.value_of,
+        },
+    ),
+    DeviceKind(
+        "floor_heating",
+        lambda buspro, device_address, channel, options: FloorHeating(buspro, device_address, channel),
+        ("is_on", "preset_mode", "target_temperature", "current_temperature", "unit_of_measurement", "mode"),
+        {
+            "async_turn_on": (),
+            "async_turn_off": (),
+            "async_set_preset_mode": (PresetMode.value_of,),
+            "async_set_target_temperature": (int,),
+            # 设置hvac模式时调用, 地暖只有制热
+            "async_set_mode": (AirConditionMode.value_of,),
+        },
+        {
+            "is_on": bool,
+            "preset_mode": PresetMode.value_of,
+            "unit_of_measurement": TemperatureType.value_of,
+            "mode": AirConditionMode.value_of,
+        },
+    ),
+)
+
+# 状态表中的类型编号从1开始, 0表示没有使用
+KIND_IDS = {kind.name: index for index, kind in enumerate(DEVICE_KINDS, 1)}
+KINDS = {kind.name: kind for kind in DEVICE_KINDS}
+
+
+def kind_of(kind_id):
+    return DEVICE_KINDS[kind_id - 1] if 0 < kind_id <= len(DEVICE_KINDS) else None
+
+
+def to_int(value):
+    """ 设备属性 -> 状态表中的整数, 不能表示的值为None """
+    if isinstance(value, BaseEnum):
+        value = value.value
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return round(value)
+    return None
@@ -0,0 +1,225 @@
+''' 在单独的进程中运行整个pybuspro(收发、解码、分发、轮询), 把设备状态写入共享内存的状态表
+
+状态变化后把变化的槽位号通过本机UDP通知读取的进程; 读取的进程通过另一个UDP端口发送命令(JSON):
+    设备的命令: {"key": ["light", 子网, 设备, 通道], "command": "set_brightness", "args": [50]}
+    添加设备:   {"add": {"kind": "light", "address": [1, 74], "channel": 1, "options": {...}}}
+    发送报文:   {"send": {"address": [1, 74], "operate_code": [0, 49], "payload": [1, 100, 0, 0]}}
+'''
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import struct
+
+from ..buspro import Buspro
+from ..devices.generic import Generic
+from ..enums import OperateCode
+from .kinds import DEVICE_KINDS, KIND_IDS, to_int
+from .state_table import StateTable, DEFAULT_CAPACITY
+
+logger = logging.getLogger(__name__)
+
+# 通知报文: 变化的槽位号列表
+NOTIFY_SLOT = struct.Struct("<I")
+# 一个通知报文最多包含的槽位数, 保持在一个UDP报文内
+NOTIFY_BATCH_SIZE = 256
+
+
+class SidecarConfig(dict):
+    """ sidecar的配置, 可以直接传给spawn的进程
+
+    gateway_address / local_address: 跟Buspro一样
+    table_name / table_capacity: 共享内存状态表
+    notify_address: 读取进程接收变化通知的地址
+    command_address: sidecar接收命令的地址
+    devices: [{"kind": "light", "address": [1, 74], "channel": 1, "options": {...}}, ...], 也可以运行时添加
+    buspro_options: 传给Buspro的其它参数
+    state_updater: 是否定时轮询状态过期的设备
+    """
+    def __init__(self, gateway_address, local_address, table_name, notify_address, command_address,
+                 devices=(), table_capacity=DEFAULT_CAPACITY, buspro_options=None, state_updater=True):
+        super().__init__(
+            gateway_address=tuple(gateway_address),
+            local_address=tuple(local_address),
+            table_name=table_name,
+            table_capacity=table_capacity,
+            notify_address=tuple(notify_address),
+            command_address=tuple(command_address),
+            devices=[dict(device) for device in devices],
+            buspro_options=dict(buspro_options or {}),
+            state_updater=state_updater,
+        )
+
+
+class _CommandProtocol(asyncio.DatagramProtocol):
+    def __init__(self, sidecar):
+        self._sidecar = sidecar
+
+    def datagram_received(self, data, address):
+        self._sidecar.handle_command(data)
+
+    def error_received(self, exc):
+        logger.warning(f'Error received: {exc}')
+
+
+class Sidecar:
+    def __init__(self, config, loop=None):
+        self._config = config
+        self._loop = loop or asyncio.get_event_loop()
+        self._buspro = None
+        self._table = None
+        self._command_transport = None
+        self._notify_transport = None
+        # key(类型编号, 子网, 设备, 通道) -> (设备, 类型); 设备 -> [(槽位号, key), ...]
+        self._devices = {}
+        self._device_slots = {}
+        self._pending_slots = set()
+        self._notify_handle = None
+
+    @property
+    def buspro(self):
+        return self._buspro
+
+    @property
+    def table(self):
+        return self._table
+
+    async def start(self):
+        config = self._config
+        self._table = StateTable.create(config["table_name"], config["table_capacity"])
+        self._buspro = Buspro(config["gateway_address"], config["local_address"], self._loop, **config["buspro_options"])
+        await self._buspro.start(state_updater=config["state_updater"])
+
+        for device_config in config["devices"]:
+            self.add_device(device_config)
+
+        (self._notify_transport, _) = await self._loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=config["notify_address"])
+        (self._command_transport, _) = await self._loop.create_datagram_endpoint(
+            lambda: _CommandProtocol(self), local_addr=config["command_address"])
+
+    async def stop(self):
+        if self._notify_handle:
+            self._notify_handle.cancel()
+            self._notify_handle = None
+        for transport in (self._command_transport, self._notify_transport):
+            if transport:
+                transport.close()
+        self._command_transport = self._notify_transport = None
+        if self._buspro:
+            await self._buspro.stop()
+            self._buspro = None
+        if self._table:
+            self._table.close()
+            self._table = None
+
+    def add_device(self, device_config):
+        kind_id = KIND_IDS[device_config["kind"]]
+        kind = DEVICE_KINDS[kind_id - 1]
+        address = tuple(device_config["address"])
+        channel = device_config.get("channel") or 0
+        key = (kind_id, address[0], address[1], channel)
+
+        existing = self._devices.get(key)
+        if existing is not None:
+            # 读取进程重新加载或者多个实体使用同一个设备时会再次添加, 只需要再通知一次当前状态
+            if kind.shared:
+                kind.factory(self._buspro, address, channel, device_config.get("options") or {})
+            self._publish(existing[0])
+            return existing[0]
+
+        device = kind.factory(self._buspro, address, channel, device_config.get("options") or {})
+        slot = self._table.allocate(key)
+        self._devices[key] = (device, kind)
+        slots = self._device_slots.get(device)
+        if slots is None:
+            # 共用的设备(如Sensor.shared)只注册一次回调
+            slots = self._device_slots[device] = []
+            device.register_device_updated_cb(self._device_updated)
+        slots.append((slot, key))
+        self._publish(device)
+        return device
+
+    async def _device_updated(self, device, changed_fields=None):
+        self._publish(device)
+
+    def _publish(self, device):
+        for slot, key in self._device_slots.get(device, ()):
+            kind = DEVICE_KINDS[key[0] - 1]
+            self._table.write(slot, key, [to_int(value) for value in kind.read(device, key[3])])
+            self._pending_slots.add(slot)
+        # 同一轮事件循环中的变化合并成一个通知
+        if self._pending_slots and self._notify_handle is None:
+            self._notify_handle = self._loop.call_soon(self._notify)
+
+    def _notify(self):
+        self._notify_handle = None
+        slots, self._pending_slots = sorted(self._pending_slots), set()
+        if not self._notify_transport:
+            return
+        for i in range(0, len(slots), NOTIFY_BATCH_SIZE):
+            batch = slots[i: i + NOTIFY_BATCH_SIZE]
+            self._notify_transport.sendto(b"".join(NOTIFY_SLOT.pack(slot) for slot in batch))
+
+    def handle_command(self, data):
+        try:
+            command = json.loads(data)
+            if "add" in command:
+                self.add_device(command["add"])
+                return
+            if "send" in command:
+                coroutine = self._send(**command["send"])
+            else:
+                kind_name, *address = command["key"]
+                name = command["command"]
+                args = command.get("args") or []
+                device, kind = self._devices[(KIND_IDS[kind_name], *address)]
+                converters = kind.commands[name]
+                if len(args) != len(converters):
+                    raise ValueError(f"{name} takes {len(converters)} arguments")
+                args = [converter(arg) for converter, arg in zip(converters, args)]
+                coroutine = getattr(device, name)(*args)
+        except (ValueError, KeyError, TypeError) as ex:
+            logger.warning(f"Invalid sidecar command {data!r}: {ex}")
+            return
+        asyncio.ensure_future(coroutine, loop=self._loop)
+
+    def _send(self, address, operate_code, payload):
+        """ 跟send_message服务一样发送任意报文 """
+        operate_code = OperateCode.value_of(bytes(operate_code))
+        if operate_code is None:
+            raise ValueError("Unknown operate code")
+        return Generic(self._buspro, tuple(address), list(payload), operate_code).run()
+
+
+async def _run(config):
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopped.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    sidecar = Sidecar(config, loop)
+    await sidecar.start()
+    try:
+        await stopped.wait()
+    finally:
+        await sidecar.stop()
+
+
+def run_sidecar(config):
+    """ sidecar进程的入口, 收到SIGTERM后退出并删除状态表 """
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(config))
+
+
+def start_sidecar_process(config):
+    """ 用spawn启动sidecar进程, 不继承HA进程中的事件循环和线程 """
+    process = multiprocessing.get_context("spawn").Process(target=run_sidecar, args=(config,),
+                                                           name="buspro-sidecar", daemon=True)
+    process.start()
+    return process
@@ -0,0 +1,125 @@
+''' 本机模拟的HDL网关: 不需要真实的总线就可以测试sidecar(或Buspro)
+
+模拟的模块按地址保存通道亮度、通用开关和传感器的值, 回答读取和控制报文; 也可以主动广播状态。
+'''
+
+import asyncio
+import logging
+
+from ..enums import OperateCode, SuccessOrFailure
+from ..telegram import (ReadStatusOfChannelsResponseData, SingleChannelControlResponseData,
+                        ReadStatusOfUniversalSwitchResponseData, UniversalSwitchControlResponseData,
+                        ReadSensorStatusResponseData, Telegram)
+from ..transport.network_interface import NetworkInterface
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedModule:
+    def __init__(self, address, channel_count=0, switch_count=0):
+        self.address = tuple(address)
+        self.channels = [0] * channel_count
+        self.switches = [0] * switch_count
+        # 传感器的原始值, 温度跟真实模块一样加了20
+        self.temperature = 45
+        self.brightness = 0
+        self.motion = 0
+
+
+class GatewaySimulator:
+    """ client_address是Buspro绑定的地址, 模拟网关绑定local_address """
+
+    def __init__(self, local_address, client_address, loop=None):
+        self._net = NetworkInterface(tuple(client_address), tuple(local_address), self._telegram_received, loop)
+        self._modules = {}
+        self._handlers = {
+            OperateCode.ReadStatusOfChannels: self._read_channels,
+            OperateCode.SingleChannelControl: self._control_channel,
+            OperateCode.ReadStatusOfUniversalSwitch: self._read_switch,
+            OperateCode.UniversalSwitchControl: self._control_switch,
+            OperateCode.ReadSensorStatus: self._read_sensor,
+        }
+        self.received = []
+
+    def add_module(self, address, channel_count=0, switch_count=0):
+        module = self._modules[tuple(address)] = SimulatedModule(address, channel_count, switch_count)
+        return module
+
+    def module(self, address):
+        return self._modules[tuple(address)]
+
+    async def start(self):
+        await self._net.start()
+
+    async def stop(self):
+        await self._net.stop()
+
+    def _telegram_received(self, telegram):
+        telegram = telegram.toControl()
+        self.received.append(telegram)
+        module = self._modules.get(tuple(telegram.target_address))
+        handler = self._handlers.get(telegram.operate_code)
+        if module is None or handler is None:
+            return
+        response = handler(module, telegram)
+        if response is not None:
+            self._send(module, response, telegram.source_address)
+
+    def _send(self, module, response, target_address):
+        response.source_address = module.address
+        response.target_address = target_address
+        asyncio.ensure_future(self._net.send_telegram(response))
+
+    async def send_telegram(self, telegram):
+        await self._net.send_telegram(telegram)
+
+    def _read_channels(self, module, telegram):
+        response = ReadStatusOfChannelsResponseData()
+        response.payload = [len(module.channels)] + module.channels
+        return response
+
+    def _control_channel(self, module, telegram):
+        number = telegram._channel_number
+        if not 0 < number <= len(module.channels):
+            return None
+        module.channels[number - 1] = telegram._channel_status
+        response = SingleChannelControlResponseData()
+        response._channel_number = number
+        response._success = SuccessOrFailure.Success.value[0]
+        response._channel_status = telegram._channel_status
+        return response
+
+    def _read_switch(self, module, telegram):
+        response = ReadStatusOfUniversalSwitchResponseData()
+        number = telegram._switch_number
+        if number is None:
+            # 批量读取
+            response.payload = [len(module.switches)] + module.switches
+        elif 0 < number <= len(module.switches):
+            response._switch_number = number
+            response._switch_status = module.switches[number - 1]
+        else:
+            return None
+        return response
+
+    def _control_switch(self, module, telegram):
+        number = telegram._switch_number
+        if not 0 < number <= len(module.switches):
+            return None
+        module.switches[number - 1] = 1 if telegram._switch_status else 0
+        response = UniversalSwitchControlResponseData()
+        response._switch_number = number
+        response._switch_status = module.switches[number - 1]
+        return response
+
+    def _read_sensor(self, module, telegram):
+        response = ReadSensorStatusResponseData()
+        response._success = SuccessOrFailure.Success.value[0]
+        response._current_temperature = module.temperature
+        response._brightness_high = module.brightness >> 8
+        response._brightness_low = module.brightness & 0xFF
+        response._motion_sensor = module.motion
+        response._sonic = 0
+        response._dry_contact_1_status = 0
+        response._dry_contact_2_status = 0
+        return response
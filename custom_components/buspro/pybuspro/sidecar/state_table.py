@@ -0,0 +1,164 @@
+''' 共享内存中的设备状态表: 按(类型, 子网, 设备, 通道)定长存放每个设备的状态
+
+只有sidecar进程写入, 其它进程(HA)只读。每个槽位用seqlock保护: 写入前把序号加1(奇数),
+写完再加1(偶数); 读取时序号是奇数或前后两次读到的序号不同就重读, 读者不需要加锁。
+'''
+
+import struct
+import time
+from multiprocessing import shared_memory
+
+MAGIC = 0x48444C53  # "HDLS"
+VERSION = 1
+DEFAULT_CAPACITY = 1024
+FIELD_COUNT = 8
+# 没有值(None)时存的数
+NONE_VALUE = -2 ** 31
+
+# 表头: magic, version, capacity, field_count
+_HEADER = struct.Struct("<IIII")
+_SEQ = struct.Struct("<I")
+# 槽位: seq, used, kind, subnet, device, channel, 保留, values, 更新时间(time.time())
+_SLOT = struct.Struct(f"<IBBBBHH{FIELD_COUNT}id")
+_BODY_OFFSET = _SEQ.size
+_BODY = struct.Struct(f"<BBBBHH{FIELD_COUNT}id")
+
+# 读者重试的次数, 写入很快, 正常情况下最多重读一两次; 读者在HA的事件循环中, 不能长时间等待
+READ_RETRIES = 100
+
+
+class StateTable:
+    """ 开放寻址的哈希表, 槽位分配后不会删除, 槽位号可以用来通知变化 """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self._owner = owner
+        self._buf = shm.buf
+        magic, version, capacity, field_count = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION or field_count != FIELD_COUNT:
+            raise ValueError(f"{shm.name} is not a buspro state table")
+        self._capacity = capacity
+        # 本进程中 key -> 槽位号 的缓存, 槽位不会被删除所以缓存一直有效
+        self._slots = {}
+        # 槽位号 -> 上一次读到的内容, 以及最近一次没有读到一致内容的槽位
+        self._snapshots = {}
+        self._stale = set()
+
+    @classmethod
+    def create(cls, name=None, capacity=DEFAULT_CAPACITY):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER.size + capacity * _SLOT.size)
+        shm.buf[:] = bytes(shm.size)
+        _HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, capacity, FIELD_COUNT)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.13以前打开已有的共享内存也会被resource_tracker登记; start_sidecar_process启动的
+            # sidecar跟这个进程共用resource_tracker, sidecar删除状态表时会一起取消登记
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _offset(self, slot):
+        return _HEADER.size + slot * _SLOT.size
+
+    def _probe(self, key):
+        # key中包含类型, 同一地址和通道上不同类型的设备(如继电器通道的灯和通道状态)各占一个槽位
+        kind, subnet, device, channel = key
+        start = (((kind * 257 + subnet) * 257 + device) * 65537 + channel) % self._capacity
+        for i in range(self._capacity):
+            yield (start + i) % self._capacity
+
+    def find(self, key):
+        """ 返回key的槽位号, 没有时返回None """
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        for slot in self._probe(key):
+            entry = self.read_slot(slot)
+            if entry is None:
+                return None
+            if entry[0] == key:
+                self._slots[key] = slot
+                return slot
+        return None
+
+    def allocate(self, key):
+        """ (只在写入进程中调用)返回key的槽位号, 没有时分配一个 """
+        slot = self.find(key)
+        if slot is not None:
+            return slot
+        for slot in self._probe(key):
+            if self.read_slot(slot) is None:
+                self.write(slot, key, ())
+                self._slots[key] = slot
+                return slot
+        raise MemoryError(f"State table {self.name} is full")
+
+    def write(self, slot, key, values):
+        """ (只在写入进程中调用)写入一个槽位, values少于FIELD_COUNT时后面的字段为None """
+        values = tuple(NONE_VALUE if value is None else value for value in values)
+        values += (NONE_VALUE,) * (FIELD_COUNT - len(values))
+        offset = self._offset(slot)
+        buf = self._buf
+        (seq,) = _SEQ.unpack_from(buf, offset)
+        _SEQ.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF)
+        _BODY.pack_into(buf, offset + _BODY_OFFSET, 1, *key, 0, *values, time.time())
+        _SEQ.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def read_slot(self, slot):
+        """ 返回 (key, values, 更新时间), 槽位没有使用时返回None
+
+        重试READ_RETRIES次仍然在写入(如写入进程在写入中途被挂起)时不等待, 返回上一次读到的内容
+        (没有时返回None), 并把槽位标记为过期, 见is_stale
+        """
+        offset = self._offset(slot)
+        buf = self._buf
+        for _ in range(READ_RETRIES):
+            (seq,) = _SEQ.unpack_from(buf, offset)
+            if seq & 1:
+                continue
+            body = _BODY.unpack_from(buf, offset + _BODY_OFFSET)
+            if _SEQ.unpack_from(buf, offset)[0] == seq:
+                break
+        else:
+            self._stale.add(slot)
+            return self._snapshots.get(slot)
+
+        self._stale.discard(slot)
+        used, kind, subnet, device, channel, _, *values, updated = body
+        if not used:
+            return None
+        values = [None if value == NONE_VALUE else value for value in values]
+        entry = self._snapshots[slot] = ((kind, subnet, device, channel), values, updated)
+        return entry
+
+    def is_stale(self, slot):
+        """ 最近一次read_slot没有读到一致的内容, 返回的是之前的快照 """
+        return slot in self._stale
+
+    def read(self, key):
+        slot = self.find(key)
+        return None if slot is None else self.read_slot(slot)
+
+    def __iter__(self):
+        for slot in range(self._capacity):
+            entry = self.read_slot(slot)
+            if entry is not None:
+                yield slot, entry
@@ -1,21 +1,124 @@
 ﻿import json
-import inspect
 from .enums import DeviceType, OperateCode, BaseEnum
 
 
+class Field:
+    """ payload中的一个字段: 名称, 字节数, 是否有符号 """
+    __slots__ = ("name", "width", "signed", "default")
+
+    def __init__(self, name, width=1, signed=False, default=None):
+        self.name = name
+        self.width = width
+        self.signed = signed
+        self.default = default
+
+    def encode(self, value):
+        if value is None:
+            # 在这里报错, 否则要到拼接发送数据时才失败, 看不出是哪个字段
+            raise ValueError(f"Field {self.name} is not set")
+        if self.width == 1 and not self.signed:
+            return (value,)
+        return value.to_bytes(self.width, "big", signed=self.signed)
+
+    def decode(self, payload, offset):
+        if self.width == 1 and not self.signed:
+            return payload[offset]
+        return int.from_bytes(bytes(payload[offset: offset + self.width]), "big", signed=self.signed)
+
+
+class _FieldDescriptor:
+    """ 字段第一次被读取时才从payload中解码，之后缓存在slot中 """
+    __slots__ = ("field", "offset", "storage")
+
+    def __init__(self, field, offset, storage):
+        self.field = field
+        self.offset = offset
+        self.storage = storage
+
+    def __get__(self, telegram, owner=None):
+        if telegram is None:
+            return self
+        try:
+            return self.storage.__get__(telegram, owner)
+        except AttributeError:
+            pass
+
+        field = self.field
+        payload = telegram._payload
+        if payload is not None and self.offset + field.width <= len(payload):
+            value = field.decode(payload, self.offset)
+        else:
+            value = field.default
+        self.storage.__set__(telegram, value)
+        return value
+
+    def __set__(self, telegram, value):
+        self.storage.__set__(telegram, value)
+
+
+# 操作码 -> Control类，在定义类时注册
+_CONTROL_REGISTRY = {}
+
+class TelegramType(type):
+    """ 根据类的SCHEMA生成__slots__和字段描述符，并按OPERATE_CODE注册 """
+    def __new__(mcs, name, bases, namespace):
+        schema = tuple(namespace.get("SCHEMA", ()))
+        namespace["SCHEMA"] = schema
+        namespace["_field_names"] = tuple(field.name for field in schema)
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + tuple(f"_slot{field.name}" for field in schema)
+
+        telegram_class = super().__new__(mcs, name, bases, namespace)
+
+        offset = 0
+        for field in schema:
+            storage = telegram_class.__dict__[f"_slot{field.name}"]
+            setattr(telegram_class, field.name, _FieldDescriptor(field, offset, storage))
+            offset += field.width
+
+        operate_code = namespace.get("OPERATE_CODE")
+        if operate_code is not None:
+            _CONTROL_REGISTRY[operate_code] = telegram_class
+        return telegram_class
+
+
 # DTO class
-class Telegram:
+class Telegram(metaclass=TelegramType):
+    __slots__ = ("source_address", "source_device_type", "operate_code", "target_address", "_payload", "crc")
+    OPERATE_CODE = None
+    # 用来匹配请求和应答的字段(如通道号), 请求和应答中同名字段的值相同
+    KEY_FIELDS = ()
+
     def __init__(self, device_address:(int,int)=None):
         self.source_address = (253, 254)
         self.source_device_type = DeviceType.PyBusPro
-        self.operate_code:OperateCode = None
+        self.operate_code:OperateCode = self.OPERATE_CODE
         self.target_address = device_address
         self._payload = None
         self.crc = None
 
+    @staticmethod
+    def from_header(source_address, source_device_type, operate_code, target_address, payload, crc=None):
+        """ 收到的报文: 报文头立即可用, payload(可以是memoryview)中的字段在第一次读取时才解码 """
+        telegram_class = _CONTROL_REGISTRY.get(operate_code, Telegram)
+        telegram = telegram_class.__new__(telegram_class)
+        telegram.source_address = source_address
+        telegram.source_device_type = source_device_type
+        telegram.operate_code = operate_code
+        telegram.target_address = target_address
+        telegram._payload = payload
+        telegram.crc = crc
+        return telegram
+
+    def _as_dict(self):
+        _dict = {name: getattr(self, name) for name in Telegram.__slots__}
+        _dict["_payload"] = self.payload if self._payload is not None else None
+        for name in self._field_names:
+            _dict[name] = getattr(self, name)
+        return _dict
+
     def __str__(self):
         """Return object as readable string."""
-        _dict = vars(self)
+        _dict = self._as_dict()
 
         def _enum_encoder(obj):
             if isinstance(obj, BaseEnum):
@@ -29,323 +132,354 @@ class Telegram:
 
     def __eq__(self, other):
         """Equal operator."""
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, Telegram):
+            return NotImplemented
+        return self._as_dict() == other._as_dict()
     
     @property
     def payload(self):
         # 这个属性只读，只能设置一次
         if self._payload is not None:
+            if type(self._payload) is memoryview:
+                self._payload = self._payload.tolist()
             return self._payload
 
-        self._payload = []
-        member_dict = vars(self)
-        # 遍历成员及其值
-        for member, value in member_dict.items():
-            if member.startswith("_") and member != "_payload":
-                self._payload.append(value)
+        payload = []
+        # 按SCHEMA的顺序编码各字段
+        for field in self.SCHEMA:
+            payload.extend(field.encode(getattr(self, field.name)))
+        self._payload = payload
         return self._payload
     
     @payload.setter
     def payload(self, new_value):
         self._payload = new_value
 
+    def detach_payload(self):
+        """ payload是指向接收缓冲区的memoryview时复制出来, 缓冲区被重用后报文仍然可以读取 """
+        if type(self._payload) is memoryview:
+            self._payload = self._payload.tolist()
+
+    @property
+    def field_names(self):
+        return self._field_names
+
+    @property
+    def match_key(self):
+        return tuple(getattr(self, name) for name in self.KEY_FIELDS)
+
     def toControl(self):        
-        if self.operate_code is None:
+        if self.operate_code is None or type(self) is not Telegram:
             return self
 
-        # 根据操作类型找出属于哪个Control类
-        control = None
-        class_name = f"{self.operate_code.name}Data"
-        # 获取当前模块中定义的所有对象        
-        objects = globals().values() 
-        classes = [obj for obj in objects if inspect.isclass(obj)]        
-        for clas in classes:
-            if clas.__name__ == class_name:
-                control = clas(self.target_address)
-                break        
-        
-        if control:
-            # 字段赋值
-            control.source_address = self.source_address
-            control.source_device_type = self.source_device_type
-            control._payload = self._payload
-            control.crc = self.crc
-            # payload字段赋值
-            index = 0
-            member_dict = vars(control)
-            for member in member_dict.keys():
-                if member.startswith("_") and member != "_payload":
-                    if index < len(control._payload):
-                        member_dict[member] = control._payload[index]
-                    index += 1
-        
-        return control if control else self
+        # 根据操作类型找出属于哪个Control类, payload字段在读取时解码
+        if self.operate_code not in _CONTROL_REGISTRY:
+            return self
+        return Telegram.from_header(self.source_address, self.source_device_type, self.operate_code,
+                                    self.target_address, self._payload, self.crc)
 
 class ReadStatusOfChannelsData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadStatusOfChannels
+    OPERATE_CODE = OperateCode.ReadStatusOfChannels
 class ReadStatusOfChannelsResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadStatusOfChannelsResponse
-        self._channel_count = 0
+    OPERATE_CODE = OperateCode.ReadStatusOfChannelsResponse
+    SCHEMA = (
+        Field("_channel_count", default=0),
+    )
     def get_status(self, channel):
-        return self._payload[channel] if channel < self._channel_count else None
+        # payload[0]是通道数, 之后依次是第1..N个通道的状态
+        return self._payload[channel] if 0 < channel <= self._channel_count else None
 
 class SingleChannelControlData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.SingleChannelControl
-        self._channel_number = None
-        self._channel_status = None
-        self._running_time_minutes = None
-        self._running_time_seconds = None
+    OPERATE_CODE = OperateCode.SingleChannelControl
+    KEY_FIELDS = ("_channel_number",)
+    SCHEMA = (
+        Field("_channel_number"),
+        Field("_channel_status"),
+        Field("_running_time_minutes"),
+        Field("_running_time_seconds"),
+    )
 class SingleChannelControlResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.SingleChannelControlResponse
-        self._channel_number = None
-        self._success = None
-        self._channel_status = None
+    OPERATE_CODE = OperateCode.SingleChannelControlResponse
+    KEY_FIELDS = ("_channel_number",)
+    SCHEMA = (
+        Field("_channel_number"),
+        Field("_success"),
+        Field("_channel_status"),
+    )
 
 class ReadStatusOfUniversalSwitchData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadStatusOfUniversalSwitch
-        self._switch_number = None
+    OPERATE_CODE = OperateCode.ReadStatusOfUniversalSwitch
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_switch_number"),
+    )
 class ReadStatusOfUniversalSwitchResponseData(Telegram):
     # 这个按我的理解好像不太对，应该是跟ReadStatusOfChannelsResponseData结构差不多
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadStatusOfUniversalSwitchResponse
-        self._switch_number = None
-        self._switch_status = None
+    OPERATE_CODE = OperateCode.ReadStatusOfUniversalSwitchResponse
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_switch_number"),
+        Field("_switch_status"),
+    )
+
+    def is_bulk(self, bulk_read=False):
+        # 读取单个开关的应答是(编号, 状态); 批量读取(没有文档, 需要用universal_switch_bulk_read打开)
+        # 的应答假定是开关数加每个开关的状态
+        return bulk_read and len(self._payload) != 2
+
+    def get_switch_statuses(self, bulk_read=False):
+        """ 开关编号 -> 状态, bulk_read为False时总是按单个开关的应答解析 """
+        if not self.is_bulk(bulk_read):
+            return {self._switch_number: self._switch_status}
+        payload = self._payload
+        count = min(payload[0], len(payload) - 1) if len(payload) else 0
+        return {number: payload[number] for number in range(1, count + 1)}
 
 class UniversalSwitchControlData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.UniversalSwitchControl
-        self._switch_number = None
-        self._switch_status = None
+    OPERATE_CODE = OperateCode.UniversalSwitchControl
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_switch_number"),
+        Field("_switch_status"),
+    )
 class UniversalSwitchControlResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.UniversalSwitchControlResponse
-        self._switch_number = None
-        self._switch_status = None
+    OPERATE_CODE = OperateCode.UniversalSwitchControlResponse
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_switch_number"),
+        Field("_switch_status"),
+    )
 
 class SceneControlData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.SceneControl
-        self._area_number = None
-        self._scene_number = None
+    OPERATE_CODE = OperateCode.SceneControl
+    SCHEMA = (
+        Field("_area_number"),
+        Field("_scene_number"),
+    )
 class SceneControlResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.SceneControlResponse
+    OPERATE_CODE = OperateCode.SceneControlResponse
         
 class ReadSensorStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadSensorStatus
+    OPERATE_CODE = OperateCode.ReadSensorStatus
 class ReadSensorStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadSensorStatusResponse
-        self._success = None
-        self._current_temperature = None
-        self._brightness_high = None
-        self._brightness_low = None
-        self._motion_sensor = None
-        self._sonic = None
-        self._dry_contact_1_status = None
-        self._dry_contact_2_status = None
+    OPERATE_CODE = OperateCode.ReadSensorStatusResponse
+    SCHEMA = (
+        Field("_success"),
+        Field("_current_temperature"),
+        Field("_brightness_high"),
+        Field("_brightness_low"),
+        Field("_motion_sensor"),
+        Field("_sonic"),
+        Field("_dry_contact_1_status"),
+        Field("_dry_contact_2_status"),
+    )
 
 class ReadSensorsInOneStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadSensorsInOneStatus
+    OPERATE_CODE = OperateCode.ReadSensorsInOneStatus
 class ReadSensorsInOneStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadSensorsInOneStatusResponse
-        self._bit_0 = None
-        self._current_temperature = None
-        self._bit_2 = None
-        self._bit_3 = None
-        self._bit_4 = None
-        self._bit_5 = None
-        self._bit_6 = None
-        self._motion_sensor = None
-        self._dry_contact_1_status = None
-        self._dry_contact_2_status = None
+    OPERATE_CODE = OperateCode.ReadSensorsInOneStatusResponse
+    SCHEMA = (
+        Field("_bit_0"),
+        Field("_current_temperature"),
+        Field("_bit_2"),
+        Field("_bit_3"),
+        Field("_bit_4"),
+        Field("_bit_5"),
+        Field("_bit_6"),
+        Field("_motion_sensor"),
+        Field("_dry_contact_1_status"),
+        Field("_dry_contact_2_status"),
+    )
 
 class ReadDryContactStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadDryContactStatus
-        self._switch_number = None
+    OPERATE_CODE = OperateCode.ReadDryContactStatus
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_switch_number"),
+    )
 class ReadDryContactStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadDryContactStatusResponse
-        self._bit_0 = None
-        self._switch_number = None
-        self._switch_status = None
+    OPERATE_CODE = OperateCode.ReadDryContactStatusResponse
+    KEY_FIELDS = ("_switch_number",)
+    SCHEMA = (
+        Field("_bit_0"),
+        Field("_switch_number"),
+        Field("_switch_status"),
+    )
 
 class BroadcastSensorStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.BroadcastSensorStatusResponse
-        self._current_temperature = None
-        self._brightness_high = None
-        self._brightness_low = None
-        self._motion_sensor = None
-        self._sonic = None
-        self._dry_contact_1_status = None
-        self._dry_contact_2_status = None
+    OPERATE_CODE = OperateCode.BroadcastSensorStatusResponse
+    SCHEMA = (
+        Field("_current_temperature"),
+        Field("_brightness_high"),
+        Field("_brightness_low"),
+        Field("_motion_sensor"),
+        Field("_sonic"),
+        Field("_dry_contact_1_status"),
+        Field("_dry_contact_2_status"),
+    )
 class BroadcastSensorStatusAutoResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.BroadcastSensorStatusAutoResponse
-        self._current_temperature = None
-        self._brightness_high = None
-        self._brightness_low = None
-        self._motion_sensor = None
-        self._sonic = None
-        self._dry_contact_1_status = None
-        self._dry_contact_2_status = None
+    OPERATE_CODE = OperateCode.BroadcastSensorStatusAutoResponse
+    SCHEMA = (
+        Field("_current_temperature"),
+        Field("_brightness_high"),
+        Field("_brightness_low"),
+        Field("_motion_sensor"),
+        Field("_sonic"),
+        Field("_dry_contact_1_status"),
+        Field("_dry_contact_2_status"),
+    )
 class BroadcastTemperatureResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.BroadcastTemperatureResponse
-        self._bit_0 = None
-        self._current_temperature = None
+    OPERATE_CODE = OperateCode.BroadcastTemperatureResponse
+    SCHEMA = (
+        Field("_bit_0"),
+        Field("_current_temperature"),
+    )
 class BroadcastStatusOfUniversalSwitchData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.BroadcastStatusOfUniversalSwitch
-        self._switch_count = None
+    OPERATE_CODE = OperateCode.BroadcastStatusOfUniversalSwitch
+    SCHEMA = (
+        Field("_switch_count"),
+    )
     def get_switch_status(self, number):
-        return self._payload[number] if number<self._switch_count else None
+        # payload[0]是开关数, 之后依次是第1..N个开关的状态
+        return self._payload[number] if 0 < number <= self._switch_count else None
 
 class ReadFloorHeatingStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadFloorHeatingStatus
+    OPERATE_CODE = OperateCode.ReadFloorHeatingStatus
 class ReadFloorHeatingStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadFloorHeatingStatusResponse
-        self._temperature_type = None # 0 = C, 1 = F
-        self._temperature = None
-        self._status = None # 0 = OFF, 1 = ON
-        self._mode = None # 1 = Normal, 2 = Day , 3 = Night, 4 = Away, 5 = Timer
-        self._normal_temperature = None
-        self._day_temperature = None
-        self._night_temperature = None
-        self._away_temperature = None
+    OPERATE_CODE = OperateCode.ReadFloorHeatingStatusResponse
+    SCHEMA = (
+        Field("_temperature_type"), # 0 = C, 1 = F
+        Field("_temperature"),
+        Field("_status"), # 0 = OFF, 1 = ON
+        Field("_mode"), # 1 = Normal, 2 = Day , 3 = Night, 4 = Away, 5 = Timer
+        Field("_normal_temperature"),
+        Field("_day_temperature"),
+        Field("_night_temperature"),
+        Field("_away_temperature"),
+    )
+class ControlFloorHeatingData(Telegram):
+    # 与ControlFloorHeatingResponseData的结构相同
+    OPERATE_CODE = OperateCode.ControlFloorHeating
+    KEY_FIELDS = ("_number",)
+    SCHEMA = (
+        Field("_number"),
+        Field("_status"),
+        Field("_bit_3", default=0),
+        Field("_mode"),
+        Field("_temperature_normal"),
+        Field("_temperature_day"),
+        Field("_temperature_night"),
+        Field("_temperature_away"),
+        Field("_bit_9", default=0),
+        Field("_temperature"),
+    )
 class ControlFloorHeatingResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ControlFloorHeatingResponse
-        self._number = None
-        self._status = None
-        self._bit_3 = None
-        self._mode = None
-        self._temperature_normal = None
-        self._temperature_day = None
-        self._temperature_night = None
-        self._temperature_away = None
-        self._bit_9 = None
-        self._temperature = None
+    OPERATE_CODE = OperateCode.ControlFloorHeatingResponse
+    KEY_FIELDS = ("_number",)
+    SCHEMA = (
+        Field("_number"),
+        Field("_status"),
+        Field("_bit_3"),
+        Field("_mode"),
+        Field("_temperature_normal"),
+        Field("_temperature_day"),
+        Field("_temperature_night"),
+        Field("_temperature_away"),
+        Field("_bit_9"),
+        Field("_temperature"),
+    )
 
 class ReadAirConditionStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadAirConditionStatus
-        self._ac_number = None
+    OPERATE_CODE = OperateCode.ReadAirConditionStatus
+    KEY_FIELDS = ("_ac_number",)
+    SCHEMA = (
+        Field("_ac_number"),
+    )
 class ReadAirConditionStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadAirConditionStatusResponse
-        self._ac_number = None
-        self._temperature_type = None # 0-C, 1-F
-        self._current_temperature = None
-        self._cool_temperature = None
-        self._heat_temperature = None
-        self._auto_temperature = None
-        self._dry_temperature = None
-        self._bit_7 = None
-        self._status = None # 0-OFF, 1-ON
-        self._mode = None # 0-COOL, 1-Heat, 2-FAN, 3-Auto, 4-Dry
-        self._fan = None # 0-Auto, 1-High, 2-Medium, 3-Low
-        self._set_temperature = None # 不清楚指定的是什么温度
-        self._bit_12 = None # 都是00
+    OPERATE_CODE = OperateCode.ReadAirConditionStatusResponse
+    KEY_FIELDS = ("_ac_number",)
+    SCHEMA = (
+        Field("_ac_number"),
+        Field("_temperature_type"), # 0-C, 1-F
+        Field("_current_temperature"),
+        Field("_cool_temperature"),
+        Field("_heat_temperature"),
+        Field("_auto_temperature"),
+        Field("_dry_temperature"),
+        Field("_bit_7"),
+        Field("_status"), # 0-OFF, 1-ON
+        Field("_mode"), # 0-COOL, 1-Heat, 2-FAN, 3-Auto, 4-Dry
+        Field("_fan"), # 0-Auto, 1-High, 2-Medium, 3-Low
+        Field("_set_temperature"), # 不清楚指定的是什么温度
+        Field("_bit_12"), # 都是00
+    )
 
 class ControlAirConditionData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ControlAirCondition
-        self._ac_number = None
-        self._temperature_type = None
-        self._current_temperature = None
-        self._cool_temperature = None
-        self._heat_temperature = None
-        self._auto_temperature = None
-        self._dry_temperature = None
-        self._bit_7 = 48 # 十六进制30
-        self._status = None
-        self._mode = None
-        self._fan = None
-        self._set_temperature = None
-        self._bit_12 = 0
+    OPERATE_CODE = OperateCode.ControlAirCondition
+    KEY_FIELDS = ("_ac_number",)
+    SCHEMA = (
+        Field("_ac_number"),
+        Field("_temperature_type"),
+        Field("_current_temperature"),
+        Field("_cool_temperature"),
+        Field("_heat_temperature"),
+        Field("_auto_temperature"),
+        Field("_dry_temperature"),
+        Field("_bit_7", default=48), # 十六进制30
+        Field("_status"),
+        Field("_mode"),
+        Field("_fan"),
+        Field("_set_temperature"),
+        Field("_bit_12", default=0),
+    )
 class ControlAirConditionResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ControlAirConditionResponse
-        self._ac_number = None
-        self._temperature_type = None
-        self._current_temperature = None
-        self._cool_temperature = None
-        self._heat_temperature = None
-        self._auto_temperature = None
-        self._dry_temperature = None
-        self._bit_7 = None
-        self._status = None
-        self._mode = None
-        self._fan = None
-        self._set_temperature = None
-        self._bit_12 = None
+    OPERATE_CODE = OperateCode.ControlAirConditionResponse
+    KEY_FIELDS = ("_ac_number",)
+    SCHEMA = (
+        Field("_ac_number"),
+        Field("_temperature_type"),
+        Field("_current_temperature"),
+        Field("_cool_temperature"),
+        Field("_heat_temperature"),
+        Field("_auto_temperature"),
+        Field("_dry_temperature"),
+        Field("_bit_7"),
+        Field("_status"),
+        Field("_mode"),
+        Field("_fan"),
+        Field("_set_temperature"),
+        Field("_bit_12"),
+    )
 
 class ControlDLPStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ControlDLPStatus
-        self._dlp_operate_code = None
-        self._data = None
-        self._number = None
+    OPERATE_CODE = OperateCode.ControlDLPStatus
+    KEY_FIELDS = ("_dlp_operate_code", "_number")
+    SCHEMA = (
+        Field("_dlp_operate_code"),
+        Field("_data"),
+        Field("_number"),
+    )
 class ControlDLPStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ControlDLPStatusResponse
-        self._dlp_operate_code = None
-        self._data = None
-        self._number = None
+    OPERATE_CODE = OperateCode.ControlDLPStatusResponse
+    KEY_FIELDS = ("_dlp_operate_code", "_number")
+    SCHEMA = (
+        Field("_dlp_operate_code"),
+        Field("_data"),
+        Field("_number"),
+    )
 class ReadDLPStatusData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadDLPStatus
-        self._dlp_operate_code = None
-        self._data = None
-        self._number = None
+    OPERATE_CODE = OperateCode.ReadDLPStatus
+    KEY_FIELDS = ("_dlp_operate_code", "_number")
+    SCHEMA = (
+        Field("_dlp_operate_code"),
+        Field("_data"),
+        Field("_number"),
+    )
 class ReadDLPStatusResponseData(Telegram):
-    def __init__(self, device_address):
-        super().__init__(device_address)
-        self.operate_code = OperateCode.ReadDLPStatusResponse
-        self._dlp_operate_code = None
-        self._data = None
-        self._number = None
-        
+    OPERATE_CODE = OperateCode.ReadDLPStatusResponse
+    KEY_FIELDS = ("_dlp_operate_code", "_number")
+    SCHEMA = (
+        Field("_dlp_operate_code"),
+        Field("_data"),
+        Field("_number"),
+    )
@@ -0,0 +1,102 @@
+''' Linux的经典BPF(SO_ATTACH_FILTER)过滤器: 在内核里丢掉不是HDL报文的UDP数据, 不用唤醒事件循环
+
+UDP socket上的过滤器从UDP头开始看数据, 所以HDL报文第N个字节的偏移是8+N;
+源IP通过SKF_NET_OFF(网络层头)读取。检查的内容跟NetworkInterface._build_telegram_data一致:
+最小长度、0xAAAA标记和长度字节, CRC仍然在Python里检查。
+'''
+
+import ctypes
+import ipaddress
+import logging
+import socket
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# 指令编码(linux/filter.h)
+BPF_LD_W_LEN = 0x80     # A = len
+BPF_LDX_W_LEN = 0x81    # X = len
+BPF_LD_W_ABS = 0x20     # A = P[k:4]
+BPF_LD_H_ABS = 0x28     # A = P[k:2]
+BPF_LD_B_ABS = 0x30     # A = P[k:1]
+BPF_ALU_ADD_K = 0x04    # A += k
+BPF_ALU_AND_K = 0x54    # A &= k
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JGE_K = 0x35
+BPF_JMP_JEQ_X = 0x1d
+BPF_RET_K = 0x06
+
+SKF_NET_OFF = -0x100000
+UDP_HEADER_LENGTH = 8
+# 报文头的偏移: 0xAAAA标记在14, 长度字节在16, 长度字节的值 = 报文长度 - 16
+HDL_MARKER_OFFSET = 14
+HDL_LENGTH_OFFSET = 16
+# 没有内容(payload)的报文是27字节, 更短的数据会被_build_telegram_data丢弃
+HDL_MIN_LENGTH = 27
+ACCEPT_LENGTH = 0xFFFF
+
+
+def build_hdl_filter(subnets=None):
+    """ 返回过滤程序: [(code, jt, jf, k), ...]
+
+    subnets是源地址允许的IPv4网段(如"192.168.1.0/24"), 为空时不检查源地址
+    """
+    networks = [ipaddress.IPv4Network(subnet, strict=False) for subnet in subnets or ()]
+
+    # 跳转目标用标签表示, 最后再换算成相对偏移
+    program = [
+        (BPF_LD_W_LEN, None, None, 0),
+        (BPF_JMP_JGE_K, None, "reject", UDP_HEADER_LENGTH + HDL_MIN_LENGTH),
+        (BPF_LD_H_ABS, None, None, UDP_HEADER_LENGTH + HDL_MARKER_OFFSET),
+        (BPF_JMP_JEQ_K, None, "reject", 0xAAAA),
+        (BPF_LD_B_ABS, None, None, UDP_HEADER_LENGTH + HDL_LENGTH_OFFSET),
+        (BPF_ALU_ADD_K, None, None, UDP_HEADER_LENGTH + HDL_LENGTH_OFFSET),
+        (BPF_LDX_W_LEN, None, None, 0),
+        (BPF_JMP_JEQ_X, None, "reject", 0),
+    ]
+    for index, network in enumerate(networks):
+        last = index == len(networks) - 1
+        program.extend([
+            # 源IP在IP头的偏移12
+            (BPF_LD_W_ABS, None, None, (SKF_NET_OFF + 12) & 0xFFFFFFFF),
+            (BPF_ALU_AND_K, None, None, int(network.netmask)),
+            (BPF_JMP_JEQ_K, "accept", "reject" if last else None, int(network.network_address)),
+        ])
+    program.append((BPF_RET_K, None, None, ACCEPT_LENGTH))
+    labels = {"accept": len(program) - 1, "reject": len(program)}
+    program.append((BPF_RET_K, None, None, 0))
+
+    def _offset(position, label):
+        offset = 0 if label is None else labels[label] - position - 1
+        if offset > 0xFF:
+            raise ValueError(f"Too many subnets for the BPF filter: {len(networks)}")
+        return offset
+
+    return [(code, _offset(i, jt), _offset(i, jf), k) for i, (code, jt, jf, k) in enumerate(program)]
+
+
+def attach_hdl_filter(sock, subnets=None):
+    """ 把过滤器加到socket上, 不支持时(非Linux等)返回False, socket照常接收所有数据 """
+    if not sys.platform.startswith("linux"):
+        logger.warning("The BPF filter is only supported on Linux")
+        return False
+
+    program = build_hdl_filter(subnets)
+    instructions = b"".join(struct.pack("HBBI", *instruction) for instruction in program)
+    buffer = ctypes.create_string_buffer(instructions)
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack("HP", len(program), ctypes.addressof(buffer))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    except OSError as ex:
+        logger.warning(f"Could not attach the BPF filter: {ex}")
+        return False
+    return True
+
+
+def detach_filter(sock):
+    sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
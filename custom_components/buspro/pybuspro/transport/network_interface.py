@@ -1,25 +1,38 @@
+import functools
 import logging
+import sys
 import traceback
-from struct import *
 
-from .udp_client import UDPClient
+from .udp_client import UDPClient, RECEIVE_MODE_PROTOCOL
+from .tx_scheduler import TxScheduler, DEFAULT_TELEGRAMS_PER_SECOND, DEFAULT_BYTES_PER_SECOND
 from ..telegram import Telegram
-from ..enums import DeviceType, OperateCode
+from ..enums import DeviceType, OperateCode, SendPriority
+from ..helpers.crc16 import crc16
 
 logger = logging.getLogger(__name__)
 
+# 分发完后只剩批处理本身引用的报文: 报文列表, 循环变量和sys.getrefcount的参数
+_UNRETAINED_REFCOUNT = 3
+
 class NetworkInterface:
-    def __init__(self, gateway_address, local_address, telegram_received_callback, loop=None, protocol="UDP"):
+    def __init__(self, gateway_address, local_address, telegram_received_callback, loop=None, protocol="UDP",
+                 telegrams_per_second=DEFAULT_TELEGRAMS_PER_SECOND, bytes_per_second=DEFAULT_BYTES_PER_SECOND,
+                 connect_gateway=False, bpf_filter=False, bpf_subnets=None, receive_mode=RECEIVE_MODE_PROTOCOL):
         self._gateway_address = gateway_address
         self._local_address = local_address
         self._telegram_received_callback = telegram_received_callback
         self._loop = loop
 
         if protocol=="UDP":
-            self._client = UDPClient(self._gateway_address, self._local_address, self._handle_received_data, self._loop)
+            self._client = UDPClient(self._gateway_address, self._local_address, self._handle_received_data, self._loop,
+                                     connect_gateway=connect_gateway, bpf_filter=bpf_filter, bpf_subnets=bpf_subnets,
+                                     receive_mode=receive_mode, batch_received_callback=self._handle_received_batch,
+                                     batch_decoder=functools.partial(self._decode_batch, detach=True), decoded_batch_callback=self._handle_received_telegrams)
         else:
             logger.erro(f"Unsupported the network protocol: {protocol}")
             raise NotImplemented(f"Not Implemented {protocol} protocol")
+        # 所有发送都经过调度器排队, 控制发往总线的速度
+        self._scheduler = TxScheduler(self._client.send_message, self._loop, telegrams_per_second, bytes_per_second)
 
     def _handle_received_data(self, data, address):
         if self._telegram_received_callback:
@@ -27,6 +40,42 @@ class NetworkInterface:
             if telegram: 
                 self._telegram_received_callback(telegram)
 
+    def _handle_received_batch(self, frames):
+        if self._telegram_received_callback:
+            telegrams = self._decode_batch(frames)
+            self._handle_received_telegrams(telegrams)
+            # 报文的payload直接指向接收缓冲区, 回调返回后缓冲区就会被重用;
+            # 分发后还被引用的报文(如请求的应答)才复制payload, 其它的直接丢弃
+            for telegram in telegrams:
+                if sys.getrefcount(telegram) > _UNRETAINED_REFCOUNT:
+                    telegram.detach_payload()
+
+    def _decode_batch(self, frames, detach=False):
+        # frames中的memoryview指向会被重用的接收缓冲区, 直接在缓冲区上校验和解码, 不复制整个报文;
+        # thread模式下在接收线程中调用(detach=True): 交给事件循环时接收线程已经在重用缓冲区,
+        # 只能复制payload, 也不能访问事件循环中的状态
+        telegrams = []
+        for data, address in frames:
+            if not self._is_hdl_frame(data):
+                continue
+            telegram = self._build_telegram_data(data, address)
+            if telegram:
+                if detach:
+                    telegram.detach_payload()
+                telegrams.append(telegram)
+        return telegrams
+
+    def _handle_received_telegrams(self, telegrams):
+        callback = self._telegram_received_callback
+        if callback:
+            for telegram in telegrams:
+                callback(telegram)
+
+    @staticmethod
+    def _is_hdl_frame(data):
+        """ 只检查报文头的标记和长度, 不检查CRC """
+        return len(data) >= 27 and data[14] == 0xAA and data[15] == 0xAA and data[16] + 16 == len(data)
+
     """
     public methods
     """
@@ -35,13 +84,19 @@ class NetworkInterface:
 
     async def start(self):
         await self._client.start()
+        self._scheduler.start()
 
     async def stop(self):
+        await self._scheduler.stop()
         if self._client:
             await self._client.stop()
             self._client = None
 
-    async def send_telegram(self, telegram):
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    async def send_telegram(self, telegram, priority=SendPriority.Normal):
 
         def _print_message(m):
             return ' '.join([format(x, '02x') for x in m])
@@ -50,7 +105,7 @@ class NetworkInterface:
         message = self._build_send_buffer(telegram)
         logger.debug(f"Send Message: {_print_message(message)}")
         if message and self._client:
-            await self._client.send_message(message)
+            await self._scheduler.send(message, priority)
         else:
             logger.error("Send telegram failed as message build failed or client not started!")
     
@@ -59,15 +114,17 @@ class NetworkInterface:
         def _print_bytes(datas):
             return ' '.join([format(x, '02x') for x in datas])
 
-        logger.debug(f"RECEIVED DATA: {_print_bytes(data)}")
-        if not data or len(data) <= 27:
-            # logger.debug("The received data is none or less then 27, abort!")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"RECEIVED DATA: {_print_bytes(data)}")
+        if not data or len(data) < 27:
+            # logger.debug("The received data is none or less then 27 (header and CRC without payload), abort!")
             return None
 
         try:
             # index = 14 # 从16开始算
             # 验证消息头
-            if data[14: 16 ] != b'\xAA\xAA':
+            if data[14] != 0xAA or data[15] != 0xAA:
                 # logger.debug("The telegarm check failed!")
                 return None
             # index += 2 # 16
@@ -76,26 +133,25 @@ class NetworkInterface:
             if length_package + 16 != len(data):
                 logger.debug(f"The data length {len(data)} not match the package length {length_package}")
                 return None
-            # CRC校验
-            crc = data[-2:]
-            crc_bufer = data[16:-2]
-            crc_computed = pack(">H", self._crc16(crc_bufer))
-            if crc_computed != crc:
+            # CRC校验, 不复制数据
+            view = memoryview(data)
+            if crc16(view[16:-2]) != (data[-2] << 8 | data[-1]):
                 logger.debug('CRC check failed!')
                 return None
 
-            # 获取各字段
+            # 获取报文头各字段, payload中的字段在使用时才解码
             # index += 1 # 17
-            telegram = Telegram()      
-            telegram.source_address = (data[17], data[18]) 
-            telegram.source_device_type = DeviceType.value_of(data[19: 21])
-            telegram.operate_code = OperateCode.value_of(data[21: 23])
-            telegram.target_address = (data[23], data[24])
-            telegram.payload = list(data[25:-2])
-            telegram.crc = crc
+            telegram = Telegram.from_header(
+                (data[17], data[18]),
+                DeviceType.value_of_word(data[19] << 8 | data[20]),
+                OperateCode.value_of_word(data[21] << 8 | data[22]),
+                (data[23], data[24]),
+                view[25:-2],
+                bytes(view[-2:]))
             # telegram.udp_address = address
             
-            logger.debug(f"RECEIVED TELEGRAM: Source={telegram.source_address}, Target={telegram.target_address}, Operate={telegram.operate_code}, type={telegram.source_device_type}")
+            if debug:
+                logger.debug(f"RECEIVED TELEGRAM: Source={telegram.source_address}, Target={telegram.target_address}, Operate={telegram.operate_code}, type={telegram.source_device_type}")
             return telegram
             
         except Exception as e:
@@ -134,27 +190,7 @@ class NetworkInterface:
         # 消息内容
         send_buf.extend(telegram.payload)
         # CRC校验
-        crc = self._crc16(bytes(send_buf[16:])) #从长度开始的内容
-        crc0, crc1 = pack(">H", crc)
-        send_buf.extend((crc0,crc1))
+        crc = crc16(send_buf[16:]) #从长度开始的内容
+        send_buf.extend(crc.to_bytes(2, "big"))
 
         return send_buf
-
-    def _crc16(self, data: bytes):
-        xor_in = 0x0000  # initial value
-        xor_out = 0x0000  # final XOR value
-        poly = 0x1021  # generator polinom (normal form)
-    
-        reg = xor_in
-        for octet in data:
-            # reflect in
-            for i in range(8):
-                topbit = reg & 0x8000
-                if octet & (0x80 >> i):
-                    topbit ^= 0x8000
-                reg <<= 1
-                if topbit:
-                    reg ^= poly
-            reg &= 0xFFFF
-            # reflect out
-        return reg ^ xor_out
\ No newline at end of file
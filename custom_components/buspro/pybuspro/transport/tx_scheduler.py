@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from ..enums import SendPriority
+
+logger = logging.getLogger(__name__)
+
+# 总线为9600波特, 约960字节/秒, 留一些余量给其它面板和模块
+DEFAULT_BYTES_PER_SECOND = 700
+DEFAULT_TELEGRAMS_PER_SECOND = None
+# 令牌桶的容量, 按多少秒的发送量计算, 允许短时间的突发
+DEFAULT_BURST_SECONDS = 0.25
+# 报文前面的IP和HDLMIRACLE不会发送到总线上
+BUS_HEADER_OFFSET = 14
+
+
+class TokenBucket:
+    """ 令牌桶: 每秒补充rate个令牌, 最多保存capacity个 """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount, now):
+        """ 还需要等待多少秒才有足够的令牌 """
+        self._refill(now)
+        # 超过容量的报文等桶满就可以发送, 否则永远等不到
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0
+        return (amount - self._tokens) / self.rate
+
+    def consume(self, amount):
+        self._tokens -= amount
+
+
+class TxScheduler:
+    """ 发送调度: 按优先级排队, 并按总线的带宽(报文数/秒, 字节数/秒)控制发送速度
+
+    同一优先级按先进先出发送; 发送时总是先发送当前优先级最高的报文
+    """
+    def __init__(self, send_message, loop=None, telegrams_per_second=DEFAULT_TELEGRAMS_PER_SECOND,
+                 bytes_per_second=DEFAULT_BYTES_PER_SECOND, burst_seconds=DEFAULT_BURST_SECONDS):
+        self._send_message = send_message
+        self._loop = loop or asyncio.get_event_loop()
+        self._buckets = []
+        if telegrams_per_second:
+            self._buckets.append((TokenBucket(telegrams_per_second, telegrams_per_second * burst_seconds), False))
+        if bytes_per_second:
+            self._buckets.append((TokenBucket(bytes_per_second, bytes_per_second * burst_seconds), True))
+
+        # (优先级, 序号, 入队时间, 报文, future)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        self._sent = 0
+        self._max_depth = 0
+        self._last_wait = 0
+        self._max_wait = 0
+        self._total_wait = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, _, _, future in self._queue:
+            if not future.done():
+                future.cancel()
+        self._queue = []
+
+    def send(self, message, priority=SendPriority.Normal):
+        """ 报文入队, 返回在报文真正发送后完成的future """
+        future = self._loop.create_future()
+        heapq.heappush(self._queue, (priority.value, next(self._sequence), time.monotonic(), message, future))
+        self._max_depth = max(self._max_depth, len(self._queue))
+        self._wakeup.set()
+        return future
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def statistics(self):
+        depth = {priority.name: 0 for priority in SendPriority}
+        for entry in self._queue:
+            depth[SendPriority.value_of(entry[0]).name] += 1
+        return {
+            "queue_depth": len(self._queue),
+            "queue_depth_by_priority": depth,
+            "max_queue_depth": self._max_depth,
+            "sent": self._sent,
+            "last_wait": self._last_wait,
+            "max_wait": self._max_wait,
+            "average_wait": self._total_wait / self._sent if self._sent else 0,
+        }
+
+    def _delay(self, message, now):
+        delay = 0
+        for bucket, by_bytes in self._buckets:
+            delay = max(delay, bucket.delay(self._cost(message, by_bytes), now))
+        return delay
+
+    @staticmethod
+    def _cost(message, by_bytes):
+        return len(message) - BUS_HEADER_OFFSET if by_bytes else 1
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # 等待令牌时不出队, 期间到达的高优先级报文会排到前面
+            delay = self._delay(self._queue[0][3], time.monotonic())
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, enqueued, message, future = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            for bucket, by_bytes in self._buckets:
+                bucket.consume(self._cost(message, by_bytes))
+
+            wait = time.monotonic() - enqueued
+            self._sent += 1
+            self._last_wait = wait
+            self._max_wait = max(self._max_wait, wait)
+            self._total_wait += wait
+            try:
+                await self._send_message(message)
+                if not future.done():
+                    future.set_result(wait)
+            except Exception as exp:
+                logger.error(f"Send message failed: {exp}")
+                if not future.done():
+                    future.set_exception(exp)
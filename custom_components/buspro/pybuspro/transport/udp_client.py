@@ -1,9 +1,31 @@
 import asyncio
+import ipaddress
 import socket
 import logging
+import select
+import threading
+
+from .bpf_filter import attach_hdl_filter
 
 logger = logging.getLogger("buspro.udp_client")
 
+# 网关主机名解析结果的缓存时间(秒), 解析失败后隔RESOLVE_RETRY秒再试
+DEFAULT_RESOLVE_TTL = 300
+RESOLVE_RETRY = 10
+
+# 接收方式: protocol是asyncio的DatagramProtocol, 每个报文一次回调;
+# batch是一次唤醒读完socket中所有报文, 整批交给解码;
+# thread是在单独的线程中接收和解码, 每批报文只调用一次call_soon_threadsafe交给事件循环
+RECEIVE_MODE_PROTOCOL = "protocol"
+RECEIVE_MODE_BATCH = "batch"
+RECEIVE_MODE_THREAD = "thread"
+RECEIVE_MODES = (RECEIVE_MODE_PROTOCOL, RECEIVE_MODE_BATCH, RECEIVE_MODE_THREAD)
+# HDL报文最长16+255字节, 更长的数据会被截断, 之后在长度检查时丢弃
+RECEIVE_BUFFER_SIZE = 512
+RECEIVE_BATCH_SIZE = 64
+# 接收线程阻塞等待的最长时间, 超时后检查是否需要退出
+RECEIVE_THREAD_TIMEOUT = 0.5
+
 class UDPProtocol(asyncio.DatagramProtocol):
     def __init__(self, data_received_callback=None):
         self.transport = None
@@ -22,13 +44,236 @@ class UDPProtocol(asyncio.DatagramProtocol):
     def connection_lost(self, exc):
         logger.info(f'closing transport {exc}')
 
+class BatchReceiver:
+    """ 代替DatagramTransport: socket可读时用recvfrom_into读到预先分配的缓冲区中, 直到读完或缓冲区用完
+
+    batch_received_callback(frames)收到[(memoryview, address), ...], 回调返回后缓冲区就会被重用,
+    需要保留的数据必须在回调中复制。
+    """
+    def __init__(self, sock, loop, batch_received_callback, batch_size=RECEIVE_BATCH_SIZE, buffer_size=RECEIVE_BUFFER_SIZE):
+        self._sock = sock
+        self._loop = loop
+        self._callback = batch_received_callback
+        self._buffers = [memoryview(bytearray(buffer_size)) for _ in range(batch_size)]
+        try:
+            peername = sock.getpeername()
+        except OSError:
+            peername = None
+        self._extra = {"socket": sock, "sockname": sock.getsockname(), "peername": peername}
+        self._loop.add_reader(sock.fileno(), self._read_ready)
+
+    def get_extra_info(self, name, default=None):
+        return self._extra.get(name, default)
+
+    def _read_ready(self):
+        recvfrom_into = self._sock.recvfrom_into
+        frames = []
+        for buffer in self._buffers:
+            try:
+                size, address = recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exc:
+                logger.warning(f'Error received: {exc}')
+                break
+            frames.append((buffer[:size], address))
+        if frames and self._callback:
+            self._callback(frames)
+
+    def sendto(self, data, addr=None):
+        try:
+            if addr is None:
+                self._sock.send(data)
+            else:
+                self._sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            # UDP发送缓冲区满时直接丢弃, 跟总线上丢包一样由重发处理
+            logger.warning("Socket send buffer is full, message dropped")
+        except OSError as exc:
+            logger.warning(f'Error received: {exc}')
+
+    def close(self):
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+
+class ThreadReceiver:
+    """ 代替DatagramTransport: 在单独的线程中接收并解码, 事件循环只处理解码后的报文
+
+    decode(frames)在接收线程中调用, 参数跟BatchReceiver的回调一样, 返回解码后的报文列表;
+    非空的列表通过一次call_soon_threadsafe交给事件循环中的deliver(telegrams)。
+    发送仍在事件循环中直接调用socket。
+    """
+    def __init__(self, sock, loop, decode, deliver, batch_size=RECEIVE_BATCH_SIZE, buffer_size=RECEIVE_BUFFER_SIZE):
+        self._sock = sock
+        self._loop = loop
+        self._decode = decode
+        self._deliver = deliver
+        self._buffers = [memoryview(bytearray(buffer_size)) for _ in range(batch_size)]
+        try:
+            peername = sock.getpeername()
+        except OSError:
+            peername = None
+        self._extra = {"socket": sock, "sockname": sock.getsockname(), "peername": peername}
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="buspro-receiver", daemon=True)
+        self._thread.start()
+
+    def get_extra_info(self, name, default=None):
+        return self._extra.get(name, default)
+
+    def _receive_batch(self, sock):
+        # socket是非阻塞的: 等到可读后把socket中已有的报文都读出来
+        readable, _, _ = select.select((sock,), (), (), RECEIVE_THREAD_TIMEOUT)
+        frames = []
+        if not readable:
+            return frames
+        recvfrom_into = sock.recvfrom_into
+        for buffer in self._buffers:
+            try:
+                size, address = recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            frames.append((buffer[:size], address))
+        return frames
+
+    def _run(self):
+        sock = self._sock
+        try:
+            while not self._closing.is_set():
+                try:
+                    frames = self._receive_batch(sock)
+                except (OSError, ValueError) as exc:
+                    if self._closing.is_set():
+                        break
+                    logger.warning(f'Error received: {exc}')
+                    continue
+                if not frames or self._closing.is_set():
+                    continue
+
+                try:
+                    telegrams = self._decode(frames)
+                except Exception:
+                    logger.exception("Error decoding received data")
+                    continue
+                if telegrams:
+                    try:
+                        self._loop.call_soon_threadsafe(self._deliver, telegrams)
+                    except RuntimeError:
+                        # 事件循环已经关闭
+                        break
+        finally:
+            sock.close()
+
+    def sendto(self, data, addr=None):
+        sock = self._sock
+        if self._closing.is_set():
+            logger.warning("Could not send message. The receiver is closed.")
+            return
+        try:
+            if addr is None:
+                sock.send(data)
+            else:
+                sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            logger.warning("Socket send buffer is full, message dropped")
+        except OSError as exc:
+            logger.warning(f'Error received: {exc}')
+
+    def close(self):
+        if self._closing.is_set():
+            return
+        self._closing.set()
+        try:
+            # 唤醒阻塞在recvfrom_into中的接收线程, socket由接收线程关闭
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
 class UDPClient:
-    def __init__(self, gateway_address, local_address, data_received_callback, loop):
+    def __init__(self, gateway_address, local_address, data_received_callback, loop,
+                 connect_gateway=False, resolve_ttl=DEFAULT_RESOLVE_TTL, bpf_filter=False, bpf_subnets=None,
+                 receive_mode=RECEIVE_MODE_PROTOCOL, batch_received_callback=None,
+                 batch_decoder=None, decoded_batch_callback=None):
         self._gateway_address = gateway_address
         self._local_address = local_address
         self._data_received_callback = data_received_callback
         self._loop = loop or asyncio.get_event_loop()
         self._transport = None
+        # 网关地址在事件循环外异步解析, 发送时只用缓存的结果, 不会阻塞
+        self._resolve_ttl = resolve_ttl
+        self._resolved_address = None
+        self._resolve_at = None
+        self._resolve_task = None
+        # connect到网关后发送不再传地址, 内核丢弃其它来源的报文;
+        # 网关地址是广播或组播地址时不connect, 否则收不到网关的报文
+        self._connect_gateway = connect_gateway
+        # Linux上在内核里过滤掉不是HDL报文(或不是来自bpf_subnets)的数据
+        self._bpf_filter = bpf_filter
+        self._bpf_subnets = bpf_subnets
+        if receive_mode not in RECEIVE_MODES:
+            raise ValueError(f"Unsupported receive mode: {receive_mode}")
+        self._receive_mode = receive_mode
+        self._batch_received_callback = batch_received_callback
+        # thread模式: batch_decoder在接收线程中解码, decoded_batch_callback在事件循环中处理结果
+        self._batch_decoder = batch_decoder
+        self._decoded_batch_callback = decoded_batch_callback
+
+    @property
+    def gateway_address(self):
+        """ 解析后的网关地址, 还没解析成功时为None """
+        return self._resolved_address
+
+    async def _resolve(self):
+        host, port = self._gateway_address
+        try:
+            ipaddress.ip_address(host)
+            # IP地址不需要解析, 也不需要刷新
+            address, resolve_at = (host, port), None
+        except ValueError:
+            try:
+                infos = await self._loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+                address, resolve_at = infos[0][4], self._loop.time() + self._resolve_ttl
+            except OSError as ex:
+                logger.warning(f"Could not resolve the gateway {host}: {ex}")
+                self._resolve_at = self._loop.time() + RESOLVE_RETRY
+                return
+
+        changed = address != self._resolved_address
+        self._resolved_address = address
+        self._resolve_at = resolve_at
+        if changed:
+            logger.info(f"Gateway {host} resolved to {address[0]}")
+            if self._connect_gateway and self._transport:
+                # 地址变了, 重新connect
+                await self.stop()
+                await self._connect()
+
+    @staticmethod
+    def _is_unicast(address):
+        """ 网关地址是否可以connect: 组播地址, 255.255.255.255和子网广播地址都不行 """
+        ip = ipaddress.ip_address(address[0])
+        if ip.is_multicast or ip == ipaddress.IPv4Address("255.255.255.255"):
+            return False
+        # 是不是子网广播地址要看本机的路由: Linux上没有SO_BROADCAST时connect广播地址会返回EACCES
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect(address)
+        except PermissionError:
+            return False
+        except OSError:
+            # 例如没有到网关的路由, 交给真正的connect处理
+            pass
+        finally:
+            probe.close()
+        return True
+
+    def _call_resolve(self):
+        if self._resolve_task is None or self._resolve_task.done():
+            self._resolve_task = asyncio.ensure_future(self._resolve(), loop=self._loop)
 
     async def _connect(self):
         try:
@@ -44,6 +289,21 @@ class UDPClient:
             sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
             sock.setblocking(False)
             sock.bind(self._local_address)
+            if self._bpf_filter:
+                attach_hdl_filter(sock, self._bpf_subnets)
+            if self._connect_gateway and self._resolved_address:
+                if self._is_unicast(self._resolved_address):
+                    sock.connect(self._resolved_address)
+                else:
+                    logger.warning(f"Gateway address {self._resolved_address[0]} is not unicast, "
+                                   f"connect_gateway is ignored")
+
+            if self._receive_mode == RECEIVE_MODE_BATCH:
+                self._transport = BatchReceiver(sock, self._loop, self._batch_received_callback)
+                return
+            if self._receive_mode == RECEIVE_MODE_THREAD:
+                self._transport = ThreadReceiver(sock, self._loop, self._batch_decoder, self._decoded_batch_callback)
+                return
 
             (transport, _) = await self._loop.create_datagram_endpoint(lambda: protol, sock=sock)
 
@@ -52,16 +312,27 @@ class UDPClient:
             logger.error(f"Could not create UDP endpoint to {self._gateway_address}: {ex}")
 
     async def start(self):
+        await self._resolve()
         await self._connect()
 
     async def stop(self):
+        if self._resolve_task and asyncio.current_task() is not self._resolve_task:
+            self._resolve_task.cancel()
         if self._transport:
             self._transport.close()
             self._transport = None
 
     async def send_message(self, message):
-        if self._transport:
+        if self._resolve_at is not None and self._loop.time() >= self._resolve_at:
+            # 在后台刷新, 刷新完成前继续使用缓存的地址
+            self._call_resolve()
+        if self._resolved_address is None:
+            logger.warning("Could not send message. The gateway address is not resolved.")
+        elif self._transport:
             logger.debug(f"Try to send busp message:\n{message}")
-            self._transport.sendto(message, self._gateway_address)
+            if self._transport.get_extra_info("peername"):
+                self._transport.sendto(message)
+            else:
+                self._transport.sendto(message, self._resolved_address)
         else:
             logger.warn("Could not send message. Transport is None.")
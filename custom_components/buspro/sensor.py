@@ -42,6 +42,12 @@ SENSOR_TYPES = {
     TEMPERATURE,
 }
 
+# 传感器类型 -> 设备上对应的属性名
+SENSOR_FIELDS = {
+    ILLUMINANCE: "_brightness",
+    TEMPERATURE: "_current_temperature",
+}
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_DEVICES):
         vol.All(cv.ensure_list, [
@@ -86,15 +92,26 @@ class BusproSensor(Entity):
         device = device_config[CONF_DEVICE]     
         addrs = self._address.split('.')
         device_address = (int(addrs[0]), int(addrs[1]))
-        self._device = Sensor(self._hass.data[DATA_BUSPRO].hdl, device_address, device=device)
+        module = self._hass.data[DATA_BUSPRO]
+        if module.sidecar:
+            self._device = module.sidecar_device("sensor", device_address, options={"device": device})
+        else:
+            # 同一地址的实体(包括binary_sensor)共用一个设备, 设备类型由传感器设置
+            self._device = Sensor.shared(module.hdl, device_address)
+            self._device.set_device(device)
+            self._device.bind_sensor()
         self.async_register_callbacks()
 
     @callback
     def async_register_callbacks(self):
         """Register callbacks to update hass after device was changed."""
 
-        async def after_update_callback(device):
+        async def after_update_callback(device, changed_fields=None):
             """Call after device was updated."""
+            # 同一个传感器设备上其它类型的值变化时不需要更新
+            field = SENSOR_FIELDS.get(self._sensor_type)
+            if changed_fields and field not in changed_fields:
+                return
             if self._hass is not None:
                 self.async_write_ha_state()
 
@@ -119,7 +136,7 @@ class BusproSensor(Entity):
         if self._device.is_connected:
             if self._sensor_type == TEMPERATURE and self.current_temperature is not None:
                 return True
-            elif self._sensor_type == ILLUMINANCE and self._brightness is not None:
+            elif self._sensor_type == ILLUMINANCE and self._device.brightness is not None:
                 return True
         
         return False
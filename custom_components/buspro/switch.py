@@ -48,7 +48,11 @@ class BusproSwitch(SwitchEntity):
         self._device_key = address
 
         device_address, channel_number = parse_device_address(address)
-        self._device = UniversalSwitch(hass.data[DATA_BUSPRO].hdl, device_address, channel_number)
+        module = hass.data[DATA_BUSPRO]
+        if module.sidecar:
+            self._device = module.sidecar_device("universal_switch", device_address, channel_number)
+        else:
+            self._device = UniversalSwitch(module.hdl, device_address, channel_number)
 
         self.async_register_callbacks()
 
@@ -56,7 +60,7 @@ class BusproSwitch(SwitchEntity):
     def async_register_callbacks(self):
         """Register callbacks to update hass after device was changed."""
 
-        async def after_update_callback(device):
+        async def after_update_callback(device, changed_fields=None):
             """Call after device was updated."""
             await self.async_update_ha_state()
 
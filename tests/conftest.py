@@ -0,0 +1,5 @@
+import os
+import sys
+
+# pybuspro不依赖homeassistant, 直接从custom_components/buspro导入
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "custom_components", "buspro"))
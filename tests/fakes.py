@@ -0,0 +1,35 @@
+import asyncio
+
+from pybuspro.buspro import Buspro
+
+
+class FakeNet:
+    """ 只记录发送的报文, 代替NetworkInterface
+
+    respond(telegram)返回应答报文(或None)时, 应答在下一轮事件循环中交给Buspro
+    """
+    def __init__(self, buspro, respond=None):
+        self.sent = []
+        self._buspro = buspro
+        self._respond = respond
+
+    async def send_telegram(self, telegram, priority=None):
+        self.sent.append(telegram)
+        response = self._respond(telegram) if self._respond else None
+        if response is not None:
+            response.source_address = tuple(telegram.target_address)
+            response.target_address = (253, 254)
+            self._buspro.loop.call_soon(self._buspro._handle_received_telegram, response)
+
+
+def make_buspro(respond=None, **kwargs):
+    """ 在运行中的事件循环里创建Buspro, 发送的报文记录在buspro._net.sent """
+    buspro = Buspro(("127.0.0.1", 6000), ("127.0.0.1", 6000), asyncio.get_running_loop(), **kwargs)
+    buspro._net = FakeNet(buspro, respond)
+    return buspro
+
+
+async def settle(rounds=5):
+    """ 让已经就绪的回调和任务都运行完 """
+    for _ in range(rounds):
+        await asyncio.sleep(0)
@@ -0,0 +1,59 @@
+import asyncio
+
+from pybuspro.devices import AirCondition
+from pybuspro.enums import DLPOperateCode, OnOffStatus
+from pybuspro.telegram import ControlAirConditionData, ControlDLPStatusData, ReadAirConditionStatusResponseData
+
+from fakes import make_buspro
+
+
+def make_air_condition():
+    device = AirCondition(make_buspro(), (1, 20), 1)
+    device.sent = []
+
+    async def send_command(telegram, wait_response=False):
+        # 在这里编码, 字段没有设置时会报错
+        device.sent.append((telegram, telegram.payload))
+        return None
+
+    async def read_status():
+        pass
+    device._send_command = send_command
+    device._read_status = read_status
+    return device
+
+
+def test_state_from_dlp_only_is_applied_by_dlp():
+    async def main():
+        device = make_air_condition()
+        # 只收到过DLP的应答, 不知道当前温度等字段
+        for operate, value in ((DLPOperateCode.ar_temperature_cool, 24), (DLPOperateCode.ar_temperature_heat, 22),
+                               (DLPOperateCode.ar_temperature_auto, 23), (DLPOperateCode.ar_temperature_dry, 25)):
+            device._update(operate.value, value)
+        assert not device._state_known
+
+        await device.async_apply(status=OnOffStatus.ON)
+        telegram, payload = device.sent[-1]
+        assert isinstance(telegram, ControlDLPStatusData)
+        assert payload == [DLPOperateCode.ar_status.value, OnOffStatus.ON.value, 1]
+
+    asyncio.run(main())
+
+
+def test_known_state_is_applied_with_one_telegram():
+    async def main():
+        device = make_air_condition()
+        status = ReadAirConditionStatusResponseData()
+        status.source_address = (1, 20)
+        status.target_address = (253, 254)
+        status.payload = [1, 0, 26, 24, 22, 23, 25, 0x30, 0, 0, 2, 24, 0]
+        device._air_condition_status_received(status)
+        assert device._state_known
+
+        await device.async_apply(status=OnOffStatus.ON, temperature=21)
+        telegram, payload = device.sent[-1]
+        assert isinstance(telegram, ControlAirConditionData)
+        # 制冷模式下的目标温度同时写入_set_temperature
+        assert payload == [1, 0, 26, 21, 22, 23, 25, 0x30, 1, 0, 2, 21, 0]
+
+    asyncio.run(main())
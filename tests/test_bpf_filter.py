@@ -0,0 +1,131 @@
+import asyncio
+import ipaddress
+import socket
+import sys
+import time
+
+import pytest
+
+from pybuspro.telegram import ReadSensorStatusData, SceneControlData
+from pybuspro.transport import bpf_filter
+from pybuspro.transport.bpf_filter import build_hdl_filter, attach_hdl_filter
+from pybuspro.transport.network_interface import NetworkInterface
+
+NET_OFF = bpf_filter.SKF_NET_OFF & 0xFFFFFFFF
+LOAD_SIZES = {bpf_filter.BPF_LD_W_ABS: 4, bpf_filter.BPF_LD_H_ABS: 2, bpf_filter.BPF_LD_B_ABS: 1}
+
+
+def run_filter(program, datagram, source_ip="192.168.1.10"):
+    """ 解释执行过滤程序(只支持build_hdl_filter用到的指令), 返回接收的字节数, 0表示丢弃 """
+    packet = bytes(bpf_filter.UDP_HEADER_LENGTH) + datagram
+    ip_header = bytes(12) + ipaddress.IPv4Address(source_ip).packed + bytes(4)
+    a = x = pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        if code == bpf_filter.BPF_LD_W_LEN:
+            a = len(packet)
+        elif code == bpf_filter.BPF_LDX_W_LEN:
+            x = len(packet)
+        elif code in LOAD_SIZES:
+            data, offset = (ip_header, k - NET_OFF) if k >= NET_OFF else (packet, k)
+            if offset + LOAD_SIZES[code] > len(data):
+                return 0
+            a = int.from_bytes(data[offset: offset + LOAD_SIZES[code]], "big")
+        elif code == bpf_filter.BPF_ALU_ADD_K:
+            a = (a + k) & 0xFFFFFFFF
+        elif code == bpf_filter.BPF_ALU_AND_K:
+            a &= k
+        elif code == bpf_filter.BPF_JMP_JEQ_K:
+            pc += jt if a == k else jf
+        elif code == bpf_filter.BPF_JMP_JGE_K:
+            pc += jt if a >= k else jf
+        elif code == bpf_filter.BPF_JMP_JEQ_X:
+            pc += jt if a == x else jf
+        elif code == bpf_filter.BPF_RET_K:
+            return k
+        else:
+            raise AssertionError(f"Unexpected instruction {code:#x}")
+
+
+@pytest.fixture
+def net():
+    loop = asyncio.new_event_loop()
+    yield NetworkInterface(("127.0.0.1", 9), ("127.0.0.1", 0), None, loop)
+    loop.close()
+
+
+@pytest.fixture
+def scene_frame(net):
+    scene = SceneControlData((1, 2))
+    scene._area_number = 1
+    scene._scene_number = 2
+    return bytes(net._build_send_buffer(scene))
+
+
+@pytest.fixture
+def empty_frame(net):
+    # 没有payload的读取请求, 27字节
+    return bytes(net._build_send_buffer(ReadSensorStatusData((1, 2))))
+
+
+def test_accepts_hdl_frames(scene_frame, empty_frame):
+    program = build_hdl_filter()
+    assert len(empty_frame) == bpf_filter.HDL_MIN_LENGTH
+    assert run_filter(program, scene_frame) > 0
+    assert run_filter(program, empty_frame) > 0
+
+
+def test_rejects_junk_short_and_malformed_frames(scene_frame):
+    program = build_hdl_filter()
+    assert run_filter(program, b"\x00" * 60) == 0
+    assert run_filter(program, scene_frame[:26]) == 0
+    bad_marker = bytearray(scene_frame)
+    bad_marker[15] = 0xAB
+    assert run_filter(program, bytes(bad_marker)) == 0
+    # 长度字节和数据长度不一致
+    assert run_filter(program, scene_frame + b"\x00") == 0
+    assert run_filter(program, scene_frame[:-1]) == 0
+
+
+def test_source_subnets(scene_frame):
+    program = build_hdl_filter(["192.168.1.0/24", "10.0.0.5/32"])
+    assert run_filter(program, scene_frame, "192.168.1.200") > 0
+    assert run_filter(program, scene_frame, "10.0.0.5") > 0
+    assert run_filter(program, scene_frame, "10.0.0.6") == 0
+    assert run_filter(program, scene_frame, "192.168.2.1") == 0
+    # 没有网段时不检查源地址
+    assert run_filter(build_hdl_filter(), scene_frame, "172.16.0.1") > 0
+
+
+def test_too_many_subnets():
+    with pytest.raises(ValueError):
+        build_hdl_filter([f"10.{i // 256}.{i % 256}.0/24" for i in range(100)])
+
+
+def test_decoder_accepts_empty_payload_frames(net, empty_frame):
+    telegram = net._build_telegram_data(empty_frame)
+    assert telegram is not None
+    assert telegram.target_address == (1, 2)
+    assert net._build_telegram_data(empty_frame[:26]) is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="SO_ATTACH_FILTER is Linux only")
+def test_attached_filter_drops_junk_in_the_kernel(scene_frame):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receiver.bind(("127.0.0.1", 0))
+        if not attach_hdl_filter(receiver, ["127.0.0.0/8"]):
+            pytest.skip("Could not attach the BPF filter")
+        for datagram in (b"junk" * 10, scene_frame[:-1], scene_frame):
+            sender.sendto(datagram, receiver.getsockname())
+        receiver.settimeout(1)
+        assert receiver.recv(1024) == scene_frame
+        receiver.setblocking(False)
+        time.sleep(0.05)
+        with pytest.raises(BlockingIOError):
+            receiver.recv(1024)
+    finally:
+        receiver.close()
+        sender.close()
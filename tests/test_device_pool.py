@@ -0,0 +1,68 @@
+import asyncio
+
+from pybuspro.devices import UniversalSwitch
+from pybuspro.helpers.device_pool import DevicePool
+from pybuspro.telegram import ReadStatusOfUniversalSwitchResponseData
+
+from fakes import make_buspro, settle
+
+
+def test_evicted_devices_are_closed():
+    async def main():
+        buspro = make_buspro()
+        pool = DevicePool(2)
+        for number in (1, 2, 3):
+            pool.get(("universal_switch", (1, 30), number),
+                     lambda: UniversalSwitch(buspro, (1, 30), number, poll=False))
+        assert len(pool) == 2
+        assert ("universal_switch", (1, 30), 1) not in pool
+        group = buspro.get_shared_object(("universal_switch", (1, 30)), lambda: None)
+        assert sorted(group._switches) == [2, 3]
+
+        pool.close()
+        assert len(pool) == 0
+        # 最后一个开关关闭后注销报文处理
+        assert buspro._device_received_telegram_callbacks == {}
+
+    asyncio.run(main())
+
+
+def test_recently_used_device_is_kept():
+    pool = DevicePool(2)
+    closed = []
+
+    class Device:
+        def __init__(self, name):
+            self.name = name
+
+        def close(self):
+            closed.append(self.name)
+
+    pool.get("a", lambda: Device("a"))
+    pool.get("b", lambda: Device("b"))
+    assert pool.get("a", lambda: Device("a2")).name == "a"
+    pool.get("c", lambda: Device("c"))
+    assert closed == ["b"]
+    assert "a" in pool and "c" in pool
+
+
+def answer_switch_read(telegram):
+    response = ReadStatusOfUniversalSwitchResponseData()
+    response.payload = [telegram.payload[0], 0]
+    return response
+
+
+def test_pooled_switches_are_not_polled_or_read():
+    async def main():
+        buspro = make_buspro(respond=answer_switch_read)
+        UniversalSwitch(buspro, (1, 30), 5, poll=False)
+        assert len(buspro._poll_devices) == 0
+
+        # 同一模块上实体使用的开关读取时, 跳过服务调用的开关
+        switch = UniversalSwitch(buspro, (1, 30), 1)
+        assert switch in buspro._poll_devices
+        await switch._group.read_status()
+        await settle()
+        assert [telegram.payload for telegram in buspro._net.sent] == [[1]]
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import asyncio
+
+from pybuspro.devices import FloorHeating
+from pybuspro.enums import DLPOperateCode, OnOffStatus, OperateCode
+from pybuspro.telegram import ControlDLPStatusData, ReadFloorHeatingStatusResponseData
+
+from fakes import make_buspro, settle
+
+
+def status_response(temperature=21):
+    response = ReadFloorHeatingStatusResponseData()
+    response.source_address = (1, 30)
+    response.target_address = (253, 254)
+    response.payload = [0, temperature, 1, 2, 20, 22, 18, 15]
+    return response
+
+
+def test_state_from_dlp_only_is_applied_by_dlp():
+    async def main():
+        buspro = make_buspro()
+        device = FloorHeating(buspro, (1, 30), 1)
+
+        async def read_status():
+            pass
+        device._read_status = read_status
+        # DLP的应答中没有当前温度, ControlFloorHeatingData不能编码
+        for operate, value in ((DLPOperateCode.status, 1), (DLPOperateCode.mode, 1),
+                               (DLPOperateCode.temperature_normal, 20), (DLPOperateCode.temperature_day, 22),
+                               (DLPOperateCode.temperature_night, 18), (DLPOperateCode.temperature_away, 15)):
+            device._update(operate.value, value, 1)
+        assert not device._state_known
+
+        task = asyncio.ensure_future(device.async_apply(status=OnOffStatus.OFF))
+        await settle()
+        task.cancel()
+        telegram = buspro._net.sent[-1]
+        assert isinstance(telegram, ControlDLPStatusData)
+        assert telegram.payload == [DLPOperateCode.status.value, OnOffStatus.OFF.value, 1]
+
+    asyncio.run(main())
+
+
+def test_single_zone_reads_and_applies_the_status_response():
+    async def main():
+        buspro = make_buspro(lambda telegram: status_response()
+                             if telegram.operate_code == OperateCode.ReadFloorHeatingStatus else None)
+        device = FloorHeating(buspro, (1, 30), 1)
+        await device._read_status()
+        await settle()
+        assert [telegram.operate_code for telegram in buspro._net.sent] == [OperateCode.ReadFloorHeatingStatus]
+        assert device.current_temperature == 21
+        assert device._state_known
+
+    asyncio.run(main())
+
+
+def test_multiple_zones_ignore_the_status_response_and_read_by_dlp():
+    async def main():
+        buspro = make_buspro()
+        first = FloorHeating(buspro, (1, 30), 1)
+        second = FloorHeating(buspro, (1, 30), 2)
+        buspro._handle_received_telegram(status_response())
+        await settle()
+        assert first.current_temperature is None
+        assert second.current_temperature is None
+
+        task = asyncio.ensure_future(first._read_status())
+        await settle()
+        task.cancel()
+        codes = {telegram.operate_code for telegram in buspro._net.sent}
+        assert OperateCode.ReadFloorHeatingStatus not in codes
+        assert OperateCode.ReadDLPStatus in codes
+
+        # 只剩一个地暖时又可以使用这个应答
+        second.close()
+        buspro._handle_received_telegram(status_response(23))
+        await settle()
+        assert first.current_temperature == 23
+
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from pybuspro.telegram import SceneControlData
+from pybuspro.transport.network_interface import NetworkInterface
+
+
+def scene_frame(net, scene_number):
+    scene = SceneControlData((1, 2))
+    scene._area_number = 1
+    scene._scene_number = scene_number
+    return bytes(net._build_send_buffer(scene))
+
+
+@pytest.fixture
+def received():
+    return []
+
+
+@pytest.fixture
+def net(received):
+    loop = asyncio.new_event_loop()
+    yield NetworkInterface(("127.0.0.1", 9), ("127.0.0.1", 0), received.append, loop)
+    loop.close()
+
+
+def receive_into(buffer, frame):
+    """ 跟BatchReceiver一样把报文读到重用的缓冲区中, 返回指向缓冲区的memoryview """
+    buffer[:len(frame)] = frame
+    return buffer[:len(frame)]
+
+
+def test_batch_decodes_from_the_buffer_and_copies_only_retained_telegrams(net, received):
+    buffer = memoryview(bytearray(512))
+    payload_types = []
+    net._telegram_received_callback = lambda telegram: payload_types.append(type(telegram._payload))
+
+    net._handle_received_batch([(receive_into(buffer, scene_frame(net, 2)), None)])
+    # 分发时payload还是指向缓冲区
+    assert payload_types == [memoryview]
+
+    net._telegram_received_callback = received.append
+    net._handle_received_batch([(receive_into(buffer, scene_frame(net, 3)), None)])
+    # 缓冲区被下一批报文覆盖后, 保留的报文仍然是原来的内容
+    receive_into(buffer, scene_frame(net, 4))
+    assert type(received[0]._payload) is not memoryview
+    assert received[0]._scene_number == 3
+
+
+def test_thread_mode_decoder_copies_the_payload(net):
+    buffer = memoryview(bytearray(512))
+    telegrams = net._client._batch_decoder([(receive_into(buffer, scene_frame(net, 5)), None)])
+    receive_into(buffer, scene_frame(net, 6))
+    assert telegrams[0]._scene_number == 5
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from pybuspro.enums import OperateCode
+from pybuspro.telegram import (SingleChannelControlData, SingleChannelControlResponseData,
+                               ReadStatusOfChannelsData, ReadStatusOfChannelsResponseData)
+
+from fakes import make_buspro, settle
+
+
+def control_request(address, channel):
+    telegram = SingleChannelControlData(address)
+    telegram._channel_number = channel
+    telegram._channel_status = 100
+    telegram._running_time_minutes = 0
+    telegram._running_time_seconds = 0
+    return telegram
+
+
+def control_response(address, channel):
+    telegram = SingleChannelControlResponseData()
+    telegram.source_address = address
+    telegram.target_address = (253, 254)
+    telegram._channel_number = channel
+    telegram._success = 0xF8
+    telegram._channel_status = 100
+    return telegram
+
+
+def test_response_resolves_matching_request():
+    async def main():
+        buspro = make_buspro()
+        future = buspro.request(control_request((1, 74), 3))
+        await asyncio.sleep(0)
+        response = control_response((1, 74), 3)
+        buspro._handle_received_telegram(response)
+        assert await asyncio.wait_for(future, 1) is response
+        assert buspro._pending_requests == {}
+
+    asyncio.run(main())
+
+
+def test_response_must_match_address_and_key_fields():
+    async def main():
+        buspro = make_buspro()
+        future = buspro.request(control_request((1, 74), 3), timeout=0.05)
+        await asyncio.sleep(0)
+        # 其它通道和其它模块的应答不匹配
+        buspro._handle_received_telegram(control_response((1, 74), 4))
+        buspro._handle_received_telegram(control_response((1, 75), 3))
+        assert not future.done()
+        assert await future is None
+
+    asyncio.run(main())
+
+
+def test_request_times_out_with_none():
+    async def main():
+        buspro = make_buspro()
+        started = buspro.loop.time()
+        result = await buspro.request(control_request((1, 74), 1), timeout=0.05)
+        assert result is None
+        assert buspro.loop.time() - started >= 0.05
+        assert buspro._pending_requests == {}
+
+    asyncio.run(main())
+
+
+def test_coalesced_reads_are_sent_once():
+    async def main():
+        buspro = make_buspro()
+        first = buspro.read_telegram(ReadStatusOfChannelsData((1, 74)))
+        second = buspro.read_telegram(ReadStatusOfChannelsData((1, 74)))
+        assert first is second
+        await asyncio.sleep(0)
+        assert len(buspro._net.sent) == 1
+
+        response = ReadStatusOfChannelsResponseData()
+        response.source_address = (1, 74)
+        response.target_address = (253, 254)
+        response.payload = [2, 100, 0]
+        buspro._handle_received_telegram(response)
+        assert (await first).get_status(1) == 100
+
+    asyncio.run(main())
+
+
+def test_all_requests_with_the_same_key_are_resolved():
+    async def main():
+        buspro = make_buspro(send_window=0)
+        first = buspro.request(control_request((1, 74), 3))
+        second = buspro.request(control_request((1, 74), 3))
+        await asyncio.sleep(0)
+        response = control_response((1, 74), 3)
+        buspro._handle_received_telegram(response)
+        assert await first is response
+        assert await second is response
+
+    asyncio.run(main())
+
+
+def test_request_without_response_code_is_rejected():
+    async def main():
+        buspro = make_buspro()
+        with pytest.raises(ValueError):
+            buspro.request(control_response((1, 74), 3))
+        assert OperateCode.SingleChannelControlResponse.response is None
+
+    asyncio.run(main())
+
+
+def test_send_window_is_unbounded_by_default():
+    async def main():
+        buspro = make_buspro()
+        buspro.request(control_request((1, 74), 1))
+        buspro.request(control_request((1, 74), 2))
+        await asyncio.sleep(0)
+        assert len(buspro._net.sent) == 2
+        assert buspro.send_window_statistics is None
+
+    asyncio.run(main())
+
+
+def test_send_window_serializes_requests_to_one_module():
+    async def main():
+        buspro = make_buspro(send_window=1)
+        first = buspro.request(control_request((1, 74), 1))
+        buspro.request(control_request((1, 74), 2))
+        buspro.request(control_request((1, 75), 1))
+        await asyncio.sleep(0)
+        assert [(t.target_address, t._channel_number) for t in buspro._net.sent] == [((1, 74), 1), ((1, 75), 1)]
+        assert buspro.send_window_statistics["by_target"][(1, 74)] == (1, 1)
+
+        # 应答到达后释放名额, 排队的请求才发送
+        buspro._handle_received_telegram(control_response((1, 74), 1))
+        await first
+        await settle()
+        assert len(buspro._net.sent) == 3
+        assert [(t.target_address, t._channel_number) for t in buspro._net.sent][-1] == ((1, 74), 2)
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import asyncio
+
+from pybuspro.helpers.send_window import SendWindow, SendWindows
+
+
+def test_waiters_are_released_in_fifo_order():
+    async def main():
+        loop = asyncio.get_running_loop()
+        windows = SendWindows(1, loop)
+        order = []
+
+        async def request(name):
+            await windows.acquire((1, 74))
+            order.append(name)
+
+        await request("first")
+        tasks = [asyncio.ensure_future(request(name)) for name in ("second", "third", "fourth")]
+        await asyncio.sleep(0)
+        assert order == ["first"]
+        assert windows.statistics()["by_target"][(1, 74)] == (1, 3)
+
+        for expected in (["first", "second"], ["first", "second", "third"], ["first", "second", "third", "fourth"]):
+            windows.release((1, 74))
+            await asyncio.sleep(0)
+            assert order == expected
+        await asyncio.gather(*tasks)
+
+        windows.release((1, 74))
+        # 空闲的窗口被删除
+        assert windows.statistics() == {"size": 1, "in_flight": 0, "waiting": 0, "by_target": {}}
+
+    asyncio.run(main())
+
+
+def test_targets_do_not_block_each_other():
+    async def main():
+        windows = SendWindows(1, asyncio.get_running_loop())
+        await windows.acquire((1, 74))
+        await asyncio.wait_for(windows.acquire((1, 75)), 0.1)
+        statistics = windows.statistics()
+        assert statistics["in_flight"] == 2
+        assert statistics["waiting"] == 0
+
+    asyncio.run(main())
+
+
+def test_window_size_allows_concurrent_requests():
+    async def main():
+        loop = asyncio.get_running_loop()
+        window = SendWindow(2)
+        await window.acquire(loop)
+        await window.acquire(loop)
+        waiter = asyncio.ensure_future(window.acquire(loop))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        window.release()
+        await asyncio.sleep(0)
+        assert waiter.done()
+        assert window.in_flight == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_leak_the_slot():
+    async def main():
+        loop = asyncio.get_running_loop()
+        window = SendWindow(1)
+        await window.acquire(loop)
+        cancelled = asyncio.ensure_future(window.acquire(loop))
+        waiting = asyncio.ensure_future(window.acquire(loop))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        window.release()
+        await asyncio.sleep(0)
+        assert waiting.done() and not waiting.cancelled()
+        window.release()
+        assert window.idle
+
+    asyncio.run(main())
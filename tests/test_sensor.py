@@ -0,0 +1,79 @@
+import asyncio
+
+from pybuspro.devices import Sensor
+from pybuspro.enums import OperateCode
+from pybuspro.telegram import ReadSensorStatusResponseData
+
+from fakes import make_buspro
+
+
+def sent_codes(buspro):
+    return [telegram.operate_code for telegram in buspro._net.sent]
+
+
+def test_shared_sensor_is_one_device_per_address():
+    async def main():
+        buspro = make_buspro()
+        sensor = Sensor.shared(buspro, (1, 40))
+        sensor.set_device("12in1")
+        sensor.bind_sensor()
+        # binary_sensor不指定设备类型, 得到同一个设备
+        binary = Sensor.shared(buspro, [1, 40])
+        binary.bind_dry_contact(2)
+        assert binary is sensor
+        assert sensor._device == "12in1"
+
+    asyncio.run(main())
+
+
+def test_shared_sensor_reads_only_what_is_bound():
+    async def main():
+        buspro = make_buspro()
+        relay = Sensor.shared(buspro, (1, 10))
+        relay.bind_channel(2)
+        assert not relay._sensor_bound
+        assert set(relay._telegram_handlers) == {OperateCode.ReadStatusOfChannelsResponse,
+                                                 OperateCode.SingleChannelControlResponse}
+
+        buspro.read_telegram = lambda telegram: buspro.request(telegram, timeout=0.01, coalesce=True)
+        await relay.read_sensor_status()
+        assert sent_codes(buspro) == [OperateCode.ReadStatusOfChannels]
+
+    asyncio.run(main())
+
+
+def test_device_type_selects_the_status_read():
+    async def main():
+        buspro = make_buspro()
+        sensor = Sensor.shared(buspro, (1, 50))
+        sensor.set_device("dlp")
+        sensor.bind_sensor()
+        buspro.read_telegram = lambda telegram: buspro.request(telegram, timeout=0.01, coalesce=True)
+        await sensor.read_sensor_status()
+        assert sent_codes(buspro) == [OperateCode.ReadFloorHeatingStatus]
+
+    asyncio.run(main())
+
+
+def test_sensor_status_response_is_published():
+    async def main():
+        buspro = make_buspro()
+        sensor = Sensor.shared(buspro, (1, 40))
+        sensor.bind_sensor()
+        updates = []
+
+        async def updated(device, changed_fields=None):
+            updates.append(changed_fields)
+        sensor.register_device_updated_cb(updated)
+
+        response = ReadSensorStatusResponseData()
+        response.source_address = (1, 40)
+        response.target_address = (253, 254)
+        response.payload = [0xF8, 45, 1, 44, 1, 0, 0, 0]
+        buspro._handle_received_telegram(response)
+        await asyncio.sleep(0.01)
+        assert sensor.temperature == 25
+        assert sensor.brightness == 45
+        assert updates and "_current_temperature" in updates[0]
+
+    asyncio.run(main())
@@ -0,0 +1,297 @@
+import ast
+import asyncio
+import os
+import socket
+from pathlib import Path
+
+import pytest
+
+from pybuspro.enums import OperateCode
+from pybuspro.sidecar import (Sidecar, SidecarConfig, SidecarClient, SidecarDevice, GatewaySimulator,
+                              StateTable, start_sidecar_process)
+from pybuspro.sidecar import client as sidecar_client
+from pybuspro.sidecar.kinds import KIND_IDS
+from pybuspro.sidecar.server import NOTIFY_SLOT
+
+_counter = 0
+
+CLIMATE_PLATFORM = Path(__file__).parents[1] / "custom_components" / "buspro" / "climate.py"
+# 只在空调或地暖上使用的属性
+CLIMATE_TYPE_ONLY = {
+    "air_condition": {"preset_mode", "async_set_preset_mode"},
+    "floor_heating": {"fan_mode", "async_set_fan_mode"},
+}
+
+
+def free_ports(count):
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(count)]
+    for sock in sockets:
+        sock.bind(("127.0.0.1", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+async def wait_until(predicate, timeout=3):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("Timed out waiting for the sidecar")
+        await asyncio.sleep(0.01)
+
+
+def run_with_sidecar(test, **buspro_options):
+    """ 在本机启动模拟网关、sidecar(同一进程)和客户端, 执行test(simulator, sidecar, client) """
+    global _counter
+    _counter += 1
+    gateway_port, bus_port, notify_port, command_port = free_ports(4)
+    table_name = f"buspro_test_{os.getpid()}_{_counter}"
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        simulator = GatewaySimulator(("127.0.0.1", gateway_port), ("127.0.0.1", bus_port), loop)
+        config = SidecarConfig(("127.0.0.1", gateway_port), ("127.0.0.1", bus_port), table_name,
+                               ("127.0.0.1", notify_port), ("127.0.0.1", command_port),
+                               buspro_options=buspro_options, state_updater=False)
+        sidecar = Sidecar(config, loop)
+        client = SidecarClient(table_name, ("127.0.0.1", notify_port), ("127.0.0.1", command_port), loop)
+        await simulator.start()
+        await sidecar.start()
+        await client.start()
+        try:
+            await test(simulator, sidecar, client)
+        finally:
+            await client.stop()
+            await sidecar.stop()
+            await simulator.stop()
+
+    asyncio.run(main())
+
+
+def test_light_state_and_commands():
+    async def test(simulator, sidecar, client):
+        module = simulator.add_module((1, 74), channel_count=4)
+        module.channels[0] = 60
+        light = SidecarDevice(client, "light", (1, 74), 1, {"is_dimmable": True})
+        updates = []
+
+        async def updated(device, changed_fields=None):
+            updates.append(device.current_brightness)
+
+        light.register_device_updated_cb(updated)
+        # 不等设备启动时的延迟读取
+        await light.poll()
+        await wait_until(lambda: light.current_brightness == 60)
+        assert light.is_on is True
+        assert light.supports_brightness is True
+        assert light.is_connected
+
+        await light.set_brightness(30)
+        await wait_until(lambda: light.current_brightness == 30)
+        assert module.channels[0] == 30
+        assert client.get_state(("light", 1, 74, 1))["current_brightness"] == 30
+        assert updates[-1] == 30
+
+        await light.set_off()
+        await wait_until(lambda: light.is_on is False)
+        assert module.channels[0] == 0
+
+    run_with_sidecar(test)
+
+
+def test_kinds_on_the_same_channel_get_their_own_slots():
+    async def test(simulator, sidecar, client):
+        module = simulator.add_module((1, 75), channel_count=2)
+        module.channels[1] = 100
+        light = SidecarDevice(client, "light", (1, 75), 2)
+        channel = SidecarDevice(client, "sensor_channel", (1, 75), 2)
+        await light.poll()
+        await channel.poll()
+        await wait_until(lambda: light.current_brightness == 100 and channel.is_on is True)
+        assert light.key != channel.key
+
+    run_with_sidecar(test)
+
+
+def test_sensor_and_numbered_binary_sensors():
+    async def test(simulator, sidecar, client):
+        module = simulator.add_module((1, 50), switch_count=4)
+        module.switches[2] = 1
+        sensor = SidecarDevice(client, "sensor", (1, 50), options={"device": "12in1"})
+        switch = SidecarDevice(client, "sensor_universal_switch", (1, 50), 3)
+        await sensor.poll()
+        await wait_until(lambda: sensor.temperature is not None and switch.is_on is True)
+        # 12in1的温度不减20
+        assert sensor.temperature == 45
+        assert sensor.movement is False
+
+        module.temperature = 48
+        await sensor.read_sensor_status()
+        await wait_until(lambda: sensor.temperature == 48)
+        # 共用一个Sensor设备
+        assert len({id(device) for device, _ in sidecar._devices.values()}) == 1
+
+    run_with_sidecar(test)
+
+
+def test_adding_a_shared_sensor_again_sets_its_device_type():
+    async def test(simulator, sidecar, client):
+        simulator.add_module((1, 51))
+        # binary_sensor不指定设备类型, 之后的sensor指定12in1
+        motion = SidecarDevice(client, "sensor", (1, 51))
+        temperature = SidecarDevice(client, "sensor", (1, 51), options={"device": "12in1"})
+        await temperature.poll()
+        await wait_until(lambda: temperature.temperature is not None)
+        assert temperature.temperature == 45
+        assert motion.temperature == 45
+
+    run_with_sidecar(test)
+
+
+def climate_device_attributes():
+    """ climate.py中用到的self._device.xxx """
+    tree = ast.parse(CLIMATE_PLATFORM.read_text(encoding="utf-8"))
+    return {node.attr for node in ast.walk(tree)
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Attribute)
+            and node.value.attr == "_device" and isinstance(node.value.value, ast.Name)
+            and node.value.value.id == "self"}
+
+
+def test_climate_attributes_before_any_state():
+    async def test(simulator, sidecar, client):
+        attributes = climate_device_attributes()
+        assert "unit_of_measurement" in attributes
+        assert not [name for name in attributes if name.startswith("_")]
+        for kind, skipped in CLIMATE_TYPE_ONLY.items():
+            # 模拟网关上没有这个设备, 也还没有收到过状态
+            device = SidecarDevice(client, kind, (1, 60), 1)
+            for name in attributes - skipped:
+                value = getattr(device, name)
+                if name in device._kind.fields:
+                    assert value is None, name
+            assert device.is_connected
+
+    run_with_sidecar(test)
+
+
+def test_universal_switch_command():
+    async def test(simulator, sidecar, client):
+        module = simulator.add_module((1, 100), switch_count=10)
+        switch = SidecarDevice(client, "universal_switch", (1, 100), 5)
+        await wait_until(lambda: switch.is_on is False)
+        await switch.set_on()
+        await wait_until(lambda: switch.is_on is True)
+        assert module.switches[4] == 1
+
+    run_with_sidecar(test)
+
+
+def test_add_device_again_republishes_the_state():
+    async def test(simulator, sidecar, client):
+        simulator.add_module((1, 74), channel_count=1)
+        light = SidecarDevice(client, "light", (1, 74), 1)
+        await wait_until(lambda: light.current_brightness is not None)
+        device = sidecar._devices[(1, 1, 74, 1)][0]
+
+        # HA重新加载时再次添加, sidecar中仍然是同一个设备, 但会重新通知当前状态
+        notified = []
+        client.register_callback(("light", 1, 74, 1), lambda key, state: notified.append(key))
+        client.add_device("light", (1, 74), 1)
+        await wait_until(lambda: notified)
+        assert notified[0] == ("light", 1, 74, 1)
+        assert len(sidecar._devices) == 1
+        assert sidecar._devices[(1, 1, 74, 1)][0] is device
+
+    run_with_sidecar(test)
+
+
+def test_send_raw_telegram_and_ignore_invalid_commands():
+    async def test(simulator, sidecar, client):
+        client.send_command(("light", 9, 9, 9), "set_on")
+        client.send_command(("light", 9, 9, 9), "close")
+        client.send_telegram((1, 20), OperateCode.SceneControl.value, [3, 5])
+        await wait_until(lambda: any(telegram.operate_code == OperateCode.SceneControl
+                                     for telegram in simulator.received))
+        scene = next(telegram for telegram in simulator.received if telegram.operate_code == OperateCode.SceneControl)
+        assert tuple(scene.target_address) == (1, 20)
+        assert (scene._area_number, scene._scene_number) == (3, 5)
+
+    run_with_sidecar(test)
+
+
+def test_slot_being_written_keeps_the_last_state_and_marks_the_device_unavailable(monkeypatch):
+    monkeypatch.setattr(sidecar_client, "STALE_RETRY_INTERVAL", 0.01)
+
+    async def main():
+        notify_port, command_port = free_ports(2)
+        table = StateTable.create(f"buspro_test_{os.getpid()}_stale", capacity=16)
+        client = SidecarClient(table.name, ("127.0.0.1", notify_port), ("127.0.0.1", command_port))
+        try:
+            key = (KIND_IDS["light"], 1, 74, 1)
+            slot = table.allocate(key)
+            table.write(slot, key, [50])
+            await client.start()
+            light = SidecarDevice(client, "light", (1, 74), 1)
+            assert light.current_brightness == 50 and light.is_connected
+
+            # 写入进程在写入中途停住: 序号一直是奇数
+            seq = int.from_bytes(table._buf[table._offset(slot): table._offset(slot) + 4], "little")
+            table._buf[table._offset(slot): table._offset(slot) + 4] = (seq + 1).to_bytes(4, "little")
+            client.handle_notification(NOTIFY_SLOT.pack(slot))
+            assert light.current_brightness == 50
+            assert not light.is_connected
+            assert client.get_state(("light", 1, 74, 1))["current_brightness"] == 50
+
+            # 写完后重读到新的状态, 不需要新的通知
+            table._buf[table._offset(slot): table._offset(slot) + 4] = seq.to_bytes(4, "little")
+            table.write(slot, key, [70])
+            await wait_until(lambda: light.current_brightness == 70)
+            assert light.is_connected
+        finally:
+            await client.stop()
+            table.close()
+
+    asyncio.run(main())
+
+
+def test_client_start_times_out_without_sidecar():
+    async def main():
+        notify_port, command_port = free_ports(2)
+        client = SidecarClient(f"buspro_missing_{os.getpid()}", ("127.0.0.1", notify_port),
+                               ("127.0.0.1", command_port))
+        with pytest.raises(FileNotFoundError):
+            await client.start(timeout=0.2)
+        assert not client.connected
+
+    asyncio.run(main())
+
+
+def test_sidecar_process():
+    gateway_port, bus_port, notify_port, command_port = free_ports(4)
+    table_name = f"buspro_test_{os.getpid()}_process"
+    config = SidecarConfig(("127.0.0.1", gateway_port), ("127.0.0.1", bus_port), table_name,
+                           ("127.0.0.1", notify_port), ("127.0.0.1", command_port),
+                           devices=[{"kind": "light", "address": [1, 74], "channel": 1}], state_updater=False)
+
+    async def main():
+        simulator = GatewaySimulator(("127.0.0.1", gateway_port), ("127.0.0.1", bus_port))
+        module = simulator.add_module((1, 74), channel_count=1)
+        await simulator.start()
+        process = start_sidecar_process(config)
+        client = SidecarClient(table_name, ("127.0.0.1", notify_port), ("127.0.0.1", command_port))
+        try:
+            await client.start(timeout=20)
+            light = SidecarDevice(client, "light", (1, 74), 1)
+            await light.set_brightness(40)
+            await wait_until(lambda: light.current_brightness == 40, timeout=10)
+            assert module.channels[0] == 40
+        finally:
+            await client.stop()
+            process.terminate()
+            process.join(10)
+            await simulator.stop()
+        # 收到SIGTERM后正常退出
+        assert process.exitcode == 0
+
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import asyncio
+
+from pybuspro.buspro import Buspro, StateUpdater
+from pybuspro.devices.device import Device
+
+
+class CountingBuspro:
+    def __init__(self, loop):
+        self.loop = loop
+        self.syncs = []
+
+    async def sync(self, interval=0):
+        self.syncs.append(self.loop.time())
+        # sync把轮询分散在整个间隔内
+        await asyncio.sleep(interval * 0.8)
+
+
+def test_state_updater_syncs_once_per_interval():
+    async def main():
+        buspro = CountingBuspro(asyncio.get_running_loop())
+        updater = StateUpdater(buspro, sleep=0.05)
+        await updater.start()
+        await asyncio.sleep(0.53)
+        updater.stop()
+        # 第一次在一个间隔之后, 之后每个间隔一次(不是两个间隔)
+        assert 8 <= len(buspro.syncs) <= 10
+        gaps = [b - a for a, b in zip(buspro.syncs, buspro.syncs[1:])]
+        assert all(gap < 0.08 for gap in gaps)
+
+    asyncio.run(main())
+
+
+class PolledDevice(Device):
+    POLL_MAX_AGE = 10
+
+    def __init__(self, buspro):
+        super().__init__(buspro, (1, 74))
+        self.polls = 0
+
+    async def _read_status(self):
+        self.polls += 1
+
+
+def test_sync_polls_only_stale_devices():
+    async def main():
+        buspro = Buspro(("127.0.0.1", 6000), ("127.0.0.1", 6000), asyncio.get_running_loop())
+        buspro._started = True
+        fresh, stale = PolledDevice(buspro), PolledDevice(buspro)
+        fresh._update_fields({"_value": 1})
+        await buspro.sync()
+        await asyncio.sleep(0)
+        assert (fresh.polls, stale.polls) == (0, 1)
+        # 刚轮询过的设备在POLL_MAX_AGE内不再轮询
+        await buspro.sync()
+        await asyncio.sleep(0)
+        assert stale.polls == 1
+        buspro._started = False
+
+    asyncio.run(main())
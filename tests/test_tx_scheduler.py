@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from pybuspro.enums import SendPriority
+from pybuspro.transport.tx_scheduler import TxScheduler, TokenBucket, BUS_HEADER_OFFSET
+
+
+def make_scheduler(sent, **kwargs):
+    async def send_message(message):
+        sent.append(message)
+    kwargs.setdefault("bytes_per_second", None)
+    return TxScheduler(send_message, asyncio.get_running_loop(), **kwargs)
+
+
+def test_higher_priority_first_and_fifo_within_priority():
+    async def main():
+        sent = []
+        scheduler = make_scheduler(sent)
+        futures = [
+            scheduler.send(b"background-1", SendPriority.Background),
+            scheduler.send(b"normal-1", SendPriority.Normal),
+            scheduler.send(b"interactive-1", SendPriority.Interactive),
+            scheduler.send(b"normal-2", SendPriority.Normal),
+            scheduler.send(b"interactive-2", SendPriority.Interactive),
+        ]
+        scheduler.start()
+        await asyncio.wait_for(asyncio.gather(*futures), 1)
+        await scheduler.stop()
+        assert sent == [b"interactive-1", b"interactive-2", b"normal-1", b"normal-2", b"background-1"]
+
+    asyncio.run(main())
+
+
+def test_telegram_rate_is_limited():
+    async def main():
+        sent = []
+        scheduler = make_scheduler(sent, telegrams_per_second=50, burst_seconds=0)
+        scheduler.start()
+        started = time.monotonic()
+        await asyncio.wait_for(asyncio.gather(*(scheduler.send(bytes([i])) for i in range(6))), 2)
+        elapsed = time.monotonic() - started
+        await scheduler.stop()
+        assert len(sent) == 6
+        # 桶里只有一个令牌, 之后每个报文等1/50秒
+        assert elapsed >= 5 / 50 * 0.9
+
+    asyncio.run(main())
+
+
+def test_interactive_overtakes_queued_background_while_waiting_for_tokens():
+    async def main():
+        sent = []
+        scheduler = make_scheduler(sent, telegrams_per_second=20, burst_seconds=0)
+        background = [scheduler.send(b"background", SendPriority.Background) for _ in range(3)]
+        scheduler.start()
+        await asyncio.sleep(0.01)
+        interactive = scheduler.send(b"interactive", SendPriority.Interactive)
+        await asyncio.wait_for(asyncio.gather(interactive, *background), 2)
+        await scheduler.stop()
+        assert sent[1] == b"interactive"
+
+    asyncio.run(main())
+
+
+def test_byte_cost_excludes_the_ip_header():
+    bucket = TokenBucket(rate=100, capacity=100)
+    now = time.monotonic()
+    message = bytes(BUS_HEADER_OFFSET + 50)
+    cost = TxScheduler._cost(message, True)
+    assert cost == 50
+    assert bucket.delay(cost, now) == 0
+    bucket.consume(cost)
+    bucket.consume(cost)
+    assert abs(bucket.delay(cost, now) - 0.5) < 1e-6
+
+
+def test_statistics_and_stop_cancels_queued():
+    async def main():
+        sent = []
+        scheduler = make_scheduler(sent)
+        future = scheduler.send(b"x", SendPriority.Normal)
+        statistics = scheduler.statistics()
+        assert statistics["queue_depth"] == 1
+        assert statistics["queue_depth_by_priority"]["Normal"] == 1
+        await scheduler.stop()
+        assert future.cancelled()
+        assert scheduler.queue_depth == 0
+
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+
+import pytest
+
+from pybuspro.transport.udp_client import UDPClient
+
+
+def connected_peer(gateway_host):
+    async def main():
+        client = UDPClient((gateway_host, 6000), ("127.0.0.1", 0), None, asyncio.get_running_loop(),
+                           connect_gateway=True)
+        await client.start()
+        try:
+            return client._transport.get_extra_info("peername")
+        finally:
+            await client.stop()
+
+    return asyncio.run(main())
+
+
+def test_unicast_gateway_is_connected():
+    assert connected_peer("127.0.0.1") == ("127.0.0.1", 6000)
+
+
+@pytest.mark.parametrize("gateway_host", ["255.255.255.255", "239.1.2.3", "127.255.255.255"])
+def test_broadcast_and_multicast_gateways_are_not_connected(gateway_host, caplog):
+    # 127.255.255.255是lo的子网广播地址
+    with caplog.at_level(logging.WARNING, logger="buspro.udp_client"):
+        assert connected_peer(gateway_host) is None
+    assert "connect_gateway is ignored" in caplog.text
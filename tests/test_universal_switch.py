@@ -0,0 +1,112 @@
+import asyncio
+
+from pybuspro.devices import UniversalSwitch
+from pybuspro.devices import universal_switch
+from pybuspro.enums import OperateCode
+from pybuspro.telegram import ReadStatusOfUniversalSwitchResponseData
+
+from fakes import make_buspro, settle
+
+
+class Module:
+    """ 模拟模块上的通用开关, 可以选择是否回答批量读取 """
+    def __init__(self, statuses, answer_bulk):
+        self.statuses = statuses
+        self.answer_bulk = answer_bulk
+
+    def respond(self, telegram):
+        if telegram.operate_code is not OperateCode.ReadStatusOfUniversalSwitch:
+            return None
+        response = ReadStatusOfUniversalSwitchResponseData()
+        if not telegram.payload:
+            if not self.answer_bulk:
+                return None
+            response.payload = [len(self.statuses)] + self.statuses
+        else:
+            number = telegram.payload[0]
+            response.payload = [number, self.statuses[number - 1]]
+        return response
+
+
+def read_payloads(buspro):
+    return [telegram.payload for telegram in buspro._net.sent]
+
+
+def test_bulk_read_is_not_sent_by_default():
+    async def main():
+        module = Module([1, 0, 1], answer_bulk=True)
+        buspro = make_buspro(respond=module.respond)
+        switches = [UniversalSwitch(buspro, (1, 30), number) for number in (1, 2, 3)]
+        await switches[0]._group.read_status()
+        assert read_payloads(buspro) == [[1], [2], [3]]
+        assert [switch.is_on for switch in switches] == [True, False, True]
+
+    asyncio.run(main())
+
+
+def test_three_byte_response_is_a_single_switch_without_bulk_read():
+    response = ReadStatusOfUniversalSwitchResponseData()
+    response.payload = [2, 1, 0]
+    assert response.get_switch_statuses() == {2: 1}
+    assert response.get_switch_statuses(bulk_read=True) == {1: 1, 2: 0}
+
+
+def test_bulk_read_updates_all_switches():
+    async def main():
+        module = Module([0, 1, 1], answer_bulk=True)
+        buspro = make_buspro(respond=module.respond, universal_switch_bulk_read=True)
+        switches = [UniversalSwitch(buspro, (1, 30), number) for number in (1, 2, 3)]
+        group = switches[0]._group
+        await group.read_status()
+        assert read_payloads(buspro) == [[]]
+        assert [switch.is_on for switch in switches] == [False, True, True]
+        assert group._bulk_supported is True
+
+    asyncio.run(main())
+
+
+def test_unanswered_bulk_read_is_remembered(monkeypatch):
+    monkeypatch.setattr(universal_switch, "READ_TIMEOUT", 0.05)
+
+    async def main():
+        module = Module([1, 1], answer_bulk=False)
+        buspro = make_buspro(respond=module.respond, universal_switch_bulk_read=True)
+        switches = [UniversalSwitch(buspro, (1, 30), number) for number in (1, 2)]
+        group = switches[0]._group
+        await group.read_status()
+        assert read_payloads(buspro) == [[], [1], [2]]
+        assert group._bulk_supported is False
+
+        # 之后只逐个读取
+        buspro._net.sent.clear()
+        for switch in switches:
+            switch._last_fresh = None
+        await group.read_status()
+        assert read_payloads(buspro) == [[1], [2]]
+
+    asyncio.run(main())
+
+
+def test_per_switch_reads_do_not_wait_for_each_other():
+    async def main():
+        # 模块不回答, 所有读取仍然在第一个超时之前发出
+        buspro = make_buspro()
+        switches = [UniversalSwitch(buspro, (1, 30), number) for number in (1, 2, 3)]
+        task = asyncio.ensure_future(switches[0]._group.read_status())
+        await settle()
+        assert read_payloads(buspro) == [[1], [2], [3]]
+        task.cancel()
+
+    asyncio.run(main())
+
+
+def test_per_switch_reads_are_bounded_by_the_send_window():
+    async def main():
+        buspro = make_buspro(send_window=1)
+        switches = [UniversalSwitch(buspro, (1, 30), number) for number in (1, 2, 3)]
+        task = asyncio.ensure_future(switches[0]._group.read_status())
+        await settle()
+        assert read_payloads(buspro) == [[1]]
+        task.cancel()
+
+    asyncio.run(main())